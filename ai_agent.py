@@ -6,14 +6,19 @@ AI Agent - Gemini API інтеграція
 import os
 import re
 import time
+import threading
 import yaml
 import base64
-from google import genai
+import hashlib
 from google.genai import types
 from pathlib import Path
 from dotenv import load_dotenv
 import logging
 
+from gemini_cache import PromptCache
+from gemini_gateway import GeminiGateway, GeminiStreamInterrupted, GeminiUnavailable, is_retryable
+from message_classifier import MessageClassifier
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
@@ -22,15 +27,84 @@ PROMPTS_FILE = Path(__file__).parent / 'prompts.yml'
 
 # Тригери для ескалації (передача оператору)
 
+# Стрімінг відповіді з ранньою відправкою завершених абзаців (generate_response(on_block=...))
+STREAMING_ENABLED = os.getenv('GEMINI_STREAMING', 'false').lower() == 'true'
+
+# Маркери у відповіді AI: блоки [ORDER]...[/ORDER] / [LEAD_READY]...[/LEAD_READY] та інлайн [X] / [X:...]
+_MARKER_BLOCK_RE = re.compile(r'\[(ORDER|LEAD_READY)\].*?\[/\1\]', re.DOTALL)
+_MARKER_RE = re.compile(r'\[/?[A-Z_]+(?::[^\]]*)?\]')
+_OPEN_BLOCK_RE = re.compile(r'\[(ORDER|LEAD_READY)\]')
+
+
+class BlockDispatcher:
+    """
+    Рання відправка відповіді, що ще генерується (стрімінг): завершені абзаци (\n\n —
+    той самий розділювач, що й при звичайній відправці) одразу віддаються в send.
+
+    - Абзаци лише з маркерів ([ORDER]...[/ORDER], [LEAD_READY]...[/LEAD_READY], [PHOTO_REQUEST:...])
+      буферизуються до закриття блоку і пропускаються — їх обробляє звичайний розбір відповіді
+    - Абзац з текстом і маркером зупиняє ранню відправку: решта йде звичайним шляхом, у тому ж порядку
+    - Останній абзац завжди йде звичайним шляхом (до нього ще можуть додатись примітки про фото)
+    """
+
+    def __init__(self, send):
+        """send(text) → bool: відправити блок клієнту."""
+        self._send = send
+        self._buffer = ''
+        self._held = ''
+        self.stopped = False
+        self.sent = []
+        self.started = time.monotonic()
+        self.first_sent_after = None
+
+    def feed(self, text: str):
+        if self.stopped:
+            return
+        self._buffer += text
+        while '\n\n' in self._buffer and not self.stopped:
+            paragraph, self._buffer = self._buffer.split('\n\n', 1)
+            self._paragraph(paragraph)
+
+    def _paragraph(self, paragraph: str):
+        if self._held:
+            paragraph = f"{self._held}\n\n{paragraph}"
+        if len(_OPEN_BLOCK_RE.findall(paragraph)) > len(_MARKER_BLOCK_RE.findall(paragraph)) \
+                or paragraph.count('[') > paragraph.count(']'):
+            self._held = paragraph  # блок маркера ще не закрився
+            return
+        self._held = ''
+        text = paragraph.strip()
+        rest = _MARKER_RE.sub('', _MARKER_BLOCK_RE.sub('', text)).strip()
+        if not rest:
+            return
+        if rest != text or not self._send(text):
+            self.stopped = True
+            return
+        if self.first_sent_after is None:
+            self.first_sent_after = time.monotonic() - self.started
+        self.sent.append(text)
+
 
 class AIAgent:
     def __init__(self, db):
         self.db = db
-        self.client = genai.Client(
-            api_key=os.getenv('GEMINI_API_KEY')
-        )
+        # Усі виклики Gemini — через спільний шлюз (ключі, резервні моделі, ліміти, повтори, статистика)
+        self.gateway = GeminiGateway.shared()
         self.model = os.getenv('GEMINI_MODEL', 'gemini-3-flash-preview')
         self.prompts = self._load_prompts()
+        self.prompts_hash = self._hash_prompts(self.prompts)
+
+        # Явний кеш Gemini для статичної частини промпту (system_prompt + каталог + шаблони/правила)
+        self.prompt_cache = PromptCache()
+
+        # Локальний класифікатор: подяка/"ок" — шаблон, коротке без товару — мала модель
+        self.classifier = MessageClassifier()
+        self.streaming = STREAMING_ENABLED
+
+        # Каталог у промпті: 'full' — весь каталог, 'relevant' — лише релевантні до розмови товари
+        self.catalog_context_mode = os.getenv('CATALOG_CONTEXT_MODE', 'full').strip().lower()
+        self.catalog_top_k = int(os.getenv('CATALOG_TOP_K', '8'))
+        self.catalog_history_turns = int(os.getenv('CATALOG_HISTORY_TURNS', '6'))
 
         # Google Sheets Manager (база знань)
         self.sheets_manager = None
@@ -46,15 +120,26 @@ class AIAgent:
         logger.info(f"AI Agent ініціалізовано, модель: {self.model}")
 
     def _init_google_sheets(self):
-        """Ініціалізація Google Sheets Manager."""
+        """
+        Ініціалізація Google Sheets Manager.
+        Є офлайн-знімок бази знань — стартуємо з ним одразу, а підключення до Google
+        і оновлення йдуть у фоні (старт не залежить від затримок/збоїв Google).
+        """
         try:
             from google_sheets import GoogleSheetsManager
             self.sheets_manager = GoogleSheetsManager()
+            if self.sheets_manager.kb_cache.load_offline():
+                threading.Thread(
+                    target=self._connect_google_sheets_background,
+                    name='google-sheets-connect', daemon=True
+                ).start()
+                return
             if self.sheets_manager.connect():
                 products = self.sheets_manager.get_products()
                 templates = self.sheets_manager.get_templates()
                 rules = self.sheets_manager.get_behavior_rules()
                 logger.info(f"Google Sheets підключено: {len(products)} товарів, {len(templates)} шаблонів, {len(rules)} правил")
+                self._start_sheets_background()
             else:
                 logger.warning("Google Sheets не підключено - буде використано локальні дані")
                 self.sheets_manager = None
@@ -62,6 +147,24 @@ class AIAgent:
             logger.warning(f"Google Sheets недоступний: {e}")
             self.sheets_manager = None
 
+    def _connect_google_sheets_background(self):
+        """Підключення до Google Sheets у фоні (поки що працюємо з офлайн-знімком), з повторами."""
+        delay = 30
+        while not self.sheets_manager.connect():
+            logger.warning(f"Google Sheets не підключено — працюємо з офлайн-знімком, повтор через {delay}с")
+            time.sleep(delay)
+            delay = min(delay * 2, 600)
+        logger.info("Google Sheets підключено (фоново)")
+        self._start_sheets_background()
+
+    def _start_sheets_background(self):
+        # База знань оновлюється у фоні — обробка повідомлень не чекає на Google
+        self.sheets_manager.kb_cache.start_background_refresh()
+        # Drive папки товарів лістуються у фоні — перше фото не чекає на Drive
+        self.sheets_manager.start_drive_sync()
+        # Нові питання записуються в таблицю пакетами у фоні
+        self.sheets_manager.question_queue.start()
+
     def _init_telegram(self):
         """Ініціалізація Telegram Notifier."""
         try:
@@ -88,14 +191,22 @@ class AIAgent:
     def reload_prompts(self):
         """Перезавантаження промптів (без рестарту)."""
         self.prompts = self._load_prompts()
+        self.prompts_hash = self._hash_prompts(self.prompts)
+
+    @staticmethod
+    def _hash_prompts(prompts: dict) -> str:
+        """Хеш system_prompt — частина ключа кешу Gemini (змінився prompts.yml → новий кеш)."""
+        text = (prompts or {}).get('system_prompt', '')
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
 
-    def _build_conversation_context(self, username: str) -> list:
+    def _build_conversation_context(self, username: str, history: list = None) -> list:
         """
         Формування контексту розмови для Gemini.
         Повертає list types.Content у форматі Gemini API.
         """
         # Отримуємо історію розмови з DB
-        history = self.db.get_conversation_history(username, limit=30)
+        if history is None:
+            history = self.db.get_conversation_history(username, limit=30)
 
         messages = []
         for msg in history:
@@ -109,16 +220,48 @@ class AIAgent:
 
         return messages
 
-    def _get_products_context(self) -> str:
-        """Отримати ПОВНИЙ каталог товарів для промпту. AI сама шукає потрібний товар."""
+    def _get_kb_snapshot(self):
+        """Поточний знімок бази знань (один на відповідь — каталог, правила і ключ кешу узгоджені) або None."""
         if self.sheets_manager:
             try:
-                return self.sheets_manager.get_products_context_for_ai()
+                return self.sheets_manager.kb_cache.get()
+            except Exception as e:
+                logger.warning(f"Помилка Google Sheets: {e}")
+        return None
+
+    def _get_products_context(self, user_message: str = None, history: list = None,
+                              message_type: str = 'text', snapshot=None) -> str:
+        """
+        Отримати каталог товарів для промпту. AI сама шукає потрібний товар.
+        CATALOG_CONTEXT_MODE=relevant — лише релевантні до розмови товари + назви решти
+        (тільки для текстових повідомлень: фото/голос/сторіз порівнюються з усім каталогом).
+        """
+        if self.sheets_manager:
+            try:
+                if self.catalog_context_mode == 'relevant' and message_type == 'text' and user_message:
+                    recent = [m['content'] for m in (history or [])[-(self.catalog_history_turns + 1):]]
+                    # Поточне повідомлення вже збережене в історії — не рахуємо його двічі
+                    if recent and recent[-1] == user_message:
+                        recent = recent[:-1]
+                    recent = recent[-self.catalog_history_turns:]
+                    return self.sheets_manager.get_products_context_slice(
+                        user_message, recent, top_k=self.catalog_top_k, snapshot=snapshot
+                    )
+                return self.sheets_manager.get_products_context_for_ai(snapshot=snapshot)
             except Exception as e:
                 logger.warning(f"Помилка Google Sheets: {e}")
 
         return "Каталог товарів недоступний."
 
+    def _get_catalog_index(self):
+        """CatalogIndex поточного знімка (для класифікатора повідомлень) або None."""
+        if self.sheets_manager:
+            try:
+                return self.sheets_manager.get_catalog_index()
+            except Exception as e:
+                logger.warning(f"Помилка Google Sheets: {e}")
+        return None
+
     def _check_behavior_rules(self, message: str) -> dict:
         """Перевірити правила поведінки з Google Sheets. Якщо аркуша немає — повертає None."""
         if self.sheets_manager:
@@ -128,15 +271,15 @@ class AIAgent:
                 pass
         return None
 
-    def _get_sheets_context(self, message: str, username: str = "") -> str:
-        """Отримати додатковий контекст з Google Sheets (шаблони, складні питання, логіка)."""
+    def _get_sheets_static_context(self, snapshot=None) -> str:
+        """Шаблони та правила поведінки — однакові для всіх клієнтів (йдуть у кеш Gemini)."""
         parts = []
         if not self.sheets_manager:
             return ""
 
         # Шаблони відповідей
         try:
-            templates = self.sheets_manager.get_templates()
+            templates = self.sheets_manager.get_templates(snapshot)
             if templates:
                 parts.append("Шаблони відповідей (використовуй якщо підходить):")
                 for name, text in templates.items():
@@ -146,7 +289,7 @@ class AIAgent:
 
         # Логіка поведінки (ситуації + тригери + дії)
         try:
-            rules = self.sheets_manager.get_behavior_rules()
+            rules = self.sheets_manager.get_behavior_rules(snapshot)
             if rules:
                 parts.append("\nПравила поведінки (Логіка):")
                 for rule in rules:
@@ -158,15 +301,59 @@ class AIAgent:
         except Exception:
             pass
 
-        # Складні питання (готові відповіді)
+        return "\n".join(parts)
+
+    def _get_faq_context(self, message: str) -> str:
+        """Готова відповідь зі складних питань для поточного повідомлення (або порожньо)."""
+        if not self.sheets_manager:
+            return ""
         try:
             answer = self.sheets_manager.find_answer_for_question(message)
             if answer:
-                parts.append(f"\nГотова відповідь на це питання: {answer}")
+                return f"\nГотова відповідь на це питання: {answer}"
         except Exception:
             pass
+        return ""
 
-        return "\n".join(parts)
+    def _get_cached_prompt(self, route, static_prompt: str, catalog_in_static: bool,
+                           kb_version: int) -> str | None:
+        """
+        Ім'я cached content Gemini для статичної частини промпту або None.
+        Ключ: хеш prompts.yml + версія знімка, з якого відрендерено static_prompt — кеш
+        перестворюється, лише коли змінились промпти або таблиця. Окремий кеш на кожен
+        ключ/модель маршруту і на варіант префікса (з каталогом / без).
+        """
+        key = (self.prompts_hash, kb_version, catalog_in_static)
+        return self.prompt_cache.get(route.client, route.model, key, lambda: static_prompt,
+                                     client_label=route.label, variant=catalog_in_static)
+
+    @staticmethod
+    def _generation_config(system_instruction: str = None,
+                           cached_content: str = None) -> types.GenerateContentConfig:
+        """Конфіг генерації відповіді (system_instruction або cached_content — не разом)."""
+        return types.GenerateContentConfig(
+            system_instruction=None if cached_content else system_instruction,
+            cached_content=cached_content,
+            max_output_tokens=3072,
+            safety_settings=[
+                types.SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold='BLOCK_NONE'),
+                types.SafetySetting(category='HARM_CATEGORY_HATE_SPEECH', threshold='BLOCK_NONE'),
+                types.SafetySetting(category='HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='BLOCK_NONE'),
+                types.SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT', threshold='BLOCK_NONE'),
+                types.SafetySetting(category='HARM_CATEGORY_CIVIC_INTEGRITY', threshold='BLOCK_NONE'),
+            ]
+        )
+
+    @staticmethod
+    def _with_context_part(messages: list, context: str) -> list:
+        """Додати персональний контекст (ім'я, FAQ, вибірка каталогу) до поточного повідомлення."""
+        if not context:
+            return messages
+        current = messages[-1]
+        return messages[:-1] + [types.Content(
+            role=current.role,
+            parts=list(current.parts) + [types.Part(text=f"[Контекст для відповіді]\n{context}")]
+        )]
 
     def _extract_phone(self, message: str) -> str:
         """Витягнути телефон з повідомлення."""
@@ -410,16 +597,19 @@ class AIAgent:
         try:
             from hugeprofit import HugeProfitCRM
             crm = HugeProfitCRM()
-            # Отримуємо map {назва: pid} з Google Sheets
+            # Індекс {назва: pid} зі знімка каталогу (без запиту до Google Sheets)
             product_id_map = {}
+            price_lookup = None
             if self.sheets_manager:
+                price_lookup = self.sheets_manager.get_order_line_price
                 try:
-                    product_id_map = self.sheets_manager.get_product_id_map()
+                    product_id_map = self.sheets_manager.get_pid_index()
                 except Exception as e:
                     logger.warning(f"HugeProfit: не вдалося отримати product_id_map: {e}")
             if crm.push_order_with_retry(username=username, order_data=order_data,
                                           product_id_map=product_id_map,
-                                          max_retries=3, delays=[5, 10, 15]):
+                                          max_retries=3, delays=[5, 10, 15],
+                                          price_lookup=price_lookup):
                 self.db.update_lead_status(username, 'imported')
                 logger.info(f"Лід {username} → статус 'imported'")
             else:
@@ -485,7 +675,8 @@ class AIAgent:
                 f"ТЕКСТ З ЕКРАНУ:\n{screen_text}\n\n"
                 f"ТЕКСТ З БАЗИ ДАНИХ:\n{db_text}"
             )
-            response = self.client.models.generate_content(
+            response = self.gateway.generate(
+                'text_check',
                 model=self.model,
                 contents=[types.Content(role="user", parts=[types.Part(text=prompt)])],
                 config=types.GenerateContentConfig(max_output_tokens=10),
@@ -515,7 +706,8 @@ class AIAgent:
                           display_name: str = None,
                           message_type: str = 'text',
                           image_data=None,
-                          audio_data=None) -> str:
+                          audio_data=None,
+                          on_block=None) -> str:
         """
         Генерація відповіді від AI.
 
@@ -526,6 +718,9 @@ class AIAgent:
             message_type: 'text', 'image', 'voice', 'story_media', 'story_reply', 'post_share'
             image_data: bytes (одне фото) або list[bytes] (скріншоти сторіз)
             audio_data: bytes (одне аудіо) або list[bytes] (кілька голосових)
+            on_block: send(text) → bool — при GEMINI_STREAMING=true завершені абзаци відповіді
+                      відправляються через нього ще під час генерації (BlockDispatcher);
+                      повернений текст містить і їх — викликач не відправляє їх повторно
 
         Returns:
             Текст відповіді
@@ -534,21 +729,64 @@ class AIAgent:
             # Системний промпт
             system_prompt = self.prompts.get('system_prompt', '')
 
-            # Додаємо ПОВНИЙ каталог товарів (AI сама шукає потрібний товар)
-            products_context = self._get_products_context()
-            system_prompt += f"\n\n{products_context}"
+            # Історія розмови (для промпту і для вибору релевантних товарів)
+            history = self.db.get_conversation_history(username, limit=30)
+
+            # Тривіальні повідомлення — шаблон з prompts.yml без виклику AI або мала модель
+            route = self.classifier.route(user_message, message_type, history, templates=self.prompts,
+                                          catalog=self._get_catalog_index() if message_type == 'text' else None)
+            if route.kind == 'template':
+                logger.info(f"💬 Шаблонна відповідь '{route.template}' для {username} ({route.reason}), без AI")
+                return self.prompts[route.template]
+            small = route.kind == 'small'
+            model = self.classifier.small_model if small else self.model
+            kb_version = 0
+
+            if small:
+                # Мала модель: лише системний промпт (без каталогу і Sheets), без явного кешу
+                products_context, static_sheets_context, faq_context = '', '', ''
+                catalog_in_static = False
+                logger.info(f"💬 Коротке повідомлення від {username} → {model} ({route.reason})")
+            else:
+                # Каталог товарів (AI сама шукає потрібний товар).
+                # Повний каталог однаковий для всіх — іде в кеш; вибірка релевантних — персональна.
+                # Один знімок на відповідь: каталог, шаблони/правила і версія для ключа кешу
+                snapshot = self._get_kb_snapshot()
+                kb_version = snapshot.version if snapshot else 0
+                products_context = self._get_products_context(user_message, history, message_type, snapshot)
+                catalog_in_static = not (self.catalog_context_mode == 'relevant' and message_type == 'text'
+                                         and user_message)
+
+                # Контекст з Google Sheets: шаблони/правила (статичні) + готова відповідь (персональна)
+                static_sheets_context = self._get_sheets_static_context(snapshot)
+                faq_context = self._get_faq_context(user_message)
+
+            # Статична частина (кешується в Gemini) і персональна (йде з кожним запитом)
+            static_prompt = system_prompt
+            dynamic_parts = []
+            if catalog_in_static:
+                static_prompt += f"\n\n{products_context}"
+            elif products_context:
+                dynamic_parts.append(products_context)
+            if static_sheets_context:
+                static_prompt += f"\n\n{static_sheets_context}"
+            if faq_context:
+                dynamic_parts.append(faq_context.strip())
+            if display_name:
+                dynamic_parts.append(f"Ім'я клієнта: {display_name}")
+            dynamic_context = "\n\n".join(dynamic_parts)
 
-            # Додаємо контекст з Google Sheets (шаблони, складні питання)
-            sheets_context = self._get_sheets_context(user_message, username=username)
+            # Повний промпт без кешу (порядок як раніше: промпт, каталог, Sheets, ім'я)
+            if products_context:
+                system_prompt += f"\n\n{products_context}"
+            sheets_context = "\n".join(p for p in (static_sheets_context, faq_context) if p)
             if sheets_context:
                 system_prompt += f"\n\n{sheets_context}"
-
-            # Додаємо ім'я користувача в контекст
             if display_name:
                 system_prompt += f"\n\nІм'я клієнта: {display_name}"
 
             # Формуємо історію розмови
-            messages = self._build_conversation_context(username)
+            messages = self._build_conversation_context(username, history)
 
             # Нормалізуємо audio_data до списку
             audio_list = []
@@ -670,26 +908,51 @@ class AIAgent:
                     )
                 )
 
-            # Викликаємо Gemini API з retry (до 6 спроб при тимчасових помилках)
-            max_retries = 6
+            # Викликаємо Gemini через шлюз (повтори тимчасових помилок — у шлюзі);
+            # тут — лише один повтор без кешу, якщо кеш зник/недійсний
             last_error = None
-            for attempt in range(1, max_retries + 1):
+            use_cache = not small
+            # Кеш промпту належить ключу і моделі — запит будується під маршрут, обраний шлюзом
+            used = {}
+
+            def build(route):
+                cache_name = self._get_cached_prompt(
+                    route, static_prompt, catalog_in_static, kb_version) if use_cache else None
+                used.update(cache_name=cache_name, client=route.client)
+                if cache_name:
+                    return (self._with_context_part(messages, dynamic_context),
+                            self._generation_config(cached_content=cache_name))
+                return messages, self._generation_config(system_instruction=system_prompt)
+
+            def build_only_current(route):
+                contents, config = build(route)
+                return [contents[-1]], config
+
+            stream = on_block is not None and self.streaming
+            while True:
+                used.clear()
                 try:
-                    response = self.client.models.generate_content(
-                        model=self.model,
-                        contents=messages,
-                        config=types.GenerateContentConfig(
-                            system_instruction=system_prompt,
-                            max_output_tokens=3072,
-                            safety_settings=[
-                                types.SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold='BLOCK_NONE'),
-                                types.SafetySetting(category='HARM_CATEGORY_HATE_SPEECH', threshold='BLOCK_NONE'),
-                                types.SafetySetting(category='HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='BLOCK_NONE'),
-                                types.SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT', threshold='BLOCK_NONE'),
-                                types.SafetySetting(category='HARM_CATEGORY_CIVIC_INTEGRITY', threshold='BLOCK_NONE'),
-                            ]
-                        ),
-                    )
+                    if stream:
+                        dispatcher = BlockDispatcher(on_block)
+                        try:
+                            response = self.gateway.generate_stream(
+                                'reply', model=model, on_text=dispatcher.feed, build=build
+                            )
+                        except GeminiStreamInterrupted as interrupted:
+                            if dispatcher.sent:
+                                # Частину вже відправлено — повертаємо саме її (так і збережеться в історії)
+                                logger.warning(f"Стрім відповіді для {username} обірвано: {interrupted}")
+                                return '\n\n'.join(dispatcher.sent)
+                            logger.warning(f"Стрім відповіді обірвано до першого блоку: {interrupted} — без стрімінгу")
+                            stream = False
+                            continue
+                        if dispatcher.first_sent_after is not None:
+                            logger.info(
+                                f"⚡ Перший блок відповіді для {username} відправлено через "
+                                f"{dispatcher.first_sent_after:.2f}с ({len(dispatcher.sent)} блоків під час генерації)"
+                            )
+                    else:
+                        response = self.gateway.generate('reply', model=model, build=build)
 
                     # Отримуємо текст відповіді
                     try:
@@ -697,25 +960,10 @@ class AIAgent:
                     except Exception:
                         assistant_message = None
                     if not assistant_message:
-                        if not getattr(response, 'candidates', None) and attempt == 1:
+                        if not getattr(response, 'candidates', None):
                             # Промпт заблоковано (candidates=[]) — повторюємо БЕЗ історії розмови
                             logger.warning("Gemini заблокував промпт (candidates=[]) — retry без історії")
-                            only_current = [messages[-1]]
-                            retry_resp = self.client.models.generate_content(
-                                model=self.model,
-                                contents=only_current,
-                                config=types.GenerateContentConfig(
-                                    system_instruction=system_prompt,
-                                    max_output_tokens=3072,
-                                    safety_settings=[
-                                        types.SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold='BLOCK_NONE'),
-                                        types.SafetySetting(category='HARM_CATEGORY_HATE_SPEECH', threshold='BLOCK_NONE'),
-                                        types.SafetySetting(category='HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='BLOCK_NONE'),
-                                        types.SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT', threshold='BLOCK_NONE'),
-                                        types.SafetySetting(category='HARM_CATEGORY_CIVIC_INTEGRITY', threshold='BLOCK_NONE'),
-                                    ]
-                                ),
-                                    )
+                            retry_resp = self.gateway.generate('reply', model=model, build=build_only_current)
                             try:
                                 assistant_message = retry_resp.text
                             except Exception:
@@ -740,26 +988,33 @@ class AIAgent:
 
                 except Exception as api_err:
                     last_error = api_err
-                    error_str = str(api_err).lower()
-                    # Retry тільки при тимчасових помилках (429, 500, 503)
-                    is_retryable = any(code in error_str for code in ['429', '500', '503', 'rate limit', 'unavailable', 'overloaded'])
-                    if is_retryable and attempt < max_retries:
-                        wait_sec = attempt * 5  # 5с, 10с
-                        logger.warning(f"⚠️ Gemini API помилка (спроба {attempt}/{max_retries}): {api_err}. Retry через {wait_sec}с...")
-                        time.sleep(wait_sec)
+                    cache_name = used.get('cache_name')
+                    if cache_name and not is_retryable(api_err) and not isinstance(api_err, GeminiUnavailable):
+                        # Кеш зник/недійсний — одразу повторюємо звичайним запитом без кешу
+                        logger.warning(f"⚠️ Gemini помилка з кешем {cache_name}: {api_err}. Retry без кешу...")
+                        self.prompt_cache.invalidate(used['client'], cache_name)
+                        use_cache = False
                         continue
-                    else:
-                        break
+                    break
 
             # Всі спроби вичерпані або не-retryable помилка
             e = last_error
             error_str = str(e).lower()
-            if 'rate limit' in error_str or '429' in error_str:
-                logger.error(f"AI Rate Limit (після {max_retries} спроб): {e}")
+            if isinstance(e, GeminiUnavailable):
+                logger.error(f"AI недоступний: {e}")
+                self._notify_ai_error(
+                    f"🚨 AI FALLBACK для @{username}\n"
+                    f"Помилка: Gemini недоступний (circuit breaker / ліміт)\n"
+                    f"Тип: {message_type}\n"
+                    f"Клієнт отримав fallback-відповідь!\n"
+                    f"Деталі: {e}"
+                )
+            elif 'rate limit' in error_str or '429' in error_str:
+                logger.error(f"AI Rate Limit (після повторів): {e}")
                 self._notify_ai_error(
                     f"🚨 AI FALLBACK для @{username}\n"
                     f"Помилка: Rate Limit\n"
-                    f"Спроб: {attempt}/{max_retries}\n"
+                    f"Спроб: до {self.gateway.max_attempts}\n"
                     f"Тип: {message_type}\n"
                     f"Клієнт отримав fallback-відповідь!\n"
                     f"Деталі: {e}"
@@ -773,10 +1028,10 @@ class AIAgent:
                     f"Деталі: {e}"
                 )
             elif '400' in error_str or '500' in error_str or '503' in error_str:
-                logger.error(f"AI API Error (після {max_retries} спроб): {e}")
+                logger.error(f"AI API Error (після повторів): {e}")
                 self._notify_ai_error(
                     f"🚨 AI FALLBACK для @{username}\n"
-                    f"Помилка: API Error ({attempt} спроб)\n"
+                    f"Помилка: API Error\n"
                     f"Тип: {message_type}\n"
                     f"Клієнт отримав fallback-відповідь!\n"
                     f"Деталі: {e}"
@@ -844,7 +1099,8 @@ class AIAgent:
                 mime = "image/png" if image_data[:4] == b'\x89PNG' else "image/jpeg"
                 parts.append(types.Part(inline_data=types.Blob(mime_type=mime, data=image_data)))
 
-            response = self.client.models.generate_content(
+            response = self.gateway.generate(
+                'clothing',
                 model=self.model,
                 contents=[types.Content(role="user", parts=parts)],
                 config=types.GenerateContentConfig(max_output_tokens=512)
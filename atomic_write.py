@@ -0,0 +1,30 @@
+"""
+Atomic Write - атомарний запис файлів даних (data/*.json, кеш фото).
+
+Запис у тимчасовий файл поруч + os.replace: читач бачить або старий, або новий файл,
+ніколи не обрізаний. Тимчасовий файл унікальний для процесу й потоку — паралельні
+записи того самого файлу не псують один одному .tmp (перемагає останній os.replace).
+"""
+import os
+import json
+import threading
+from pathlib import Path
+
+
+def write_bytes(path, data: bytes):
+    """Атомарно записати байти у path (директорія створюється за потреби)."""
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def write_json(path, data, compact: bool = False):
+    """Атомарно записати JSON (UTF-8, без екранування кирилиці); compact — без пробілів."""
+    separators = (',', ':') if compact else None
+    write_bytes(path, json.dumps(data, ensure_ascii=False, separators=separators).encode('utf-8'))
@@ -0,0 +1,155 @@
+"""
+Burst Debounce - збір серії коротких повідомлень клієнта перед ОДНИМ викликом AI.
+
+Клієнти часто пишуть 3-5 повідомлень поспіль. Замість відповіді на перші 1-2
+(і ще одного повного виклику Gemini на решту) чекаємо, доки клієнт замовкне:
+
+- Вікно тиші адаптується до темпу клієнта: BURST_GAP_FACTOR × типова пауза між його
+  повідомленнями (75-й перцентиль останніх пауз), у межах [BURST_MIN_WINDOW, BURST_MAX_WINDOW]
+- Поки видно індикатор "друкує…" — чекаємо далі
+- Одне повідомлення, що виглядає завершеним (питання / довге речення), — без очікування;
+  завершене останнє повідомлення серії скорочує вікно вдвічі
+- Під час очікування дешево рахуємо бульбашки повідомлень; повністю чат перечитується
+  лише коли їх кількість змінилась
+- Жорстка межа доданої затримки — BURST_MAX_WAIT від першого побаченого повідомлення серії
+- Перше читання чату (час надсилання невідомий) — лише коротка перевірка BURST_MIN_WINDOW:
+  давні повідомлення не чекають повного вікна
+
+Env:
+    BURST_DEBOUNCE   — true/false (за замовчуванням true)
+    BURST_MAX_WAIT   — максимум доданої затримки, с (за замовчуванням 12)
+"""
+import os
+import time
+import logging
+from collections import deque
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+BURST_DEBOUNCE_ENABLED = os.getenv('BURST_DEBOUNCE', 'true').lower() == 'true'
+BURST_MAX_WAIT = float(os.getenv('BURST_MAX_WAIT', '12'))
+BURST_MIN_WINDOW = 2.0
+BURST_MAX_WINDOW = 8.0
+# Вікно для клієнта, про темп якого ще нічого не відомо
+BURST_DEFAULT_WINDOW = 4.0
+BURST_GAP_FACTOR = 1.5
+# Як часто перечитувати чат під час очікування, с
+BURST_POLL_INTERVAL = 1.5
+# Паузи, довші за це, — вже не серія (клієнт повернувся пізніше)
+MAX_BURST_GAP = 60.0
+GAP_HISTORY = 20
+# "Завершене" повідомлення: питання або щонайменше стільки символів
+COMPLETE_MESSAGE_CHARS = 60
+
+
+class ChatCadence:
+    """Темп набору одного клієнта: паузи між його повідомленнями в межах серій."""
+
+    def __init__(self):
+        self.gaps = deque(maxlen=GAP_HISTORY)
+
+    def record(self, gap: float):
+        if 0 < gap <= MAX_BURST_GAP:
+            self.gaps.append(gap)
+
+    def window(self) -> float:
+        if not self.gaps:
+            return BURST_DEFAULT_WINDOW
+        gaps = sorted(self.gaps)
+        typical = gaps[min(int(len(gaps) * 0.75), len(gaps) - 1)]
+        return min(max(BURST_GAP_FACTOR * typical, BURST_MIN_WINDOW), BURST_MAX_WINDOW)
+
+
+class BurstDebouncer:
+    """Адаптивне очікування кінця серії повідомлень, окремо для кожного чату."""
+
+    def __init__(self, enabled: bool = None, max_wait: float = None):
+        self.enabled = BURST_DEBOUNCE_ENABLED if enabled is None else enabled
+        self.max_wait = BURST_MAX_WAIT if max_wait is None else max_wait
+        self._chats: dict = {}
+        self.bursts = 0
+        self.coalesced = 0      # повідомлень, що дочекались у серію (інакше — окремий виклик AI)
+
+    def cadence(self, username: str) -> ChatCadence:
+        return self._chats.setdefault(username, ChatCadence())
+
+    @staticmethod
+    def looks_complete(text: str) -> bool:
+        text = (text or '').strip()
+        return text.endswith('?') or len(text) >= COMPLETE_MESSAGE_CHARS
+
+    def window(self, username: str, last_text: str) -> float:
+        window = self.cadence(username).window()
+        if self.looks_complete(last_text):
+            window /= 2
+        return max(window, BURST_MIN_WINDOW / 2)
+
+    def wait(self, username: str, unanswered: list, read_unanswered: Callable[[], list],
+             is_typing: Callable[[], bool] = None, first_read: bool = False,
+             count_messages: Callable[[], int] = None) -> list:
+        """
+        Дочекатися кінця серії і повернути всі невідповіджені повідомлення.
+
+        Args:
+            unanswered: невідповіджені повідомлення з поточного читання чату
+            read_unanswered: перечитати чат → новий список невідповіджених
+            is_typing: чи видно індикатор набору (опційно)
+            first_read: чат щойно відкрито — час надсилання повідомлень невідомий
+            count_messages: дешевий підрахунок бульбашок у чаті (опційно) — read_unanswered
+                            викликається лише коли він змінився
+        """
+        if not self.enabled or not unanswered:
+            return unanswered
+        if len(unanswered) == 1 and self.looks_complete(unanswered[0].get('content')) \
+                and not (is_typing and is_typing()):
+            return unanswered
+        cadence = self.cadence(username)
+        started = time.monotonic()
+        # Час надходження останнього повідомлення: при повторному опитуванні — щойно,
+        # при першому читанні чату — невідомо (пауза до наступного не рахується в темп)
+        last_arrival = None if first_read else started
+        quiet_since = started
+        window = BURST_MIN_WINDOW if first_read else self.window(username, unanswered[-1].get('content'))
+        initial = len(unanswered)
+        seen_count = count_messages() if count_messages else None
+
+        while True:
+            now = time.monotonic()
+            typing = bool(is_typing and is_typing())
+            if now - started >= self.max_wait:
+                logger.info(f"Burst [{username}]: межа {self.max_wait:.0f}с — відповідаємо")
+                break
+            if now - quiet_since >= window and not typing:
+                break
+            until_quiet = window - (now - quiet_since) if not typing else BURST_POLL_INTERVAL
+            time.sleep(max(min(BURST_POLL_INTERVAL, until_quiet, self.max_wait - (now - started)), 0.1))
+            try:
+                if count_messages:
+                    count = count_messages()
+                    if count == seen_count:
+                        continue
+                    seen_count = count
+                fresh = read_unanswered()
+            except Exception as e:
+                logger.warning(f"Burst [{username}]: не вдалося перечитати чат: {e}")
+                break
+            if len(fresh) > len(unanswered):
+                arrived = time.monotonic()
+                if last_arrival is not None:
+                    cadence.record(arrived - last_arrival)
+                last_arrival = quiet_since = arrived
+                window = self.window(username, fresh[-1].get('content'))
+            if fresh:
+                unanswered = fresh
+
+        extra = len(unanswered) - initial
+        if extra > 0:
+            self.bursts += 1
+            self.coalesced += extra
+        logger.info(
+            f"Burst [{username}]: {len(unanswered)} повідомлень (+{extra} за очікування), "
+            f"чекали {time.monotonic() - started:.1f}с, вікно {window:.1f}с"
+            + (f"; всього зібрано {self.coalesced} у {self.bursts} серіях" if extra > 0 else "")
+        )
+        return unanswered
@@ -267,6 +267,29 @@ class Database:
             # Повертаємо в хронологічному порядку
             return list(reversed(messages))
 
+    def get_recorded_conversations(self, limit_users: int = 200) -> dict:
+        """
+        Останні розмови для офлайн-аналізу (оцінка промпту, звіти).
+        Повертає {username: [{role, content, created_at}, ...]} у хронологічному порядку.
+        """
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT username, role, content, created_at
+                FROM conversations
+                WHERE role IN ('user', 'assistant')
+                  AND username IN (
+                      SELECT username FROM conversations
+                      GROUP BY username
+                      ORDER BY MAX(created_at) DESC
+                      LIMIT %s
+                  )
+                ORDER BY username, created_at
+            """, (limit_users,))
+            conversations = {}
+            for row in cur.fetchall():
+                conversations.setdefault(row['username'], []).append(row)
+            return conversations
+
     def get_user_display_name(self, username: str) -> str:
         """Отримати збережений display_name для username з БД (останній непорожній)."""
         try:
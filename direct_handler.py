@@ -12,6 +12,8 @@ from datetime import datetime
 from dotenv import load_dotenv
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 
+from burst_debounce import BurstDebouncer
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -72,6 +74,12 @@ class DirectHandler:
         self._chat_poll_seconds = int(os.getenv('CHAT_POLL_SECONDS', '10'))
         logger.info(f"Stay-in-chat: {self._chat_stay_seconds}с, опитування кожні {self._chat_poll_seconds}с")
 
+        # Серія повідомлень клієнта → одна відповідь AI (адаптивне очікування кінця серії)
+        self.burst = BurstDebouncer()
+        self._chat_last_read = {}  # {username: monotonic останнього читання чату}
+        if self.burst.enabled:
+            logger.info(f"Burst debounce: увімкнено, максимум +{self.burst.max_wait:.0f}с до відповіді")
+
     def _dismiss_popups(self):
         """Закрити Instagram попапи (сповіщення, cookies тощо) якщо є."""
         try:
@@ -2346,8 +2354,12 @@ class DirectHandler:
             import tempfile
             image_data = None
 
-            # Якщо це Google Drive посилання — завантажуємо через API (надійно)
+            # Якщо це Google Drive посилання — з дискового кешу або через API (надійно)
             if 'drive.google.com' in image_url and self.ai_agent.sheets_manager:
+                cached_path = self.ai_agent.sheets_manager.get_drive_photo_path(image_url)
+                if cached_path:
+                    logger.info(f"Фото з кешу: {cached_path}")
+                    return self.send_photo(cached_path)
                 image_data = self.ai_agent.sheets_manager.download_drive_file(image_url)
                 if not image_data:
                     logger.warning("Drive API не зміг завантажити, пробую через HTTP...")
@@ -2536,7 +2548,8 @@ class DirectHandler:
             True якщо альбом відправлено
         """
         import tempfile
-        tmp_paths = []
+        tmp_paths = []      # тимчасові файли (HTTP) — видаляються після відправки
+        photo_paths = []    # усі фото альбому в порядку URL (кеш + тимчасові)
         try:
             cookies = {c['name']: c['value'] for c in self.driver.context.cookies()}
             headers = {'User-Agent': self.driver.evaluate("() => navigator.userAgent")}
@@ -2545,8 +2558,13 @@ class DirectHandler:
                 try:
                     image_data = None
 
-                    # Drive API якщо це Google Drive посилання
+                    # Дисковий кеш / Drive API якщо це Google Drive посилання
                     if 'drive.google.com' in url and self.ai_agent.sheets_manager:
+                        cached_path = self.ai_agent.sheets_manager.get_drive_photo_path(url)
+                        if cached_path:
+                            logger.info(f"📸 Фото для альбому (кеш): {cached_path} | {url[:80]}")
+                            photo_paths.append(cached_path)
+                            continue
                         image_data = self.ai_agent.sheets_manager.download_drive_file(url)
                         if image_data:
                             logger.info(f"📸 Фото для альбому (Drive API): {len(image_data)} байт | {url[:80]}")
@@ -2567,15 +2585,16 @@ class DirectHandler:
                     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=ext, prefix='ig_album_')
                     tmp.write(image_data)
                     tmp_paths.append(tmp.name)
+                    photo_paths.append(tmp.name)
                     tmp.close()
                 except Exception as e:
                     logger.warning(f"Помилка завантаження фото для альбому: {e}")
 
-            if not tmp_paths:
+            if not photo_paths:
                 logger.error("send_album_from_urls: жодне фото не завантажено")
                 return False
 
-            return self.send_album(tmp_paths)
+            return self.send_album(photo_paths)
 
         finally:
             for p in tmp_paths:
@@ -2639,6 +2658,25 @@ class DirectHandler:
             pass
         return None
 
+    def _is_peer_typing(self) -> bool:
+        """
+        Чи видно у відкритому чаті (div[role='grid']) індикатор набору "друкує…".
+        Best-effort: немає контейнера чату або індикатора — False.
+        """
+        try:
+            return self.driver.locator(
+                "xpath=//div[@role='grid']//*[contains(@aria-label, 'yping') "
+                "or contains(@aria-label, 'друкує') or contains(@aria-label, 'печатает')]"
+            ).count() > 0
+        except Exception:
+            return False
+
+    def _count_message_bubbles(self) -> int:
+        """Дешевий підрахунок текстів і зображень у чаті (без читання тексту/атрибутів)."""
+        return self.driver.locator(
+            "xpath=//div[@role='presentation']//div[@dir='auto'] | //div[@role='grid']//img"
+        ).count()
+
     def _process_opened_chat(self, username: str, display_name: str) -> bool:
         """
         Обробка вже відкритого чату (спільна логіка).
@@ -2677,6 +2715,11 @@ class DirectHandler:
 
             # 1. Читаємо ВСІ повідомлення користувача з екрану
             user_messages = self.get_user_messages(chat_username=username)
+            # Чат щойно відкрито (не опитування stay-in-chat) — час надсилання повідомлень невідомий
+            now_mono = time.monotonic()
+            first_read = now_mono - self._chat_last_read.get(username, 0) > \
+                self._chat_stay_seconds + 2 * self._chat_poll_seconds
+            self._chat_last_read[username] = now_mono
             if not user_messages:
                 logger.info(f"Немає повідомлень від користувача в {username}")
                 return False
@@ -2740,6 +2783,18 @@ class DirectHandler:
                 logger.info(f"Всі повідомлення від {username} вже оброблені (є answer_id)")
                 return False
 
+            # 3.1. Клієнт ще дописує серію — чекаємо кінця (адаптивне вікно тиші, з жорсткою межею),
+            # щоб відповісти на всю серію одним викликом AI
+            unanswered = self.burst.wait(
+                username, unanswered,
+                read_unanswered=lambda: self._filter_unanswered(
+                    self.get_user_messages(chat_username=username), username),
+                is_typing=self._is_peer_typing,
+                first_read=first_read,
+                count_messages=self._count_message_bubbles,
+            )
+            self._chat_last_read[username] = time.monotonic()
+
             logger.info(f"Нових (невідповіджених) повідомлень: {len(unanswered)}")
             for i, msg in enumerate(unanswered, 1):
                 logger.info(f"  📨 {i}. [{msg['message_type']}] '{msg['content'][:80]}'")
@@ -2903,6 +2958,16 @@ class DirectHandler:
             # 6. (Лід створюється тільки при підтвердженні замовлення — в _process_order)
 
             # 7. Генеруємо відповідь через AI (правила поведінки передані в промпт — AI вирішує сам)
+            # При GEMINI_STREAMING=true завершені абзаци без маркерів відправляються ще під час генерації
+            early_sent = []
+
+            def send_early(block: str) -> bool:
+                ok = self.send_message(block)
+                if ok:
+                    early_sent.append(block)
+                    time.sleep(0.8)
+                return ok
+
             self.ai_agent.pending_trigger_response = None
             response = self.ai_agent.generate_response(
                 username=username,
@@ -2910,7 +2975,8 @@ class DirectHandler:
                 display_name=display_name,
                 message_type=message_type,
                 image_data=story_images_list if story_images_list else image_data,
-                audio_data=audio_data_list if audio_data_list else None
+                audio_data=audio_data_list if audio_data_list else None,
+                on_block=send_early
             )
 
             # 9. Перевіряємо ескалацію — AI сама вставляє [ESCALATION] якщо клієнт просить менеджера
@@ -3034,9 +3100,11 @@ class DirectHandler:
                             'is_upsell':   is_upsell,
                         }
                         product_id_map = {}
+                        price_lookup = None
                         if self.ai_agent.sheets_manager:
+                            price_lookup = self.ai_agent.sheets_manager.get_order_line_price
                             try:
-                                product_id_map = self.ai_agent.sheets_manager.get_product_id_map()
+                                product_id_map = self.ai_agent.sheets_manager.get_pid_index()
                             except Exception as _e:
                                 logger.warning(f"HugeProfit: product_id_map недоступна: {_e}")
                         ok = crm.push_order_with_retry(
@@ -3044,7 +3112,8 @@ class DirectHandler:
                             order_data=order_data_crm,
                             product_id_map=product_id_map,
                             max_retries=3,
-                            delays=[5, 10, 15]
+                            delays=[5, 10, 15],
+                            price_lookup=price_lookup
                         )
                         if ok:
                             self.ai_agent.db.update_lead_status(username, 'imported')
@@ -3178,7 +3247,18 @@ class DirectHandler:
             # Якщо є \n\n — це розділювач між блоками (опис + питання)
             # Кожен блок відправляємо окремим повідомленням
             parts = [p.strip() for p in response.split('\n\n') if p.strip()]
-            success = False
+            if early_sent:
+                # Блоки, вже відправлені під час генерації (стрімінг), не дублюємо
+                sent_norm = [' '.join(b.split()) for b in early_sent]
+                remaining = []
+                for part in parts:
+                    norm = ' '.join(part.split())
+                    if norm in sent_norm:
+                        sent_norm.remove(norm)
+                    else:
+                        remaining.append(part)
+                parts = remaining
+            success = bool(early_sent)
             for part in parts:
                 success = self.send_message(part)
                 time.sleep(0.8)
@@ -0,0 +1,595 @@
+"""
+Drive Photos - маніфест фото товарів з Google Drive
+Папки товарів (колонка 'Фото' = посилання на Drive папку) лістуються заздалегідь,
+а не в момент відповіді клієнту:
+
+- Паралельне лістування всіх папок (обмежений пул потоків), з пагінацією
+- Маніфест (file id, шлях, md5, modifiedTime) зберігається на диск
+  (data/drive_manifest.json) — після рестарту доступний одразу
+- Інкрементальне оновлення через Drive changes API: перелістовуються
+  лише папки, в яких щось змінилось
+- PhotoCache: дисковий LRU-кеш вмісту фото (ключ — file id + md5/modifiedTime),
+  популярні фото не завантажуються з Drive при кожній відправці
+- FolderPhotoIndex: (категорія, колір) → файли папки товару для resolve_photo_request
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable
+
+from atomic_write import write_bytes
+
+logger = logging.getLogger(__name__)
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+# Формат файлу маніфесту (при зміні структури — старий файл ігнорується)
+MANIFEST_FORMAT = 1
+MANIFEST_FILE = Path(os.getenv(
+    'DRIVE_MANIFEST_FILE', str(Path(__file__).parent / 'data' / 'drive_manifest.json')
+))
+# Скільки папок лістувати одночасно
+LIST_WORKERS = int(os.getenv('DRIVE_LIST_WORKERS', '8'))
+# Інтервал фонової синхронізації маніфесту (0 = без фонового потоку)
+SYNC_INTERVAL = float(os.getenv('DRIVE_MANIFEST_INTERVAL', '300'))
+# Повне перелістування раз на стільки секунд (страховка, якщо changes API щось пропустив)
+FULL_REFRESH_INTERVAL = float(os.getenv('DRIVE_MANIFEST_FULL_REFRESH', str(24 * 3600)))
+PAGE_SIZE = 1000
+# Дисковий кеш фото: директорія і ліміт розміру
+PHOTO_CACHE_DIR = Path(os.getenv('PHOTO_CACHE_DIR', str(Path(__file__).parent / 'data' / 'photo_cache')))
+PHOTO_CACHE_MAX_MB = float(os.getenv('PHOTO_CACHE_MAX_MB', '500'))
+
+_FILE_FIELDS = 'id, name, mimeType, md5Checksum, modifiedTime'
+
+
+def drive_file_url(file_id: str) -> str:
+    """URL файлу у форматі, який використовується в [PHOTO:] маркерах."""
+    return f"https://drive.google.com/uc?id={file_id}"
+
+
+def list_folder_tree(service, folder_id: str, path_prefix: str = '', subfolders: list = None) -> list:
+    """
+    Рекурсивно отримати всі файли папки Google Drive (з пагінацією).
+
+    Args:
+        service: Drive v3 service
+        folder_id: ID папки
+        path_prefix: шлях батьківських підпапок
+        subfolders: якщо передано — сюди додаються ID усіх підпапок
+
+    Returns:
+        list: [{name, id, path, url, md5, modified_time}], відсортовані за ім'ям,
+              вміст підпапок — на місці підпапки
+    """
+    output = []
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            fields=f"nextPageToken, files({_FILE_FIELDS})",
+            orderBy="name",
+            pageSize=PAGE_SIZE,
+            pageToken=page_token,
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True,
+        ).execute()
+        for f in results.get('files', []):
+            full_path = f"{path_prefix}/{f['name']}" if path_prefix else f['name']
+            if f['mimeType'] == FOLDER_MIME:
+                if subfolders is not None:
+                    subfolders.append(f['id'])
+                output.extend(list_folder_tree(service, f['id'], full_path, subfolders))
+            else:
+                output.append({
+                    'name': f['name'],
+                    'id': f['id'],
+                    'path': full_path,
+                    'url': drive_file_url(f['id']),
+                    'md5': f.get('md5Checksum', ''),
+                    'modified_time': f.get('modifiedTime', ''),
+                })
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return output
+
+
+class DriveManifest:
+    """
+    Маніфест файлів у папках товарів: {folder_id: {'products': [...], 'files': [...], ...}}.
+    Потокобезпечний; кожен потік пулу використовує власний Drive service
+    (googleapiclient/httplib2 не можна ділити між потоками).
+    """
+
+    def __init__(self, service_factory: Callable, path: Path = None, max_workers: int = None):
+        """
+        Args:
+            service_factory: функція що створює новий Drive v3 service (або None, якщо Drive не підключено)
+            path: файл маніфесту
+            max_workers: скільки папок лістувати паралельно
+        """
+        self._service_factory = service_factory
+        self.path = Path(path or MANIFEST_FILE)
+        self.max_workers = max_workers or LIST_WORKERS
+        self._folders: dict = {}             # {folder_id: {'products', 'files', 'subfolders', 'listed_at'}}
+        self._start_page_token: str = None   # курсор changes API
+        self._full_refresh_at = 0.0
+        # Папки, які не вдалося перелістувати (курсор змін уже пройшов їхні зміни) — повтор при наступній синхронізації
+        self._retry_folders: set = set()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._local = threading.local()
+        self._pool: ThreadPoolExecutor = None
+        self._photo_indexes: dict = {}       # {folder_id: FolderPhotoIndex}
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+
+    # ==================== ДОСТУП ====================
+
+    def get(self, folder_id: str):
+        """Файли папки з маніфесту або None, якщо папку ще не лістували."""
+        entry = self._folders.get(folder_id)
+        return entry['files'] if entry else None
+
+    def folder_ids(self) -> set:
+        return set(self._folders)
+
+    def photo_index(self, folder_id: str):
+        """FolderPhotoIndex для папки (перебудовується лише коли папку перелістовано)."""
+        files = self.get(folder_id)
+        if files is None:
+            return None
+        cached = self._photo_indexes.get(folder_id)
+        if cached is None or cached.files is not files:
+            cached = FolderPhotoIndex(files)
+            self._photo_indexes[folder_id] = cached
+        return cached
+
+    def _service(self):
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self._service_factory()
+            self._local.service = service
+        return service
+
+    # ==================== ДИСК ====================
+
+    def load(self) -> bool:
+        """Завантажити маніфест з диска (False — файлу немає або формат застарів)."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Drive маніфест: не вдалося прочитати {self.path}: {e}")
+            return False
+        if data.get('format') != MANIFEST_FORMAT:
+            logger.info(f"Drive маніфест: застарілий формат {data.get('format')} — буде перебудовано")
+            return False
+        with self._lock:
+            self._folders = data.get('folders', {})
+            self._start_page_token = data.get('start_page_token')
+            self._full_refresh_at = data.get('full_refresh_at', 0.0)
+            self._retry_folders = set(data.get('retry_folders', ()))
+        files = sum(len(entry['files']) for entry in self._folders.values())
+        logger.info(f"Drive маніфест завантажено з диска: {len(self._folders)} папок, {files} файлів")
+        return True
+
+    def save(self):
+        """Атомарно записати маніфест на диск (tmp + rename)."""
+        with self._lock:
+            data = {
+                'format': MANIFEST_FORMAT,
+                'saved_at': time.time(),
+                'start_page_token': self._start_page_token,
+                'full_refresh_at': self._full_refresh_at,
+                'retry_folders': sorted(self._retry_folders),
+                'folders': self._folders,
+            }
+            payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        try:
+            write_bytes(self.path, payload)
+        except Exception as e:
+            logger.warning(f"Drive маніфест: не вдалося зберегти {self.path}: {e}")
+
+    # ==================== ЛІСТУВАННЯ ====================
+
+    def list_folder(self, folder_id: str, products: list = None) -> list:
+        """Перелістувати одну папку зараз (lazy fallback) і оновити маніфест."""
+        files = self._list_many({folder_id: products or []}).get(folder_id)
+        return files if files is not None else []
+
+    def _list_one(self, folder_id: str):
+        subfolders = []
+        files = list_folder_tree(self._service(), folder_id, subfolders=subfolders)
+        return files, subfolders
+
+    def _list_many(self, folders: dict) -> dict:
+        """Паралельно перелістувати папки {folder_id: [товари]} → {folder_id: files}."""
+        if not folders:
+            return {}
+        started = time.monotonic()
+        listed = {}
+        if self._pool is None:
+            # Потоки пулу живуть довго — Drive service кожного створюється один раз
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='drive-list')
+        futures = {self._pool.submit(self._list_one, fid): fid for fid in folders}
+        for future, folder_id in futures.items():
+            try:
+                files, subfolders = future.result()
+            except Exception as e:
+                logger.error(f"Помилка listування папки {folder_id}: {e}")
+                continue
+            listed[folder_id] = files
+            with self._lock:
+                self._folders[folder_id] = {
+                    'products': sorted(folders[folder_id]),
+                    'files': files,
+                    'subfolders': subfolders,
+                    'listed_at': time.time(),
+                }
+        logger.info(
+            f"Drive маніфест: перелістовано {len(listed)}/{len(folders)} папок "
+            f"({sum(len(f) for f in listed.values())} файлів) за {time.monotonic() - started:.1f}с"
+        )
+        return listed
+
+    # ==================== СИНХРОНІЗАЦІЯ ====================
+
+    def sync(self, drive_folders: dict) -> int:
+        """
+        Привести маніфест у відповідність до папок товарів.
+
+        - нові папки лістуються паралельно
+        - для вже відомих — застосовуються зміни з Drive changes API
+          (перелістовуються лише змінені папки + ті, що не вдалося перелістувати минулого разу)
+        - раз на FULL_REFRESH_INTERVAL — повне перелістування
+
+        Args:
+            drive_folders: {назва товару: folder_id} зі знімка бази знань
+
+        Returns:
+            int: скільки папок перелістовано
+        """
+        if self._service() is None:
+            return 0
+        with self._sync_lock:
+            wanted = {}
+            for product, folder_id in drive_folders.items():
+                wanted.setdefault(folder_id, []).append(product)
+
+            with self._lock:
+                removed = [fid for fid in self._folders if fid not in wanted]
+                for fid in removed:
+                    del self._folders[fid]
+                for fid, products in wanted.items():
+                    if fid in self._folders:
+                        self._folders[fid]['products'] = sorted(products)
+
+            full = time.time() - self._full_refresh_at >= FULL_REFRESH_INTERVAL or not self._start_page_token
+            if full:
+                token = self._get_start_page_token()
+                dirty = set(wanted)
+            else:
+                changed, token = self._changed_folders()
+                dirty = {fid for fid in wanted if fid not in self._folders} | (changed & set(wanted))
+                dirty |= self._retry_folders & set(wanted)
+
+            listed = self._list_many({fid: wanted[fid] for fid in dirty})
+            # Курсор змін рухається далі — невдалі папки запам'ятовуємо, інакше їхні зміни загубляться
+            retry = dirty - set(listed)
+            if retry:
+                logger.warning(f"Drive маніфест: {len(retry)} папок не перелістовано — повтор при наступній синхронізації")
+            retry_changed = retry != self._retry_folders
+            self._retry_folders = retry
+            if full and len(listed) == len(dirty):
+                self._full_refresh_at = time.time()
+            token_moved = bool(token) and token != self._start_page_token
+            if token:
+                self._start_page_token = token
+            if listed or removed or token_moved or retry_changed:
+                self.save()
+            return len(listed)
+
+    def _get_start_page_token(self) -> str:
+        try:
+            return self._service().changes().getStartPageToken(supportsAllDrives=True).execute().get('startPageToken')
+        except Exception as e:
+            logger.warning(f"Drive маніфест: не вдалося отримати курсор змін: {e}")
+            return None
+
+    def _changed_folders(self) -> tuple:
+        """
+        Папки маніфесту, яких торкнулись зміни з останньої синхронізації.
+
+        Returns:
+            (set folder_id, новий курсор changes API або None при помилці)
+        """
+        with self._lock:
+            folder_roots = {}
+            file_roots = {}
+            for root, entry in self._folders.items():
+                folder_roots[root] = root
+                for sub in entry.get('subfolders', ()):
+                    folder_roots[sub] = root
+                for f in entry['files']:
+                    file_roots[f['id']] = root
+
+        changed = set()
+        page_token = self._start_page_token
+        try:
+            while page_token:
+                result = self._service().changes().list(
+                    pageToken=page_token,
+                    pageSize=PAGE_SIZE,
+                    fields="nextPageToken, newStartPageToken, changes(fileId, removed, file(parents))",
+                    supportsAllDrives=True,
+                    includeItemsFromAllDrives=True,
+                ).execute()
+                for change in result.get('changes', []):
+                    file_id = change.get('fileId')
+                    for key in [file_id] + (change.get('file') or {}).get('parents', []):
+                        root = folder_roots.get(key) or file_roots.get(key)
+                        if root:
+                            changed.add(root)
+                if result.get('newStartPageToken'):
+                    if changed:
+                        logger.info(f"Drive маніфест: змінено {len(changed)} папок товарів")
+                    return changed, result['newStartPageToken']
+                page_token = result.get('nextPageToken')
+        except Exception as e:
+            logger.warning(f"Drive маніфест: помилка changes API: {e}")
+        return changed, None
+
+    # ==================== ФОНОВИЙ ПОТІК ====================
+
+    def start_background_sync(self, folders_provider: Callable, interval: float = None,
+                              on_synced: Callable = None):
+        """
+        Запустити daemon-потік синхронізації (перша — одразу, далі кожні interval секунд).
+
+        Args:
+            folders_provider: функція що повертає {назва товару: folder_id}
+            on_synced: викликається після кожної синхронізації
+        """
+        interval = SYNC_INTERVAL if interval is None else interval
+        if interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._background_loop, args=(folders_provider, interval, on_synced),
+            name='drive-manifest-sync', daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Drive маніфест: фонова синхронізація кожні {interval:.0f}с")
+
+    def stop_background_sync(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _background_loop(self, folders_provider: Callable, interval: float, on_synced: Callable):
+        while not self._stop_event.is_set():
+            try:
+                self.sync(folders_provider())
+                if on_synced:
+                    on_synced()
+            except Exception as e:
+                logger.error(f"Drive маніфест: помилка синхронізації: {e}")
+            self._stop_event.wait(timeout=interval)
+
+
+class PhotoCache:
+    """
+    Дисковий LRU-кеш фото з Drive, адресований вмістом: ключ — file id + версія
+    (md5Checksum або modifiedTime). Змінився файл у Drive — новий ключ, старий запис
+    витісниться за LRU. Час доступу = mtime файлу (LRU переживає рестарт).
+    """
+
+    def __init__(self, directory: Path = None, max_bytes: int = None):
+        self.directory = Path(directory or PHOTO_CACHE_DIR)
+        self.max_bytes = int(PHOTO_CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self._entries = OrderedDict()   # {ім'я файлу: розмір}, від найстаріших до найновіших
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._scan()
+
+    def _scan(self):
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            files = [p for p in self.directory.iterdir() if p.is_file() and not p.name.endswith('.tmp')]
+        except Exception as e:
+            logger.warning(f"Кеш фото: директорія {self.directory} недоступна: {e}")
+            return
+        for path in sorted(files, key=lambda p: p.stat().st_mtime):
+            size = path.stat().st_size
+            self._entries[path.name] = size
+            self._total += size
+        if self._entries:
+            logger.info(f"Кеш фото: {len(self._entries)} файлів, {self._total / 1024 / 1024:.1f} MB")
+
+    @staticmethod
+    def _key(file_id: str, version: str) -> str:
+        return hashlib.sha1(f"{file_id}:{version}".encode('utf-8')).hexdigest()[:24]
+
+    def get(self, file_id: str, version: str):
+        """Шлях до закешованого фото або None."""
+        key = self._key(file_id, version)
+        with self._lock:
+            name = next((n for n in (f"{key}.jpg", f"{key}.png") if n in self._entries), None)
+            if name is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+        path = self.directory / name
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._total -= self._entries.pop(name, 0)
+            return None
+        return str(path)
+
+    def put(self, file_id: str, version: str, data: bytes) -> str:
+        """Зберегти фото (атомарно) і витіснити найдавніше використані понад ліміт."""
+        ext = '.png' if data[:4] == b'\x89PNG' else '.jpg'
+        name = self._key(file_id, version) + ext
+        path = self.directory / name
+        write_bytes(path, data)
+        with self._lock:
+            self._total += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            evicted = []
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_name, size = self._entries.popitem(last=False)
+                self._total -= size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                (self.directory / old_name).unlink()
+            except FileNotFoundError:
+                pass
+        if evicted:
+            logger.info(f"Кеш фото: витіснено {len(evicted)} файлів (ліміт {self.max_bytes / 1024 / 1024:.0f} MB)")
+        return str(path)
+
+    def get_or_fetch(self, file_id: str, version: str, fetch: Callable):
+        """
+        Шлях до фото: з кешу або fetch() → bytes → кеш. None якщо fetch не вдався.
+        """
+        path = self.get(file_id, version)
+        if path:
+            return path
+        data = fetch()
+        if not data:
+            return None
+        try:
+            return self.put(file_id, version, data)
+        except Exception as e:
+            logger.warning(f"Кеш фото: не вдалося зберегти {file_id}: {e}")
+            return None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'files': len(self._entries),
+            'size_bytes': self._total,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+# Синоніми кольорів для пошуку фото (запит клієнта → назви файлів у Drive)
+COLOR_SYNONYMS = {
+    'блакитний': ['електрик', 'електник', 'синій', 'голубий'],
+    'синій': ['електрик', 'електник', 'блакитний'],
+    'електрик': ['блакитний', 'синій', 'електник'],
+    'електник': ['електрик', 'блакитний', 'синій'],
+    'червоний': ['бордо', 'марсала'],
+    'зелений': ['хакі', 'олива']
+}
+SIZE_CHART = 'розмірна сітка'
+
+
+@lru_cache(maxsize=1024)
+def color_variants(requested: str) -> tuple:
+    """Запитаний колір + його синоніми (таблиця синонімів перевіряється один раз на колір)."""
+    req = requested.lower().strip()
+    if not req:
+        return ()
+    variants = [req]
+    for k, v in COLOR_SYNONYMS.items():
+        if req in k or k in req:
+            variants.extend(v)
+    return tuple(variants)
+
+
+def colors_match(requested: str, file_color: str) -> bool:
+    """Колір запиту (або синонім) збігається з назвою файлу: підрядок або спільні перші 4 літери."""
+    fcl = file_color.lower().strip()
+    if not fcl:
+        return False
+    for variant in color_variants(requested):
+        if variant in fcl or fcl in variant:
+            return True
+        if len(variant) >= 4 and len(fcl) >= 4 and variant[:4] == fcl[:4]:
+            return True
+    return False
+
+
+class FolderPhotoIndex:
+    """
+    Попередньо проіндексовані файли папки товару для resolve_photo_request:
+    (категорія, колір) → файли. Шляхи розбираються один раз при побудові;
+    результат кожного (категорія, колір) запам'ятовується.
+    """
+
+    def __init__(self, files: list):
+        self.files = files
+        self._colors = {}              # {(категорія, колір файлу): [pos]} — без розмірної сітки
+        self._any_category = {}        # {колір файлу: [pos]} — без розмірної сітки за шляхом
+        self._first_in_category = {}   # {категорія: pos} — перше фото не з розмірної сітки
+        self._resolved = {}            # {(категорія, колір): url | None}
+
+        for pos, f in enumerate(files):
+            parts = f['path'].split('/')
+            file_cat = 'root' if len(parts) == 1 else parts[0].lower()
+            color = parts[-1].rsplit('.', 1)[0].lower().strip()
+            if SIZE_CHART not in file_cat:
+                self._colors.setdefault((file_cat, color), []).append(pos)
+            if SIZE_CHART not in f['path'].lower():
+                self._any_category.setdefault(color, []).append(pos)
+                self._first_in_category.setdefault(file_cat, pos)
+
+    @staticmethod
+    def _normalize_category(category: str) -> str:
+        cat = (category or '').strip().lower()
+        return 'root' if cat in ('root', '', 'none') else cat
+
+    def resolve(self, category: str, color: str):
+        """
+        URL фото для категорії/кольору або None. Порядок пошуку як раніше:
+        1) колір у запитаній категорії, 2) колір у будь-якій категорії,
+        3) перше фото запитаної категорії (не розмірна сітка).
+        """
+        key = (self._normalize_category(category), (color or '').strip().lower())
+        if key not in self._resolved:
+            pos = self._find(*key)
+            self._resolved[key] = self.files[pos]['url'] if pos is not None else None
+        return self._resolved[key]
+
+    def resolve_many(self, category: str, colors: list) -> list:
+        """URL для кількох кольорів (альбом): без дублікатів, у порядку кольорів."""
+        urls = []
+        for color in colors:
+            url = self.resolve(category, color)
+            if url and url not in urls:
+                urls.append(url)
+        return urls
+
+    def _find(self, cat: str, color: str):
+        if color:
+            matched = [
+                positions[0] for (file_cat, file_color), positions in self._colors.items()
+                if file_cat == cat and colors_match(color, file_color)
+            ]
+            if matched:
+                return min(matched)
+            matched = [
+                positions[0] for file_color, positions in self._any_category.items()
+                if colors_match(color, file_color)
+            ]
+            if matched:
+                return min(matched)
+        return self._first_in_category.get(cat)
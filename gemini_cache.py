@@ -0,0 +1,130 @@
+"""
+Gemini Context Cache - явне кешування статичного префікса промпту
+system_prompt (prompts.yml) + каталог + шаблони/правила з Google Sheets однакові
+для всіх клієнтів, доки не змінилась таблиця. Замість відправки ~45 KB+ у кожному
+запиті створюємо cached content один раз і посилаємось на нього за іменем.
+
+- Ключ кешу: хеш prompts.yml + версія знімка бази знань (+ модель)
+- TTL кешу продовжується до того, як він спливе
+- Будь-яка помилка → None (виклик іде без кешу, як раніше)
+"""
+import os
+import time
+import logging
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# Вмикання/вимикання кешу та його TTL
+CONTEXT_CACHE_ENABLED = os.getenv('GEMINI_CONTEXT_CACHE', 'true').lower() == 'true'
+CONTEXT_CACHE_TTL = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL', '3600'))
+# За скільки секунд до завершення TTL продовжувати кеш
+REFRESH_MARGIN = 300
+# Після невдалого створення кешу не пробуємо знову стільки секунд
+RETRY_AFTER_FAILURE = 600
+
+
+@dataclass
+class _CacheEntry:
+    name: str
+    expires_at: float
+
+
+class PromptCache:
+    """
+    Кеш cached-content об'єктів Gemini для статичного префікса промпту.
+    Один актуальний запис на (клієнт, модель, варіант префікса); старий видаляється при зміні ключа,
+    записи різних варіантів (напр. з каталогом / без) живуть і спливають незалежно.
+    """
+
+    def __init__(self, ttl: int = None, enabled: bool = None):
+        self.ttl = CONTEXT_CACHE_TTL if ttl is None else ttl
+        self.enabled = CONTEXT_CACHE_ENABLED if enabled is None else enabled
+        self._entries: dict = {}          # {(client_label, model, variant): (key, _CacheEntry)}
+        self._disabled_until: dict = {}   # {(client_label, model, variant): timestamp}
+
+    def get(self, client, model: str, key: tuple, build_text: Callable[[], str],
+            client_label: str = 'default', variant=None) -> Optional[str]:
+        """
+        Ім'я cached content для статичного префікса або None (тоді — виклик без кешу).
+
+        Args:
+            client: genai.Client, через який буде запит (кеш належить проекту ключа)
+            model: модель генерації (кеш прив'язаний до моделі)
+            key: ключ вмісту префікса (хеш промптів, версія бази знань, ...)
+            build_text: функція що будує текст префікса (викликається лише при створенні)
+            variant: різновид префікса з окремим записом (новий ключ того ж варіанту замінює старий)
+        """
+        if not self.enabled:
+            return None
+        slot = (client_label, model, variant)
+        now = time.time()
+
+        current = self._entries.get(slot)
+        if current and current[0] == key:
+            entry = current[1]
+            if now < entry.expires_at - REFRESH_MARGIN:
+                return entry.name
+            if self._extend(client, entry):
+                return entry.name
+            self._entries.pop(slot, None)
+
+        if now < self._disabled_until.get(slot, 0):
+            return None
+
+        try:
+            started = time.monotonic()
+            cache = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"ig-agent-{abs(hash(key)) % 10 ** 8}",
+                    system_instruction=build_text(),
+                    ttl=f"{self.ttl}s",
+                ),
+            )
+        except Exception as e:
+            logger.warning(f"Gemini cache: не вдалося створити кеш ({model}): {e} — працюємо без кешу")
+            self._disabled_until[slot] = now + RETRY_AFTER_FAILURE
+            return None
+
+        tokens = getattr(getattr(cache, 'usage_metadata', None), 'total_token_count', None)
+        logger.info(
+            f"Gemini cache: створено {cache.name} ({model}, ~{tokens} токенів, "
+            f"TTL {self.ttl}с, {time.monotonic() - started:.2f}с)"
+        )
+        if current:
+            self._delete(client, current[1].name)
+        self._entries[slot] = (key, _CacheEntry(name=cache.name, expires_at=now + self.ttl))
+        return cache.name
+
+    def invalidate(self, client, name: str):
+        """Забути (і видалити) кеш, якщо запит з ним завершився помилкою."""
+        for slot, (key, entry) in list(self._entries.items()):
+            if entry.name == name:
+                self._entries.pop(slot, None)
+                self._delete(client, name)
+                logger.warning(f"Gemini cache: {name} інвалідовано")
+
+    def _extend(self, client, entry: _CacheEntry) -> bool:
+        """Продовжити TTL кешу до того, як він спливе."""
+        try:
+            client.caches.update(
+                name=entry.name,
+                config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"),
+            )
+            entry.expires_at = time.time() + self.ttl
+            logger.info(f"Gemini cache: TTL {entry.name} продовжено на {self.ttl}с")
+            return True
+        except Exception as e:
+            logger.warning(f"Gemini cache: не вдалося продовжити {entry.name}: {e}")
+            return False
+
+    @staticmethod
+    def _delete(client, name: str):
+        try:
+            client.caches.delete(name=name)
+        except Exception as e:
+            logger.debug(f"Gemini cache: не вдалося видалити {name}: {e}")
@@ -0,0 +1,540 @@
+"""
+Gemini Gateway - єдина точка виклику Gemini API для всіх частин бота
+(відповідь клієнту, аналіз фото, перевірка тексту, вибір варіації HugeProfit).
+
+- Клієнтський ліміт запитів/токенів за хвилину (token bucket) — не впираємось у 429
+- Повтори з експоненційною затримкою + jitter; підказка сервера (RetryInfo / Retry-After)
+  має пріоритет; загальний час очікування обмежений (не блокуємо потік браузера надовго)
+- Circuit breaker: після серії збоїв підряд (5xx, таймаути, мережа) виклики одразу відхиляються,
+  доки API не оговтається; 429 — лише пауза маршруту (ключ, модель), не збій API
+- Лічильники і затримки окремо для кожного місця виклику (site): stats() + періодичний лог
+- Пул API-ключів (GEMINI_API_KEYS): свої ліміти на кожен ключ, запит іде на найменш завантажений;
+  ключ, що отримав 429, на час паузи виключається з маршрутизації
+- Ланцюжок резервних моделей (GEMINI_FALLBACK_MODELS): якщо основна модель на всіх ключах
+  обмежена довше ніж GEMINI_FALLBACK_WAIT — відповідаємо дешевшою моделлю, а не fallback-текстом
+"""
+import os
+import re
+import time
+import random
+import threading
+import logging
+from collections import deque
+from typing import Callable, NamedTuple, Optional
+
+from google import genai
+from google.genai import errors as genai_errors
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Пул ключів (через кому; якщо не задано — один GEMINI_API_KEY) і резервні моделі по порядку
+GEMINI_API_KEYS = [k.strip() for k in os.getenv('GEMINI_API_KEYS', '').split(',') if k.strip()]
+GEMINI_FALLBACK_MODELS = [m.strip() for m in os.getenv('GEMINI_FALLBACK_MODELS', '').split(',') if m.strip()]
+# Скільки секунд готові чекати основну модель, перш ніж перейти на резервну
+GEMINI_FALLBACK_WAIT = float(os.getenv('GEMINI_FALLBACK_WAIT', '3'))
+# Клієнтські ліміти на кожен ключ (трохи нижче квоти проекту, щоб 429 був винятком)
+GEMINI_RPM = float(os.getenv('GEMINI_RPM', '60'))
+GEMINI_TPM = float(os.getenv('GEMINI_TPM', '1000000'))
+# Повтори: максимум спроб і загальний бюджет очікування на один виклик, с
+GEMINI_MAX_ATTEMPTS = int(os.getenv('GEMINI_MAX_ATTEMPTS', '6'))
+GEMINI_RETRY_BUDGET = float(os.getenv('GEMINI_RETRY_BUDGET', '40'))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 20.0
+# Circuit breaker: скільки збоїв підряд відкривають його і на скільки секунд
+BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+BREAKER_COOLDOWN = float(os.getenv('GEMINI_BREAKER_COOLDOWN', '30'))
+# Лог статистики по місцях виклику — не частіше ніж раз на стільки секунд
+STATS_LOG_INTERVAL = 600
+
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_STATUSES = {'RESOURCE_EXHAUSTED', 'UNAVAILABLE', 'INTERNAL', 'DEADLINE_EXCEEDED'}
+# Помилки без коду (мережа, таймаути) — як раніше, за текстом
+RETRYABLE_TEXT = ('429', '500', '503', 'rate limit', 'unavailable', 'overloaded', 'timed out', 'timeout')
+# Оцінка токенів вкладень (фото/аудіо) для token bucket, до відповіді з usage_metadata
+INLINE_PART_TOKENS = 300
+LATENCY_WINDOW = 200
+
+_DURATION_RE = re.compile(r'^\s*([\d.]+)\s*s?\s*$')
+
+
+class GeminiUnavailable(RuntimeError):
+    """Виклик відхилено без запиту до API (circuit breaker відкритий або ліміт не вкладається в бюджет)."""
+
+
+class GeminiStreamInterrupted(RuntimeError):
+    """Стрім обірвався після того, як частину тексту вже віддано (повтор неможливий)."""
+
+    def __init__(self, text: str, cause: Exception):
+        super().__init__(f"стрім обірвано після {len(text)} символів: {cause}")
+        self.text = text
+        self.cause = cause
+
+
+class StreamedResponse(NamedTuple):
+    """Зібрана відповідь generate_content_stream (як GenerateContentResponse для викликача)."""
+    text: str
+    candidates: list
+    usage_metadata: object
+
+
+class TokenBucket:
+    """Token bucket: capacity одиниць за хвилину, поповнюється рівномірно."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(per_minute, 1.0)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Забрати amount одиниць (можна в борг); повертає, скільки секунд чекати до їх появи."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def level(self) -> float:
+        """Частка вільного ліміту зараз (1.0 — повний, ≤0 — у боргу)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens / self.capacity
+
+    def refund(self, amount: float):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def adjust(self, amount: float):
+        """Скоригувати оцінку після відповіді (usage_metadata): додатне — доплатити, від'ємне — повернути."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class CircuitBreaker:
+    """closed → (threshold збоїв підряд) → open → (cooldown) → half-open: одна пробна спроба."""
+
+    def __init__(self, threshold: int = None, cooldown: float = None):
+        self.threshold = BREAKER_THRESHOLD if threshold is None else threshold
+        self.cooldown = BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return 'closed'
+        return 'open' if time.monotonic() - self.opened_at < self.cooldown else 'half-open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._probe:
+                self._probe = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            if self.failures >= self.threshold:
+                logger.info("Gemini: circuit breaker закрито — API знову відповідає")
+            self.failures = 0
+            self._probe = False
+
+    def release(self):
+        """Спроба не дійшла до API (ліміт, дедлайн, помилка підготовки) — звільнити пробу без вердикту."""
+        with self._lock:
+            self._probe = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe = False
+            if self.failures >= self.threshold:
+                if self.failures == self.threshold:
+                    logger.error(f"Gemini: circuit breaker відкрито на {self.cooldown:.0f}с ({self.failures} збоїв підряд)")
+                self.opened_at = time.monotonic()
+
+
+class _SiteStats:
+    def __init__(self):
+        self.calls = 0
+        self.ok = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.waited = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self) -> dict:
+        lat = sorted(self.latencies)
+
+        def pct(p):
+            return round(lat[min(int(len(lat) * p), len(lat) - 1)] * 1000) if lat else None
+
+        return {
+            'calls': self.calls, 'ok': self.ok, 'errors': self.errors, 'retries': self.retries,
+            'rejected': self.rejected, 'waited_s': round(self.waited, 1),
+            'p50_ms': pct(0.5), 'p95_ms': pct(0.95),
+        }
+
+
+def retry_delay_hint(exc: Exception) -> Optional[float]:
+    """Підказка сервера, через скільки повторити: RetryInfo.retryDelay у деталях або заголовок Retry-After."""
+    details = getattr(exc, 'details', None)
+    if isinstance(details, dict):
+        for item in (details.get('error') or {}).get('details') or []:
+            if isinstance(item, dict) and item.get('retryDelay'):
+                m = _DURATION_RE.match(str(item['retryDelay']))
+                if m:
+                    return float(m.group(1))
+    headers = getattr(getattr(exc, 'response', None), 'headers', None)
+    if headers:
+        try:
+            value = headers.get('retry-after')
+            return float(value) if value else None
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Тимчасова помилка (ліміт, перевантаження, мережа) — є сенс повторити."""
+    if isinstance(exc, (GeminiUnavailable, GeminiStreamInterrupted)):
+        return False
+    if isinstance(exc, genai_errors.APIError):
+        return exc.code in RETRYABLE_CODES or exc.status in RETRYABLE_STATUSES
+    error_str = str(exc).lower()
+    return any(code in error_str for code in RETRYABLE_TEXT)
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    """429 / RESOURCE_EXHAUSTED — вичерпано квоту ключа або моделі, а не збій API."""
+    if isinstance(exc, genai_errors.APIError):
+        return exc.code == 429 or exc.status == 'RESOURCE_EXHAUSTED'
+    error_str = str(exc).lower()
+    return '429' in error_str or 'rate limit' in error_str or 'resource_exhausted' in error_str
+
+
+def estimate_tokens(contents, config=None) -> int:
+    """Груба оцінка вхідних токенів (≈4 символи на токен + фіксовано на вкладення)."""
+    chars = 0
+    inline = 0
+
+    def walk(item):
+        nonlocal chars, inline
+        if item is None:
+            return
+        if isinstance(item, str):
+            chars += len(item)
+        elif isinstance(item, (list, tuple)):
+            for x in item:
+                walk(x)
+        elif getattr(item, 'parts', None) is not None:
+            walk(item.parts)
+        elif getattr(item, 'inline_data', None) is not None:
+            inline += 1
+        elif getattr(item, 'text', None):
+            chars += len(item.text)
+
+    walk(contents)
+    walk(getattr(config, 'system_instruction', None))
+    return chars // 4 + inline * INLINE_PART_TOKENS + 1
+
+
+class _KeySlot:
+    """Один API-ключ пулу: клієнт, власні ліміти RPM/TPM і паузи по моделях після 429/5xx."""
+
+    def __init__(self, label: str, api_key: str, rpm: float, tpm: float):
+        self.label = label
+        self.client = genai.Client(api_key=api_key)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.cooldown: dict = {}    # {model: monotonic, до якого ключ не використовуємо}
+
+    def load(self) -> float:
+        """Завантаженість ключа: 0 — ліміти вільні, 1+ — вичерпані."""
+        return 1.0 - min(self.requests.level(), self.tokens.level())
+
+
+class GeminiRoute(NamedTuple):
+    """Куди піде конкретна спроба: ключ пулу (label, client) і модель."""
+    label: str
+    client: object
+    model: str
+
+
+class GeminiGateway:
+    """
+    Спільний для процесу шлюз до Gemini: маршрутизація по ключах і моделях,
+    rate limit, повтори, circuit breaker, статистика.
+    Усі виклики generate_content йдуть через generate(site, ...).
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, api_keys: list = None, fallback_models: list = None, rpm: float = None,
+                 tpm: float = None, max_attempts: int = None, retry_budget: float = None):
+        if api_keys is None:
+            api_keys = GEMINI_API_KEYS or [k for k in (os.getenv('GEMINI_API_KEY', ''),) if k]
+        rpm = GEMINI_RPM if rpm is None else rpm
+        tpm = GEMINI_TPM if tpm is None else tpm
+        self._slots = [_KeySlot(f"key{i}", key, rpm, tpm) for i, key in enumerate(api_keys, 1)]
+        self.fallback_models = GEMINI_FALLBACK_MODELS if fallback_models is None else fallback_models
+        self.breaker = CircuitBreaker()
+        self.max_attempts = GEMINI_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.retry_budget = GEMINI_RETRY_BUDGET if retry_budget is None else retry_budget
+        self._stats: dict = {}
+        self._routes: dict = {}     # {"key1/model": кількість успішних відповідей}
+        self._stats_lock = threading.Lock()
+        self._route_lock = threading.Lock()
+        self._stats_logged_at = time.monotonic()
+        if len(self._slots) > 1 or self.fallback_models:
+            logger.info(f"Gemini gateway: {len(self._slots)} ключів, резервні моделі: {self.fallback_models or '—'}")
+
+    @classmethod
+    def shared(cls) -> 'GeminiGateway':
+        """Один шлюз (і спільні ліміти) на процес."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @property
+    def available(self) -> bool:
+        return bool(self._slots)
+
+    def model_chain(self, model: str) -> list:
+        """Основна модель + резервні (без повторів)."""
+        return [model] + [m for m in self.fallback_models if m != model]
+
+    # ==================== МАРШРУТИЗАЦІЯ ====================
+
+    def _route(self, chain: list) -> tuple:
+        """
+        (route, 0) — найменш завантажений ключ першої моделі ланцюжка, яка зараз не на паузі;
+        (None, wait) — все на паузі: скільки чекати до звільнення (основна модель — якщо
+        чекати не довше GEMINI_FALLBACK_WAIT, інакше найраніша серед усіх).
+        """
+        now = time.monotonic()
+        with self._route_lock:
+            earliest = None
+            for model in chain:
+                free = [slot for slot in self._slots if slot.cooldown.get(model, 0) <= now]
+                if free:
+                    slot = min(free, key=_KeySlot.load)
+                    return GeminiRoute(slot.label, slot.client, model), 0.0
+                ready_in = min(slot.cooldown[model] for slot in self._slots) - now
+                if ready_in <= GEMINI_FALLBACK_WAIT:
+                    return None, ready_in
+                earliest = ready_in if earliest is None else min(earliest, ready_in)
+            return None, earliest
+
+    def _slot(self, label: str) -> _KeySlot:
+        return next(slot for slot in self._slots if slot.label == label)
+
+    def _pause(self, route: GeminiRoute, delay: float):
+        """Виключити (ключ, модель) з маршрутизації на delay секунд."""
+        with self._route_lock:
+            slot = self._slot(route.label)
+            slot.cooldown[route.model] = max(slot.cooldown.get(route.model, 0), time.monotonic() + delay)
+
+    # ==================== ВИКЛИК ====================
+
+    def generate(self, site: str, model: str, contents=None, config=None, budget: float = None,
+                 build: Callable[[GeminiRoute], tuple] = None):
+        """
+        client.models.generate_content через маршрутизацію, ліміти, повтори і circuit breaker.
+
+        Args:
+            site: місце виклику для статистики ('reply', 'clothing', 'text_check', 'hugeprofit_mid', ...)
+            model: основна модель (далі — GEMINI_FALLBACK_MODELS)
+            budget: скільки секунд максимум чекати сумарно (ліміт + паузи між повторами)
+            build: build(route) → (contents, config) для кожної спроби — якщо запит залежить
+                   від ключа/моделі (cached content належить проекту ключа і моделі)
+
+        Raises:
+            GeminiUnavailable: breaker відкритий / ліміт не вкладається в бюджет
+            Exception: остання помилка API (не тимчасова або повтори вичерпано)
+        """
+        return self._run(site, model, contents, config, budget, build, self._invoke)
+
+    def generate_stream(self, site: str, model: str, on_text: Callable[[str], None], contents=None,
+                        config=None, budget: float = None,
+                        build: Callable[[GeminiRoute], tuple] = None) -> StreamedResponse:
+        """
+        generate_content_stream: кожен шматок тексту одразу передається в on_text.
+        Маршрутизація і повтори — як у generate, але лише доки не отримано перший шматок;
+        обрив після цього — GeminiStreamInterrupted з уже отриманим текстом.
+        """
+        def invoke(route: GeminiRoute, contents, config) -> StreamedResponse:
+            parts, candidates, usage = [], [], None
+            try:
+                for chunk in route.client.models.generate_content_stream(
+                        model=route.model, contents=contents, config=config):
+                    candidates = getattr(chunk, 'candidates', None) or candidates
+                    usage = getattr(chunk, 'usage_metadata', None) or usage
+                    try:
+                        text = chunk.text
+                    except Exception:
+                        text = None
+                    if text:
+                        parts.append(text)
+                        on_text(text)
+            except Exception as e:
+                if parts:
+                    raise GeminiStreamInterrupted(''.join(parts), e) from e
+                raise
+            return StreamedResponse(''.join(parts), candidates, usage)
+
+        return self._run(site, model, contents, config, budget, build, invoke)
+
+    @staticmethod
+    def _invoke(route: GeminiRoute, contents, config):
+        return route.client.models.generate_content(model=route.model, contents=contents, config=config)
+
+    def _run(self, site: str, model: str, contents, config, budget: Optional[float],
+             build: Optional[Callable], invoke: Callable):
+        if not self.available:
+            raise GeminiUnavailable("GEMINI_API_KEY не вказано")
+        stats = self._site(site)
+        deadline = time.monotonic() + (self.retry_budget if budget is None else budget)
+        chain = self.model_chain(model)
+        stats.calls += 1
+        call_started = time.monotonic()
+        last_error = None
+
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.breaker.allow():
+                if last_error is not None:
+                    stats.errors += 1
+                    raise last_error
+                stats.rejected += 1
+                raise GeminiUnavailable(f"Gemini circuit breaker відкритий ({site})")
+
+            # До invoke breaker не отримає success/failure — half-open проба має звільнитись
+            try:
+                route, wait = self._route(chain)
+                while route is None:
+                    if time.monotonic() + wait > deadline:
+                        stats.errors += 1
+                        if last_error is not None:
+                            raise last_error
+                        raise GeminiUnavailable(f"Gemini: усі ключі/моделі на паузі ({site})")
+                    stats.waited += wait
+                    time.sleep(max(wait, 0.0))
+                    route, wait = self._route(chain)
+
+                if build is not None:
+                    contents, config = build(route)
+                estimate = estimate_tokens(contents, config)
+                slot = self._slot(route.label)
+                self._acquire(slot, stats, estimate, deadline, site)
+            except BaseException:
+                self.breaker.release()
+                raise
+
+            started = time.monotonic()
+            try:
+                response = invoke(route, contents, config)
+            except Exception as e:
+                last_error = e
+                stats.latencies.append(time.monotonic() - started)
+                retryable = is_retryable(e)
+                if is_rate_limited(e):
+                    # Квота одного ключа/моделі — маршрут на паузу, решта пулу і резервні моделі працюють
+                    self.breaker.release()
+                elif retryable:
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()  # API відповів (400/404) — з доступністю все гаразд
+                if not retryable or attempt == self.max_attempts or self.breaker.state == 'open':
+                    stats.errors += 1
+                    self._maybe_log_stats()
+                    raise
+                # (ключ, модель) — на паузу; наступна спроба піде іншим маршрутом або дочекається паузи
+                delay = self._backoff(attempt, retry_delay_hint(e))
+                self._pause(route, delay)
+                stats.retries += 1
+                logger.warning(
+                    f"⚠️ Gemini [{site}] {route.label}/{route.model} помилка (спроба {attempt}/{self.max_attempts}): "
+                    f"{e}. Пауза маршруту {delay:.1f}с"
+                )
+                continue
+
+            latency = time.monotonic() - started
+            stats.latencies.append(latency)
+            stats.ok += 1
+            self.breaker.success()
+            usage = getattr(response, 'usage_metadata', None)
+            total = getattr(usage, 'total_token_count', None)
+            if isinstance(total, int):
+                slot.tokens.adjust(total - estimate)
+            with self._stats_lock:
+                key = f"{route.label}/{route.model}"
+                self._routes[key] = self._routes.get(key, 0) + 1
+            if route.model != model:
+                logger.warning(
+                    f"Gemini [{site}] → {route.label}/{route.model} (резервна модель замість {model}): "
+                    f"{latency:.2f}с, всього {time.monotonic() - call_started:.2f}с"
+                )
+            else:
+                logger.info(
+                    f"Gemini [{site}] → {route.label}/{route.model}: {latency:.2f}с"
+                    + (f", всього {time.monotonic() - call_started:.2f}с" if attempt > 1 else "")
+                )
+            self._maybe_log_stats()
+            return response
+
+    def _acquire(self, slot: _KeySlot, stats: _SiteStats, estimate: int, deadline: float, site: str):
+        """Дочекатися місця в лімітах RPM/TPM ключа (в межах бюджету)."""
+        wait = max(slot.requests.reserve(1), slot.tokens.reserve(estimate))
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            slot.requests.refund(1)
+            slot.tokens.refund(estimate)
+            stats.rejected += 1
+            raise GeminiUnavailable(f"Gemini: клієнтський ліміт {slot.label}, очікування {wait:.1f}с поза бюджетом ({site})")
+        stats.waited += wait
+        logger.info(f"Gemini [{site}]: клієнтський ліміт {slot.label} — чекаємо {wait:.1f}с")
+        time.sleep(wait)
+
+    @staticmethod
+    def _backoff(attempt: int, hint: Optional[float]) -> float:
+        """Експоненційна пауза з jitter; підказка сервера — нижня межа."""
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        return max(delay, hint) if hint is not None else delay
+
+    # ==================== СТАТИСТИКА ====================
+
+    def _site(self, site: str) -> _SiteStats:
+        with self._stats_lock:
+            return self._stats.setdefault(site, _SiteStats())
+
+    def stats(self) -> dict:
+        """{site: {calls, ok, errors, retries, rejected, waited_s, p50_ms, p95_ms}} + маршрути + стан breaker."""
+        with self._stats_lock:
+            result = {site: s.snapshot() for site, s in self._stats.items()}
+            result['routes'] = dict(self._routes)
+        result['keys'] = {slot.label: round(slot.load(), 2) for slot in self._slots}
+        result['breaker'] = self.breaker.state
+        return result
+
+    def _maybe_log_stats(self):
+        now = time.monotonic()
+        if now - self._stats_logged_at < STATS_LOG_INTERVAL:
+            return
+        self._stats_logged_at = now
+        logger.info(f"Gemini статистика: {self.stats()}")
@@ -15,8 +15,18 @@ import io
 import re
 import logging
 import os
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
+from hugeprofit import ProductPidIndex
+from search_index import CatalogIndex, CatalogRetriever, FAQIndex, TriggerMatcher, normalize
+from drive_photos import DriveManifest, PhotoCache, list_folder_tree
+from sheets_writer import QuestionWriteQueue
+from gspread.utils import absolute_range_name, fill_gaps
+from knowledge_base import (
+    KnowledgeBaseCache, RenderedContext, KB_SHEETS, QUESTIONS_SHEET, SNAPSHOT_FILE, build_snapshot,
+    extract_drive_folder_id, is_drive_folder_url, product_name
+)
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -38,12 +48,32 @@ class GoogleSheetsManager:
         self.client = None
         self.spreadsheet = None
         self.drive_service = None
-        # Mapping: Drive file URL → product name (populated during resolve_photo_request)
+        self._credentials = None
+        # Drive service перевірки версії таблиці — свій на кожен потік (фонове оновлення бази знань)
+        self._probe_local = threading.local()
+        # Mapping: Drive file URL → product name (populated from the Drive manifest)
         self._url_product_map: dict = {}  # {url: product_name}
-        # Mapping: product name → Drive folder_id (populated during get_products_context_for_ai)
-        self._product_drive_folder: dict = {}  # {product_name: folder_id}
-        # Cache: folder_id → list of files (to avoid re-listing same folder)
-        self._drive_folder_cache: dict = {}  # {folder_id: [file_dicts]}
+        # Маніфест файлів у Drive папках товарів (лістується у фоні, зберігається на диск)
+        self.drive_manifest = DriveManifest(self._new_drive_service)
+        self.drive_manifest.load()
+        # Версії файлів з маніфесту (file id → md5/modifiedTime) — ключ дискового кешу фото
+        self._file_versions: dict = {}
+        self.photo_cache = PhotoCache()
+        # Спільний кеш бази знань: один розпарсений знімок на всіх споживачів
+        self.kb_cache = KnowledgeBaseCache(
+            self._fetch_knowledge_base,
+            version_probe=self._get_spreadsheet_version,
+            snapshot_file=SNAPSHOT_FILE
+        )
+        # Нові питання для 'Складні_питання' — записуються у фоні пакетами
+        self.question_queue = QuestionWriteQueue(self._load_question_column, self._append_question_rows)
+        # Назви аркушів таблиці (None = ще не відомо; оновлюється якщо аркуш зник/з'явився)
+        self._sheet_titles: set = None
+        # Відрендерений каталог для AI — перебудовується лише при новій версії знімка
+        self._rendered_context: RenderedContext = None
+        # Індекси по знімку (оцінювач релевантності, автомат тригерів, ...) —
+        # перебудовуються лише при новій версії знімка: {назва: (версія, індекс)}
+        self._snapshot_indexes: dict = {}
 
     def _build_url(self) -> str:
         """Побудувати URL з ID таблиці"""
@@ -68,6 +98,7 @@ class GoogleSheetsManager:
             self.spreadsheet = self.client.open_by_url(self.spreadsheet_url)
 
             # Drive API — ті самі credentials
+            self._credentials = creds
             self.drive_service = build('drive', 'v3', credentials=creds)
 
             logger.info("Підключено до Google Sheets")
@@ -96,54 +127,62 @@ class GoogleSheetsManager:
     @staticmethod
     def extract_drive_folder_id(url: str) -> str:
         """Витягти Folder ID з Google Drive посилання на папку."""
-        m = re.search(r'drive\.google\.com/drive/folders/([a-zA-Z0-9_-]+)', url)
-        if m:
-            return m.group(1)
-        return None
+        return extract_drive_folder_id(url)
 
     @staticmethod
     def is_drive_folder_url(url: str) -> bool:
         """Перевірити чи є URL посиланням на папку Google Drive."""
-        return 'drive.google.com/drive/folders/' in url
+        return is_drive_folder_url(url)
 
     def list_folder_files(self, folder_id: str, path_prefix: str = '') -> list:
         """
         Рекурсивно отримати всі файли з папки Google Drive.
 
         Returns:
-            list: [{name, id, path, url}]
+            list: [{name, id, path, url, md5, modified_time}]
                   path — шлях з урахуванням підпапок (напр. "Розмірна сітка/Дівчинка.jpg")
                   url  — https://drive.google.com/uc?id=FILE_ID (для використання в [PHOTO:])
         """
         if not self.drive_service:
             return []
         try:
-            results = self.drive_service.files().list(
-                q=f"'{folder_id}' in parents and trashed=false",
-                fields="files(id, name, mimeType)",
-                orderBy="name"
-            ).execute()
-            files = results.get('files', [])
-            output = []
-            for f in files:
-                full_path = f"{path_prefix}/{f['name']}" if path_prefix else f['name']
-                if f['mimeType'] == 'application/vnd.google-apps.folder':
-                    logger.info(f"Drive: підпапка '{full_path}'")
-                    sub = self.list_folder_files(f['id'], path_prefix=full_path)
-                    output.extend(sub)
-                else:
-                    output.append({
-                        'name': f['name'],
-                        'id': f['id'],
-                        'path': full_path,
-                        'url': f"https://drive.google.com/uc?id={f['id']}"
-                    })
-                    logger.info(f"Drive: файл '{full_path}' → id={f['id']}")
-            return output
+            return list_folder_tree(self.drive_service, folder_id, path_prefix)
         except Exception as e:
             logger.error(f"Помилка listування папки {folder_id}: {e}")
             return []
 
+    def _new_drive_service(self):
+        """Окремий Drive service для потоку (httplib2 не потокобезпечний)."""
+        if not self._credentials:
+            return None
+        return build('drive', 'v3', credentials=self._credentials, cache_discovery=False)
+
+    def start_drive_sync(self):
+        """Фонова синхронізація маніфесту Drive папок товарів (перша — одразу після старту)."""
+        self._index_manifest_urls()
+        self.drive_manifest.start_background_sync(
+            lambda: self.kb_cache.get().drive_folders,
+            on_synced=self._index_manifest_urls
+        )
+
+    def _index_manifest_urls(self):
+        """Заповнити url → товар (валідація фото) і file id → версія (кеш фото) з маніфесту."""
+        for product, folder_id in self.kb_cache.snapshot.drive_folders.items():
+            for f in self.drive_manifest.get(folder_id) or ():
+                self._url_product_map[f['url']] = product
+                self._file_versions[f['id']] = f.get('md5') or f.get('modified_time', '')
+
+    def _get_folder_files(self, folder_id: str, product_name: str) -> list:
+        """Файли папки товару: з маніфесту, або (ще не лістували) — лістування зараз."""
+        files = self.drive_manifest.get(folder_id)
+        if files is None:
+            logger.info(f"Drive: папки '{product_name}' ще немає в маніфесті — лістуємо зараз")
+            files = self.drive_manifest.list_folder(folder_id, [product_name])
+            for f in files:
+                self._url_product_map[f['url']] = product_name
+                self._file_versions[f['id']] = f.get('md5') or f.get('modified_time', '')
+        return files
+
     def download_drive_file(self, url: str) -> bytes:
         """
         Завантажити файл з Google Drive через API (не публічне посилання).
@@ -178,127 +217,117 @@ class GoogleSheetsManager:
             logger.error(f"Помилка завантаження з Drive (file_id={file_id}): {e}")
             return None
 
+    def get_drive_photo_path(self, url: str) -> str | None:
+        """
+        Локальний шлях до фото з Google Drive через дисковий кеш (без завантаження, якщо
+        ця версія файлу вже є на диску). None — не Drive файл або не вдалося завантажити.
+        """
+        if not self.drive_service:
+            return None
+        file_id = self.extract_drive_file_id(url)
+        if not file_id:
+            return None
+        version = self._file_versions.get(file_id) or self._get_drive_file_version(file_id)
+        if not version:
+            return None
+        return self.photo_cache.get_or_fetch(file_id, version, lambda: self.download_drive_file(url))
+
+    def _get_drive_file_version(self, file_id: str) -> str:
+        """md5/modifiedTime файлу поза маніфестом (пряме посилання в колонці 'Фото')."""
+        try:
+            meta = self.drive_service.files().get(
+                fileId=file_id, fields="md5Checksum, modifiedTime", supportsAllDrives=True
+            ).execute()
+            return meta.get('md5Checksum') or meta.get('modifiedTime', '')
+        except Exception as e:
+            logger.warning(f"Drive: не вдалося отримати версію файлу {file_id}: {e}")
+            return ''
+
     # ==================== КАТАЛОГ ТОВАРІВ ====================
 
     def get_products(self) -> list:
         """
-        Отримати всі товари з аркуша "Каталог"
-
-        Очікувані колонки (з Excel):
-        - Назва
-        - Куди носити
-        - Матеріал
-        - Опис товару
-        - Кольори
-        - Доступні розміри
-        - Ціна
-        - Акція - 15%
-        - Супутні товари
-        - Примітка
-        - Фото URL (опціонально — посилання на фото товару)
+        Отримати всі товари з аркуша "Каталог" (з кешу бази знань — без запиту до Google,
+        якщо знімок свіжий). Товари незмінні (Product) — спільні для всіх споживачів.
 
         Returns:
-            list: [{назва, матеріал, ціна, ...}, ...]
+            list: [Product({назва, матеріал, ціна, ...}), ...]
         """
-        try:
-            worksheet = self.spreadsheet.worksheet("Каталог")
-            data = worksheet.get_all_values()
-
-            if len(data) < 2:
-                logger.warning("Каталог порожній")
-                return []
-
-            # Знаходимо рядок з заголовками (може бути не перший)
-            headers = None
-            header_row_idx = 0
-            for i, row in enumerate(data):
-                if 'Назва' in row or 'Назва ' in row:
-                    headers = [h.strip() for h in row]
-                    header_row_idx = i
-                    break
+        return list(self.kb_cache.get().products)
+
+    def invalidate_cache(self):
+        """Примусово оновити базу знань при наступному зверненні (напр. після редагування таблиці)."""
+        self.kb_cache.invalidate()
+
+    # ==================== ЗАВАНТАЖЕННЯ БАЗИ ЗНАНЬ ====================
 
-            if not headers:
-                logger.warning("Заголовки не знайдено")
-                return []
-
-            products = []
-            current_product = None
-
-            for row in data[header_row_idx + 1:]:
-                if not row or not any(row):
-                    continue
-
-                # Якщо є назва - це новий товар
-                name_idx = headers.index('Назва') if 'Назва' in headers else headers.index('Назва ')
-                if row[name_idx] and row[name_idx].strip():
-                    # Зберігаємо попередній товар
-                    if current_product:
-                        products.append(current_product)
-
-                    current_product = {}
-                    for i, header in enumerate(headers):
-                        if i < len(row) and row[i]:
-                            current_product[header] = row[i]
-
-                    # Ініціалізуємо список цін по розмірам
-                    current_product['prices_by_size'] = []
-                    size_col = None
-                    price_col = None
-                    discount_col = None
-                    for i, h in enumerate(headers):
-                        if 'розмір' in h.lower():
-                            size_col = i
-                        if 'ціна' in h.lower() and 'акція' not in h.lower():
-                            price_col = i
-                        if 'акція' in h.lower():
-                            discount_col = i
-
-                    if size_col is not None and price_col is not None:
-                        if row[size_col] and row[price_col]:
-                            discount_val = ''
-                            if discount_col is not None and discount_col < len(row):
-                                discount_val = row[discount_col].strip()
-                            current_product['prices_by_size'].append({
-                                'sizes': row[size_col],
-                                'price': row[price_col],
-                                'discount': discount_val
-                            })
-
-                elif current_product:
-                    # Додатковий рядок з розмірами/цінами для поточного товару
-                    size_col = None
-                    price_col = None
-                    discount_col = None
-                    for i, h in enumerate(headers):
-                        if 'розмір' in h.lower():
-                            size_col = i
-                        if 'ціна' in h.lower() and 'акція' not in h.lower():
-                            price_col = i
-                        if 'акція' in h.lower():
-                            discount_col = i
-
-                    if size_col is not None and price_col is not None:
-                        if len(row) > size_col and len(row) > price_col:
-                            if row[size_col] and row[price_col]:
-                                discount_val = ''
-                                if discount_col is not None and discount_col < len(row):
-                                    discount_val = row[discount_col].strip()
-                                current_product['prices_by_size'].append({
-                                    'sizes': row[size_col],
-                                    'price': row[price_col],
-                                    'discount': discount_val
-                                })
-
-            # Додаємо останній товар
-            if current_product:
-                products.append(current_product)
-
-            logger.info(f"Завантажено {len(products)} товарів")
-            return products
+    def _get_sheet_titles(self, refresh: bool = False) -> set:
+        """Назви аркушів таблиці (один запит метаданих, далі — з пам'яті)."""
+        if self._sheet_titles is None or refresh:
+            self._sheet_titles = {ws.title for ws in self.spreadsheet.worksheets()}
+        return self._sheet_titles
 
+    def _get_spreadsheet_version(self) -> str:
+        """
+        Версія файлу таблиці з Drive API (маленький запит метаданих, без значень клітинок).
+        Змінюється при кожному редагуванні — використовується для пропуску повного
+        завантаження, якщо таблиця не змінювалась. None — якщо Drive API недоступний.
+        """
+        if not self.drive_service or not self.spreadsheet:
+            return None
+        # Викликається з потоку 'knowledge-base-refresh' — не ділимо self.drive_service з основним потоком
+        service = getattr(self._probe_local, 'drive', None)
+        if service is None:
+            service = self._probe_local.drive = self._new_drive_service()
+        if service is None:
+            return None
+        meta = service.files().get(
+            fileId=self.spreadsheet.id,
+            fields="version, modifiedTime",
+            supportsAllDrives=True
+        ).execute()
+        return f"{meta.get('version', '')}:{meta.get('modifiedTime', '')}"
+
+    def _batch_get_sheets(self) -> dict:
+        """
+        Завантажити всі аркуші бази знань ОДНИМ запитом values:batchGet.
+        Відсутні аркуші пропускаються (їх немає в результаті).
+
+        Returns:
+            dict: {назва_аркуша: [[клітинки рядка], ...]}
+        """
+        titles = [t for t in KB_SHEETS if t in self._get_sheet_titles()]
+        try:
+            response = self.spreadsheet.values_batch_get([absolute_range_name(t) for t in titles])
+        except gspread.exceptions.APIError:
+            # Аркуш могли перейменувати/видалити — оновлюємо список і пробуємо ще раз
+            titles = [t for t in KB_SHEETS if t in self._get_sheet_titles(refresh=True)]
+            response = self.spreadsheet.values_batch_get([absolute_range_name(t) for t in titles])
+
+        sheets = {}
+        for title, value_range in zip(titles, response.get('valueRanges', [])):
+            values = value_range.get('values', [])
+            # Вирівнюємо рядки як get_all_values() (API обрізає порожні клітинки в кінці)
+            sheets[title] = fill_gaps(values) if values else []
+        return sheets
+
+    def _fetch_knowledge_base(self):
+        """
+        Завантажити та розпарсити всю базу знань (мережевий запит).
+        При помилці кидає виняток — кеш тоді залишає попередній знімок.
+        """
+        if self.spreadsheet is None:
+            raise RuntimeError("Google Sheets ще не підключено")
+        try:
+            sheets = self._batch_get_sheets()
         except Exception as e:
-            logger.error(f"Помилка читання каталогу: {e}")
-            return []
+            logger.error(f"Помилка читання бази знань: {e}")
+            raise
+        snapshot = build_snapshot(sheets)
+        for title in sorted(snapshot.missing_sheets):
+            logger.info(f"Аркуш '{title}' не знайдено — пропускаємо")
+        logger.info(f"Завантажено {len(snapshot.products)} товарів")
+        return snapshot
 
     def find_product_by_name(self, query: str) -> dict:
         """
@@ -311,40 +340,22 @@ class GoogleSheetsManager:
         Returns:
             dict: Дані товару або None
         """
-        products = self.get_products()
-        query_lower = query.lower().strip()
-
-        # 1. Прямий пошук: query в назві/артикулі/категорії
-        for product in products:
-            name = product.get('Назва', product.get('Назва ', '')).lower()
-            artikul = product.get('Артикул', '').lower()
-            category = product.get('Категорія', '').lower()
-
-            if query_lower in name or query_lower in artikul or query_lower in category:
-                logger.info(f"Знайдено товар (прямий): {product.get('Назва', product.get('Назва '))}")
-                return product
-
-        # 2. Зворотний пошук: назва товару або її ключові слова в query
-        for product in products:
-            name = product.get('Назва', product.get('Назва ', '')).lower().strip()
-            if not name:
-                continue
-
-            # Повна назва в query
-            if name in query_lower:
-                logger.info(f"Знайдено товар (назва в запиті): {product.get('Назва', product.get('Назва '))}")
-                return product
-
-            # Ключові слова з назви (без лапок, мін 3 символи)
-            name_words = [w.strip('"\'«»()') for w in name.split() if len(w.strip('"\'«»()')) >= 3]
-            for word in name_words:
-                if word in query_lower:
-                    logger.info(f"Знайдено товар (слово '{word}' в запиті): {product.get('Назва', product.get('Назва '))}")
-                    return product
-
+        match = self.get_catalog_index().best(query)
+        if match:
+            logger.info(f"Знайдено товар ({match.kind}, {match.score:.1f}): {product_name(match.product)}")
+            return match.product
         logger.info(f"Товар не знайдено: {query[:80]}")
         return None
 
+    def search_products(self, query: str, limit: int = 5) -> list:
+        """
+        Ранжовані кандидати для запиту/повідомлення клієнта.
+
+        Returns:
+            list: [ProductMatch(index, product, score, kind)] за спаданням оцінки
+        """
+        return self.get_catalog_index().search(query, limit=limit)
+
     def find_products_by_category(self, category: str) -> list:
         """
         Пошук товарів за категорією
@@ -355,15 +366,7 @@ class GoogleSheetsManager:
         Returns:
             list: Список товарів
         """
-        products = self.get_products()
-        category_lower = category.lower().strip()
-
-        result = []
-        for product in products:
-            prod_category = product.get('Категорія', '').lower()
-            if category_lower in prod_category:
-                result.append(product)
-
+        result = self.get_catalog_index().by_category(category)
         logger.info(f"Знайдено {len(result)} товарів в категорії '{category}'")
         return result
 
@@ -377,21 +380,17 @@ class GoogleSheetsManager:
         Returns:
             list: Список товарів з таким розміром
         """
-        products = self.get_products()
-        size_lower = size.lower().strip()
-
-        result = []
-        for product in products:
-            sizes = product.get('Розміри', '').lower()
-            if size_lower in sizes:
-                result.append(product)
-
+        result = self.get_catalog_index().by_size(size)
         logger.info(f"Знайдено {len(result)} товарів з розміром '{size}'")
         return result
 
+    def get_catalog_index(self) -> CatalogIndex:
+        """Індекс пошуку товарів по поточному знімку (перебудовується лише при новій версії)."""
+        return self._snapshot_index('catalog', self.kb_cache.get(), lambda s: CatalogIndex(s.products))
+
     def get_price_for_size(self, product: dict, size_query: str) -> dict:
         """
-        Отримати ціну для конкретного розміру
+        Отримати ціну для конкретного розміру (пошук у попередньо обчисленій таблиці цін товару)
 
         Args:
             product: Товар з get_products()
@@ -399,27 +398,34 @@ class GoogleSheetsManager:
 
         Returns:
             dict: {'sizes': '152-158, 158-164', 'price': '1700 грн', 'discount_price': '1445 грн'}
+                  discount_price — ціна з акцією з колонки "Акція" (як у каталозі для AI)
         """
-        prices_by_size = product.get('prices_by_size', [])
-        size_query_lower = size_query.lower().strip()
-
-        for price_info in prices_by_size:
-            sizes = price_info.get('sizes', '').lower()
-            if size_query_lower in sizes:
-                result = {
-                    'sizes': price_info.get('sizes'),
-                    'price': price_info.get('price')
-                }
-                # Розраховуємо знижку 15%
-                try:
-                    price_num = int(''.join(filter(str.isdigit, price_info.get('price', '0'))))
-                    discount_price = int(price_num * 0.85)
-                    result['discount_price'] = f"{discount_price} грн"
-                except:
-                    pass
-                return result
+        block = product.price_for_size(size_query)
+        if block is None:
+            return None
+        result = {
+            'sizes': block.sizes,
+            'price': block.price
+        }
+        if block.final_price is not None:
+            result['discount_price'] = f"{block.final_price} грн"
+        return result
 
-        return None
+    def get_order_line_price(self, line: str):
+        """
+        Кінцева ціна (з акцією) для рядка замовлення "Назва товару розмір колір" —
+        з таблиці цін товару зі знімка (ті самі числа, що й у каталозі для AI).
+
+        Returns:
+            int: ціна в грн або None (товар/розмір не знайдено)
+        """
+        match = self.get_catalog_index().best(line, kinds=CatalogIndex.NAME_KINDS)
+        if not match:
+            return None
+        # Розмір шукаємо в тексті без назви товару (назва може містити цифри)
+        rest = normalize(line).replace(normalize(match.product.name), ' ')
+        block = match.product.price_for_size(rest)
+        return block.final_price if block else None
 
     def get_related_products(self, product: dict) -> list:
         """
@@ -448,126 +454,70 @@ class GoogleSheetsManager:
 
     # ==================== ШАБЛОНИ ====================
 
-    def get_templates(self) -> dict:
+    def get_templates(self, snapshot=None) -> dict:
         """Отримати шаблони відповідей з аркуша 'Шаблони'. Якщо немає — повертає {}."""
-        try:
-            worksheet = self.spreadsheet.worksheet("Шаблони")
-            data = worksheet.get_all_values()
-            templates = {}
-            for row in data[1:]:
-                if len(row) >= 2 and row[0] and row[1]:
-                    templates[row[0].strip()] = row[1]
-            logger.info(f"Завантажено {len(templates)} шаблонів")
-            return templates
-        except gspread.exceptions.WorksheetNotFound:
-            logger.info("Аркуш 'Шаблони' не знайдено — пропускаємо")
-            return {}
-        except Exception as e:
-            logger.info(f"Аркуш 'Шаблони' недоступний: {e}")
-            return {}
+        return (snapshot or self.kb_cache.get()).templates
 
     # ==================== ЛОГІКА ПОВЕДІНКИ ====================
 
-    def get_behavior_rules(self) -> list:
+    def get_behavior_rules(self, snapshot=None) -> list:
         """Отримати правила поведінки з аркуша 'Логіка'. Якщо немає — повертає []."""
-        try:
-            worksheet = self.spreadsheet.worksheet("Логіка")
-            data = worksheet.get_all_values()
-            if len(data) < 2:
-                return []
-            headers = data[0]
-            rules = []
-            for row in data[1:]:
-                if not row or not any(row):
-                    continue
-                rule = {}
-                for i, header in enumerate(headers):
-                    if i < len(row):
-                        rule[header] = row[i]
-                triggers_str = rule.get('Тригери', '')
-                rule['triggers_list'] = [t.strip().lower() for t in triggers_str.split(',') if t.strip()]
-                rules.append(rule)
-            logger.info(f"Завантажено {len(rules)} правил поведінки")
-            return rules
-        except gspread.exceptions.WorksheetNotFound:
-            logger.info("Аркуш 'Логіка' не знайдено — пропускаємо")
-            return []
-        except Exception as e:
-            logger.info(f"Аркуш 'Логіка' недоступний: {e}")
-            return []
+        return [rule.fields for rule in (snapshot or self.kb_cache.get()).rules]
 
     def check_triggers(self, message: str) -> dict:
         """Перевірити тригерні слова. Якщо аркуша немає — повертає None (AI відповість сама)."""
-        rules = self.get_behavior_rules()
-        if not rules:
+        snapshot = self.kb_cache.get()
+        if not snapshot.rules:
             return None
-        message_lower = message.lower().strip()
-        for rule in rules:
-            for trigger in rule.get('triggers_list', []):
-                if trigger in message_lower:
-                    logger.info(f"Спрацював тригер '{trigger}' → '{rule.get('Ситуація')}'")
-                    return rule
-        return None
+        matcher = self._snapshot_index('triggers', snapshot, lambda s: TriggerMatcher(
+            [rule.triggers for rule in s.rules]
+        ))
+        match = matcher.first(message.lower().strip())
+        if match is None:
+            return None
+        rule = snapshot.rules[match.rule_index]
+        logger.info(f"Спрацював тригер '{match.trigger}' → '{rule.situation}'")
+        return rule.fields
 
     # ==================== СКЛАДНІ ПИТАННЯ ====================
 
     def get_complex_questions(self) -> dict:
         """Отримати відповіді на складні питання з аркуша 'Складні_питання'. Якщо немає — повертає {}."""
-        try:
-            worksheet = self.spreadsheet.worksheet("Складні_питання")
-            data = worksheet.get_all_values()
-            questions = {}
-            for row in data[1:]:
-                if len(row) >= 2 and row[0] and row[1]:
-                    questions[row[0].strip().lower()] = row[1]
-            logger.info(f"Завантажено {len(questions)} складних питань")
-            return questions
-        except gspread.exceptions.WorksheetNotFound:
-            logger.info("Аркуш 'Складні_питання' не знайдено — пропускаємо")
-            return {}
-        except Exception as e:
-            logger.info(f"Аркуш 'Складні_питання' недоступний: {e}")
-            return {}
+        return self.kb_cache.get().complex_questions
 
     def find_answer_for_question(self, question: str) -> str:
         """Пошук відповіді на складне питання. Якщо немає — повертає None (AI відповість сама)."""
-        questions = self.get_complex_questions()
-        if not questions:
+        snapshot = self.kb_cache.get()
+        if not snapshot.complex_questions:
             return None
-        question_lower = question.lower().strip()
-        for stored_q, answer in questions.items():
-            if question_lower in stored_q or stored_q in question_lower:
-                return answer
-        return None
+        index = self._snapshot_index('faq', snapshot, lambda s: FAQIndex(s.complex_questions))
+        match = index.best(question)
+        if match is None:
+            return None
+        logger.info(f"Готова відповідь: '{match.question}' (впевненість {match.confidence:.2f})")
+        return match.answer
 
     def save_unanswered_question(self, question: str, username: str = "") -> bool:
         """
         Зберегти нове питання в аркуш 'Складні_питання' (колонка A).
         Колонка B (відповідь) залишається порожньою — менеджер заповнить пізніше.
         Дедуплікація: не додає якщо таке питання вже є.
+        Запис відкладений (QuestionWriteQueue): питання ставиться в чергу миттєво,
+        у таблицю потрапляє пакетом у фоні.
         """
-        try:
-            worksheet = self.spreadsheet.worksheet("Складні_питання")
-
-            # Перевіряємо чи таке питання вже є (дедуплікація)
-            existing = worksheet.col_values(1)  # Колонка A
-            question_stripped = question.strip()
-            for existing_q in existing:
-                if existing_q.strip().lower() == question_stripped.lower():
-                    logger.info(f"Питання вже є в Складні_питання: '{question_stripped[:60]}'")
-                    return False
-
-            # Додаємо нове питання (A=питання, B=порожньо, C=username)
-            worksheet.append_row([question_stripped, "", username])
-            logger.info(f"Збережено нове питання в Складні_питання: '{question_stripped[:60]}' (від {username})")
-            return True
+        return self.question_queue.enqueue(question, username)
 
-        except gspread.exceptions.WorksheetNotFound:
-            logger.warning("Аркуш 'Складні_питання' не знайдено — не можу зберегти питання")
-            return False
-        except Exception as e:
-            logger.warning(f"Помилка збереження питання: {e}")
-            return False
+    def _load_question_column(self) -> list:
+        """Колонка A аркуша 'Складні_питання' (для дедуплікації черги питань)."""
+        if self.spreadsheet is None:
+            raise RuntimeError("Google Sheets ще не підключено")
+        return self.spreadsheet.worksheet(QUESTIONS_SHEET).col_values(1)
+
+    def _append_question_rows(self, rows: list):
+        """Дописати рядки (A=питання, B=порожньо, C=username) одним запитом."""
+        if self.spreadsheet is None:
+            raise RuntimeError("Google Sheets ще не підключено")
+        self.spreadsheet.worksheet(QUESTIONS_SHEET).append_rows(rows)
 
     # ==================== ФОТО ТОВАРІВ ====================
 
@@ -582,32 +532,25 @@ class GoogleSheetsManager:
         Returns:
             str: URL фото або None
         """
-        products = self.get_products()
-        if not products:
+        # Точне або часткове співпадіння назви
+        match = self.get_catalog_index().best(product_name, kinds=CatalogIndex.NAME_KINDS)
+        if match:
+            product = match.product
+            # Шукаємо URL фото в різних можливих колонках
+            photo_url = (
+                product.get('Фото URL') or
+                product.get('Фото') or
+                product.get('Фото URL ') or
+                product.get('Photo URL') or
+                product.get('Зображення') or
+                ''
+            ).strip()
+            if photo_url:
+                logger.info(f"Знайдено фото для '{product_name}': {photo_url[:80]}")
+                return photo_url
+            logger.info(f"Товар '{product_name}' знайдено, але фото URL відсутній")
             return None
 
-        query_lower = product_name.lower().strip().strip('"\'«»')
-
-        for product in products:
-            name = product.get('Назва', product.get('Назва ', '')).lower().strip()
-            # Точне або часткове співпадіння
-            if query_lower in name or name in query_lower:
-                # Шукаємо URL фото в різних можливих колонках
-                photo_url = (
-                    product.get('Фото URL') or
-                    product.get('Фото') or
-                    product.get('Фото URL ') or
-                    product.get('Photo URL') or
-                    product.get('Зображення') or
-                    ''
-                ).strip()
-                if photo_url:
-                    logger.info(f"Знайдено фото для '{product_name}': {photo_url[:80]}")
-                    return photo_url
-                else:
-                    logger.info(f"Товар '{product_name}' знайдено, але фото URL відсутній")
-                    return None
-
         logger.info(f"Товар '{product_name}' не знайдено для фото")
         return None
 
@@ -622,12 +565,37 @@ class GoogleSheetsManager:
 
         Returns: URL або None
         """
-        # Знайти folder_id для товару
-        folder_id = self._product_drive_folder.get(product_name)
+        index = self._get_photo_index(product_name)
+        if index is None:
+            return None
+        url = index.resolve(category, color)
+        if url:
+            logger.info(f"resolve_photo_request: '{product_name}/{category}/{color}' → {url[:80]}")
+            return url
+        logger.warning(f"resolve_photo_request: файл не знайдено для '{product_name}/{category}/{color}'")
+        return None
+
+    def resolve_album_request(self, product_name: str, category: str, colors: list) -> list:
+        """
+        Lazy Drive lookup для альбому: повертає список URL для кількох кольорів
+        (один пошук папки й індексу на весь альбом).
+        """
+        index = self._get_photo_index(product_name)
+        if index is None:
+            return []
+        urls = index.resolve_many(category, [color.strip() for color in colors])
+        logger.info(f"resolve_album_request: '{product_name}/{category}' {len(colors)} кольорів → {len(urls)} фото")
+        return urls
+
+    def _get_photo_index(self, product_name: str):
+        """Індекс фото папки товару (з маніфесту) або None, якщо папки/файлів немає."""
+        # Знайти folder_id для товару (мапа будується разом зі знімком бази знань)
+        drive_folders = self.kb_cache.get().drive_folders
+        folder_id = drive_folders.get(product_name)
         if not folder_id:
             # Пробуємо fuzzy-пошук по назві товару
             name_lower = product_name.lower().strip().strip('"\'«»')
-            for pname, fid in self._product_drive_folder.items():
+            for pname, fid in drive_folders.items():
                 if name_lower in pname.lower() or pname.lower().strip('"\'«»') in name_lower:
                     folder_id = fid
                     break
@@ -635,228 +603,79 @@ class GoogleSheetsManager:
             logger.warning(f"resolve_photo_request: folder_id не знайдено для '{product_name}'")
             return None
 
-        # Lazy listing з кешем (не лістуємо двічі ту саму папку за сесію)
-        if folder_id not in self._drive_folder_cache:
-            files = self.list_folder_files(folder_id)
-            self._drive_folder_cache[folder_id] = files
-            # Також заповнюємо _url_product_map для валідації фото
-            for f in files:
-                self._url_product_map[f['url']] = product_name
-            logger.info(f"Drive: закешовано {len(files)} файлів для '{product_name}'")
-        else:
-            files = self._drive_folder_cache[folder_id]
-
-        if not files:
+        # Файли з маніфесту (лістується у фоні) — без запиту до Drive
+        if not self._get_folder_files(folder_id, product_name):
             return None
-
-        cat_lower = (category or '').strip().lower()
-        color_lower = (color or '').strip().lower()
-        is_root = cat_lower in ('root', '', 'none')
-
-        # Фільтруємо кандидатів: підходяща категорія, не Розмірна сітка
-        candidates = []
-
-        def colors_match(requested: str, file_color: str) -> bool:
-            req = requested.lower().strip()
-            fcl = file_color.lower().strip()
-            if not req or not fcl:
-                return False
-            # Синоніми кольорів
-            synonyms = {
-                'блакитний': ['електрик', 'електник', 'синій', 'голубий'],
-                'синій': ['електрик', 'електник', 'блакитний'],
-                'електрик': ['блакитний', 'синій', 'електник'],
-                'електник': ['електрик', 'блакитний', 'синій'],
-                'червоний': ['бордо', 'марсала'],
-                'зелений': ['хакі', 'олива']
-            }
-            # Перевіряємо синоніми запиту
-            req_variants = [req]
-            for k, v in synonyms.items():
-                if req in k or k in req:
-                    req_variants.extend(v)
-
-            for variant in req_variants:
-                if variant in fcl or fcl in variant:
-                    return True
-                if len(variant) >= 4 and len(fcl) >= 4 and variant[:4] == fcl[:4]:
-                    return True
-            return False
-
-        for f in files:
-            path = f['path']  # напр. "Дівчинка/Шоколадний.jpg"
-            parts = path.split('/')
-            if len(parts) == 1:
-                file_cat = 'root'
-                file_name = parts[0]
-            else:
-                file_cat = parts[0].lower()
-                file_name = parts[-1]
-            if 'розмірна сітка' in file_cat:
-                continue
-            # Категорія
-            if is_root:
-                # В ідеалі при root шукаємо спочатку в корені, але якщо не знайдемо - fallback нижче
-                if file_cat != 'root':
-                    continue
-            else:
-                if file_cat != cat_lower:
-                    continue
-            # Колір — ім'я файлу без розширення містить колір (або навпаки)
-            name_no_ext = file_name.rsplit('.', 1)[0].lower()
-            if colors_match(color_lower, name_no_ext):
-                candidates.append(f)
-
-        if not candidates:
-            # Fallback: шукаємо в будь-якій категорії
-            for f in files:
-                path = f['path']
-                parts = path.split('/')
-                file_name = parts[-1]
-                if 'розмірна сітка' in path.lower():
-                    continue
-                name_no_ext = file_name.rsplit('.', 1)[0].lower()
-                if colors_match(color_lower, name_no_ext):
-                    candidates.append(f)
-
-        if not candidates:
-            # Останній fallback: перше фото не з розмірної сітки
-            for f in files:
-                if 'розмірна сітка' not in f['path'].lower():
-                    if is_root and '/' not in f['path']:
-                        candidates.append(f)
-                        break
-                    elif not is_root and f['path'].lower().startswith(cat_lower + '/'):
-                        candidates.append(f)
-                        break
-
-        if candidates:
-            url = candidates[0]['url']
-            logger.info(f"resolve_photo_request: '{product_name}/{category}/{color}' → {url[:80]}")
-            return url
-
-        logger.warning(f"resolve_photo_request: файл не знайдено для '{product_name}/{category}/{color}'")
-        return None
-
-    def resolve_album_request(self, product_name: str, category: str, colors: list) -> list:
-        """
-        Lazy Drive lookup для альбому: повертає список URL для кількох кольорів.
-        """
-        urls = []
-        seen = set()
-        for color in colors:
-            url = self.resolve_photo_request(product_name, category, color.strip())
-            if url and url not in seen:
-                urls.append(url)
-                seen.add(url)
-        return urls
+        return self.drive_manifest.photo_index(folder_id)
 
     # ==================== КОНТЕКСТ ДЛЯ AI ====================
 
-    def get_products_context_for_ai(self, query: str = None) -> str:
+    def get_products_context_for_ai(self, query: str = None, snapshot=None) -> str:
         """
         Отримати ПОВНИЙ каталог товарів з усіма деталями для AI.
         AI сама визначає який товар підходить під запит клієнта.
+        Рендер кешується за версією знімка — на кожне повідомлення лише перевірка версії.
+
+        Args:
+            snapshot: знімок бази знань (за замовчуванням — поточний)
 
         Returns:
             str: Повний каталог товарів для system prompt
         """
-        products = self.get_products()
-        if not products:
-            return "Каталог товарів порожній."
+        return self._get_rendered_context(snapshot).text
 
-        logger.info(f"Завантажено {len(products)} товарів")
+    def get_products_context_slice(self, message: str, history: list = None, top_k: int = 8,
+                                   snapshot=None) -> str:
+        """
+        Каталог лише з товарами, релевантними до розмови (top_k з повними деталями)
+        + короткий список назв решти товарів. Менше токенів ніж повний каталог.
 
-        result = "== ПОВНИЙ КАТАЛОГ ТОВАРІВ (шукай товар ТІЛЬКИ тут) ==\n\n"
-        for i, p in enumerate(products, 1):
-            name = p.get('Назва', p.get('Назва ', 'N/A'))
-            hp_id = p.get('ID Товара', '').strip()
-            result += f"📦 {i}. {name}"
-            if hp_id:
-                result += f" [HugeProfit ID: {hp_id}]"
-            result += "\n"
-
-            where_to_wear = p.get('Куди носити', p.get('Куди носити ', ''))
-            if where_to_wear:
-                result += f"   Куди носити: {where_to_wear}\n"
-
-            material = p.get('Матеріал', '')
-            if material:
-                result += f"   Матеріал: {material}\n"
-
-            description = p.get('Опис товару', '')
-            if description:
-                result += f"   Опис: {description}\n"
-
-            colors = p.get('Кольори', p.get('Кольри', ''))
-            if colors:
-                result += f"   Кольори: {colors}\n"
-
-            sizes = p.get('Доступні розміри', '')
-            if sizes:
-                result += f"   Розміри: {sizes}\n"
-
-            related = p.get('Супутні товари', '')
-            if related:
-                result += f"   Супутні товари: {related}\n"
-
-            note = p.get('Примітка', '')
-            if note:
-                result += f"   Примітка: {note}\n"
-
-            # Фото — НЕ йдемо в Drive тут. Drive викликається ЛИШЕ при відправці фото.
-            photo_raw = (
-                p.get('Фото URL') or p.get('Фото') or
-                p.get('Фото URL ') or p.get('Photo URL') or ''
-            ).strip()
-            if photo_raw:
-                if self.is_drive_folder_url(photo_raw):
-                    # Зберігаємо folder_id для lazy-resolve
-                    folder_id = self.extract_drive_folder_id(photo_raw)
-                    if folder_id:
-                        self._product_drive_folder[name] = folder_id
-                        result += (
-                            f"   Фото файли: є Drive папка.\n"
-                            f"     Щоб показати фото постав маркер:\n"
-                            f"     [PHOTO_REQUEST:{name}/категорія/колір]\n"
-                            f"     де «категорія» = Дівчинка / Хлопчик / Підліток / Дорослі / root\n"
-                            f"     (обирай залежно від стать/вік клієнта; «root» якщо невідомо)\n"
-                            f"     «колір» — точно з поля «Кольори» цього товару.\n"
-                            f"     Для альбому: [ALBUM_REQUEST:{name}/категорія/колір1 колір2 колір3]\n"
-                        )
-                    else:
-                        result += f"   Фото: {photo_raw}\n"
-                else:
-                    result += f"   Фото: {photo_raw}\n"
-
-            # Ціни по розмірам
-            prices = p.get('prices_by_size', [])
-            if prices:
-                result += "   Ціни:\n"
-                for pr in prices:
-                    price_str = pr.get('price', '')
-                    discount_str = pr.get('discount', '').replace('%', '').strip()
-                    try:
-                        price_num = int(''.join(filter(str.isdigit, price_str)))
-                        # Знижка з колонки "Акція" (0 або порожньо = без знижки)
-                        discount_pct = 0
-                        if discount_str:
-                            try:
-                                discount_pct = int(discount_str)
-                            except ValueError:
-                                pass
-                        if discount_pct > 0:
-                            discounted = int(price_num * (1 - discount_pct / 100))
-                            result += f"     {pr.get('sizes')}: {price_str} (акція -{discount_pct}%: {discounted} грн)\n"
-                        else:
-                            result += f"     {pr.get('sizes')}: {price_str}\n"
-                    except Exception:
-                        result += f"     {pr.get('sizes')}: {price_str}\n"
-
-            result += "\n"
-
-        result += "== КІНЕЦЬ КАТАЛОГУ. Називай ТІЛЬКИ товари з цього списку! ==\n"
-        return result
+        Args:
+            message: поточне повідомлення клієнта
+            history: попередні повідомлення розмови (тексти, від старих до нових)
+            top_k: скільки товарів показати з повними деталями
+            snapshot: знімок бази знань (за замовчуванням — поточний)
+        """
+        snapshot = snapshot or self.kb_cache.get()
+        rendered = self._get_rendered_context(snapshot)
+        retriever = self._snapshot_index('retriever', snapshot, lambda s: CatalogRetriever(s.products))
+        selected = retriever.top_k(message, history, k=top_k)
+        logger.info(
+            f"Каталог для AI: {len(selected)}/{len(snapshot.products)} релевантних товарів "
+            f"({[retriever.names[i] for i in selected]})"
+        )
+        return rendered.render_slice(snapshot.products, selected)
+
+    def get_products_context_stats(self) -> dict:
+        """Розмір відрендереного каталогу (байти / приблизні токени) — для моніторингу росту промпту."""
+        rendered = self._get_rendered_context()
+        return {
+            'version': rendered.version,
+            'products': len(self.kb_cache.snapshot.products),
+            'size_bytes': rendered.size_bytes,
+            'approx_tokens': rendered.approx_tokens,
+        }
+
+    def _snapshot_index(self, name: str, snapshot, build):
+        """Індекс, побудований по знімку бази знань (build(snapshot)), — один на версію знімка."""
+        cached = self._snapshot_indexes.get(name)
+        if cached is not None and cached[0] == snapshot.version:
+            return cached[1]
+        index = build(snapshot)
+        self._snapshot_indexes[name] = (snapshot.version, index)
+        return index
+
+    def _get_rendered_context(self, snapshot=None) -> RenderedContext:
+        snapshot = snapshot or self.kb_cache.get()
+        rendered = self._rendered_context
+        if rendered is None or rendered.version != snapshot.version:
+            rendered = RenderedContext.render(snapshot)
+            self._rendered_context = rendered
+            logger.info(
+                f"Каталог для AI відрендерено: {len(snapshot.products)} товарів, "
+                f"{rendered.size_bytes} байт, ~{rendered.approx_tokens} токенів (версія {rendered.version})"
+            )
+        return rendered
 
     def get_product_id_map(self) -> dict:
         """
@@ -865,19 +684,17 @@ class GoogleSheetsManager:
 
         Використовується для пошуку pid при передачі замовлення в HugeProfit.
         """
-        products = self.get_products()
-        id_map = {}
-        for p in products:
-            hp_id = p.get('ID Товара', '').strip()
-            name = (p.get('Назва') or p.get('Назва ', '')).strip()
-            if hp_id and name:
-                try:
-                    id_map[name.lower()] = int(hp_id)
-                except ValueError:
-                    pass
+        id_map = ProductPidIndex.id_map_from_products(self.get_products())
         logger.info(f"HugeProfit ID map: {len(id_map)} товарів")
         return id_map
 
+    def get_pid_index(self) -> ProductPidIndex:
+        """
+        Індекс назва → HugeProfit pid по поточному знімку (будується один раз на версію знімка).
+        Не звертається до Google Sheets — використовує вже завантажений знімок.
+        """
+        return self._snapshot_index('pids', self.kb_cache.snapshot, lambda s: ProductPidIndex.from_products(s.products))
+
 
 def main():
     """Тест підключення та читання даних"""
@@ -929,7 +746,7 @@ def main():
             if prices:
                 print("    Ціни по розмірам:")
                 for price in prices:
-                    print(f"      - {price.get('sizes')}: {price.get('price')}")
+                    print(f"      - {price.sizes}: {price.price}")
 
     print("\n" + "=" * 60)
     print("  ТЕСТ ЗАВЕРШЕНО!")
@@ -6,17 +6,540 @@ Env vars:
     HUGEPROFIT_TOKEN       — API токен (Налаштування → Інтеграції → API)
     HUGEPROFIT_WAREHOUSE_ID — ID складу (GET /bapi/warehouses, необов'язково)
     HUGEPROFIT_CHANNEL_ID   — ID каналу продажів (необов'язково)
+    HUGEPROFIT_CATALOG_TTL  — як часто оновлювати кеш товарів/варіацій CRM, с (за замовчуванням 3600)
 """
 import os
 import re
+import json
+import hashlib
+import time
 import logging
+import threading
 import requests
-from typing import Optional
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+from atomic_write import write_json
+from drive_photos import colors_match
+from knowledge_base import expand_sizes
+from search_index import stem
 
 logger = logging.getLogger(__name__)
 
 BASE_URL = "https://crm.h-profit.com/bapi"
 
+# Кеш товарів і варіацій CRM (пам'ять + диск)
+CATALOG_CACHE_FILE = Path(os.getenv(
+    'HUGEPROFIT_CATALOG_FILE', str(Path(__file__).parent / 'data' / 'hugeprofit_catalog.json')
+))
+CATALOG_CACHE_FORMAT = 1
+CATALOG_TTL = float(os.getenv('HUGEPROFIT_CATALOG_TTL', '3600'))
+# Товарів на сторінку GET /bapi/products і максимум сторінок за одне оновлення
+PRODUCTS_PAGE_SIZE = 500
+MAX_PRODUCT_PAGES = 40
+# Варіації, отримані на шляху замовлення, фоновий потік зберігає на диск не частіше ніж раз на стільки секунд
+SAVE_INTERVAL = 30.0
+# Промах (назви немає в кеші) оновлює список товарів не частіше ніж раз на стільки секунд
+MISS_REFRESH_INTERVAL = 60.0
+# Після невдалого оновлення — повтор з експоненційною паузою: 30с, 60с, ... до 30 хв
+REFRESH_RETRY_MIN = 30.0
+REFRESH_RETRY_MAX = 1800.0
+# Рішення (pid, рядок замовлення) → mid: файл і скільки останніх рішень тримати
+VARIATION_DECISIONS_FILE = Path(os.getenv(
+    'HUGEPROFIT_VARIATIONS_FILE', str(Path(__file__).parent / 'data' / 'hugeprofit_variations.json')
+))
+MAX_VARIATION_DECISIONS = 5000
+
+_WORD_RE = re.compile(r"[0-9a-zа-яіїєґʼ']+")
+
+_NAME_STRIP_CHARS = ('"', "'", '«', '»', '\u201c', '\u201d', '\u2018', '\u2019',
+                     '`', '(', ')', '[', ']', '{', '}')
+
+
+def normalize_product_name(name: str) -> str:
+    """
+    Нормалізує назву для порівняння:
+    - нижній регістр
+    - видаляє ВСІ лапки та дужки (", ', «, », ", ", (, ), [, ], {, })
+    - стискає зайві пробіли
+    """
+    result = name.lower()
+    for ch in _NAME_STRIP_CHARS:
+        result = result.replace(ch, '')
+    return ' '.join(result.split())
+
+
+class PidMatch(NamedTuple):
+    pid: int
+    name: str       # нормалізована назва товару з каталогу
+    exact: bool
+
+
+class ProductPidIndex:
+    """
+    Індекс назва товару → HugeProfit pid (колонка "ID Товара" каталогу Google Sheets).
+    Назви нормалізуються один раз при побудові (разом зі знімком бази знань);
+    часткові збіги шукаються серед назв зі спільним токеном (індекс токенів),
+    повний перебір — лише якщо таких немає.
+    """
+
+    def __init__(self, id_map: dict):
+        """id_map: {назва: pid} — порядок ключів = пріоритет часткових збігів."""
+        self._exact = {}                   # {нормалізована назва: pid}
+        self._names = []                   # нормалізовані назви в порядку каталогу
+        self._tokens = defaultdict(list)   # {токен: [позиція в _names]}
+        for name, pid in id_map.items():
+            norm = normalize_product_name(name)
+            if not norm:
+                continue
+            if norm not in self._exact:
+                pos = len(self._names)
+                self._names.append(norm)
+                for token in set(norm.split()):
+                    self._tokens[token].append(pos)
+            self._exact[norm] = pid
+
+    @classmethod
+    def from_products(cls, products) -> 'ProductPidIndex':
+        """Індекс з товарів каталогу, у яких заповнено "ID Товара"."""
+        return cls(cls.id_map_from_products(products))
+
+    @staticmethod
+    def id_map_from_products(products) -> dict:
+        """{назва_товару_lowercase: pid} для товарів із заповненим "ID Товара"."""
+        id_map = {}
+        for p in products:
+            hp_id = p.get('ID Товара', '').strip()
+            name = (p.get('Назва') or p.get('Назва ', '')).strip()
+            if hp_id and name:
+                try:
+                    id_map[name.lower()] = int(hp_id)
+                except ValueError:
+                    pass
+        return id_map
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def find(self, product_name: str) -> Optional[PidMatch]:
+        """pid за точною нормалізованою назвою, або за входженням назви в рядок / рядка в назву."""
+        norm = normalize_product_name(product_name or '')
+        if not norm:
+            return None
+        pid = self._exact.get(norm)
+        if pid is not None:
+            return PidMatch(pid, norm, True)
+
+        candidates = sorted({pos for token in set(norm.split()) for pos in self._tokens.get(token, ())})
+        for pos in candidates:
+            name = self._names[pos]
+            if name in norm or norm in name:
+                return PidMatch(self._exact[name], name, False)
+        checked = set(candidates)
+        for pos, name in enumerate(self._names):
+            if pos not in checked and (name in norm or norm in name):
+                return PidMatch(self._exact[name], name, False)
+        return None
+
+
+# ==================== КЕШ КАТАЛОГУ CRM ====================
+
+class HugeProfitCatalogCache:
+    """
+    Товари HugeProfit та їхні варіації (stock) у пам'яті й на диску
+    (data/hugeprofit_catalog.json) — спільні для всіх замовлень процесу.
+
+    - Список товарів читається посторінково (limit/offset, не лише перші 500)
+    - Оновлення: за розкладом (лише фоновий потік, раз на HUGEPROFIT_CATALOG_TTL)
+      і при промаху пошуку (не частіше ніж раз на MISS_REFRESH_INTERVAL);
+      після збою — повтор з експоненційною паузою (REFRESH_RETRY_MIN..REFRESH_RETRY_MAX)
+    - Інкрементально: варіації перезапитуються лише для нових/змінених товарів
+      або якщо їхній запис старший за TTL
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, fetch: Callable[[str, dict], Optional[dict]], path: Path = None, ttl: float = None):
+        """
+        Args:
+            fetch: GET-запит до CRM: fetch(endpoint, params) → JSON або None
+            path: файл кешу на диску
+            ttl: вік списку товарів / варіацій, після якого вони оновлюються
+        """
+        self._fetch = fetch
+        self.path = Path(path or CATALOG_CACHE_FILE)
+        self.ttl = CATALOG_TTL if ttl is None else ttl
+        self._products: list = []        # [{'id', 'name', 'norm', 'fingerprint'}] у порядку CRM
+        self._stock: dict = {}           # {pid: {'fetched_at', 'items': [...]}}
+        self._fetched_at = 0.0
+        self._last_miss_refresh = 0.0
+        self._attempted_at = 0.0         # monotonic останньої спроби оновлення
+        self._failures = 0               # невдалих оновлень підряд
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False              # є незбережені варіації (зберігає фоновий потік)
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+        self.requests = 0                # запитів до CRM (для моніторингу)
+        self.load()
+
+    @classmethod
+    def shared(cls, fetch: Callable[[str, dict], Optional[dict]]) -> 'HugeProfitCatalogCache':
+        """Один кеш на процес (HugeProfitCRM створюється на кожне замовлення)."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(fetch)
+                cls._shared.start_background_refresh()
+            return cls._shared
+
+    # ==================== ПОШУК ====================
+
+    def find_pid(self, norm_name: str) -> Optional[int]:
+        """
+        pid товару CRM, назва якого входить у рядок замовлення (або навпаки);
+        norm_name — нормалізований рядок (normalize_product_name).
+        """
+        if not norm_name:
+            return None
+        # Застарілий за TTL список оновлює фоновий потік; тут — лише промах (з обмеженням частоти)
+        pid = self._match(norm_name)
+        if pid is None and time.monotonic() - self._last_miss_refresh > MISS_REFRESH_INTERVAL \
+                and self._retry_in() <= 0:
+            self._last_miss_refresh = time.monotonic()
+            logger.info(f"HugeProfit кеш: '{norm_name}' не знайдено — оновлюємо список товарів")
+            self.refresh()
+            pid = self._match(norm_name)
+        return pid
+
+    def _match(self, norm_name: str) -> Optional[int]:
+        for prod in self._products:
+            api_name = prod['norm']
+            if api_name and (api_name in norm_name or norm_name in api_name):
+                return prod['id']
+        return None
+
+    def get_stock(self, pid: int) -> Optional[list]:
+        """Варіації товару (з кешу, якщо свіжі). None — CRM недоступна і в кеші нічого немає."""
+        with self._lock:
+            entry = self._stock.get(pid)
+        if entry and time.time() - entry['fetched_at'] < self.ttl:
+            return entry['items']
+
+        result = self._get('products', {'product_id': pid})
+        if not result or not isinstance(result.get('data'), list) or not result['data']:
+            if entry:
+                logger.warning(f"HugeProfit кеш: варіації pid={pid} не оновлено — беремо збережені")
+                return entry['items']
+            return None
+        items = result['data'][0].get('stock', []) or []
+        with self._lock:
+            self._stock[pid] = {'fetched_at': time.time(), 'items': items}
+            self._dirty = True
+        if not (self._thread and self._thread.is_alive()):
+            self.save()
+        return items
+
+    # ==================== ОНОВЛЕННЯ ====================
+
+    def _get(self, endpoint: str, params: dict) -> Optional[dict]:
+        self.requests += 1
+        return self._fetch(endpoint, params)
+
+    def _retry_in(self) -> float:
+        """Скільки секунд ще чекати після невдалих оновлень (0 — можна пробувати)."""
+        if not self._failures:
+            return 0.0
+        backoff = min(REFRESH_RETRY_MAX, REFRESH_RETRY_MIN * 2 ** (self._failures - 1))
+        return backoff - (time.monotonic() - self._attempted_at)
+
+    def _next_refresh_in(self) -> float:
+        """Пауза фонового потоку до наступного оновлення: TTL або пауза після збою."""
+        if self._failures:
+            return self._retry_in()
+        return self.ttl - (time.time() - self._fetched_at)
+
+    def refresh(self) -> bool:
+        """Перечитати список товарів (усі сторінки); варіації змінених товарів — забути."""
+        self._attempted_at = time.monotonic()
+        ok = False
+        try:
+            ok = self._refresh()
+        finally:
+            if ok:
+                self._failures = 0
+            else:
+                self._failures += 1
+                logger.warning(f"HugeProfit кеш: оновлення не вдалося ({self._failures} підряд), "
+                               f"наступна спроба через {self._retry_in():.0f}с")
+        return ok
+
+    def _refresh(self) -> bool:
+        with self._refresh_lock:
+            started = time.monotonic()
+            products = {}   # {pid: товар} — без дублів, у порядку CRM
+            offset = 0
+            pages = 0
+            while True:
+                result = self._get('products', {'limit': PRODUCTS_PAGE_SIZE, 'offset': offset})
+                if not result or not isinstance(result.get('data'), list):
+                    logger.warning(f"HugeProfit кеш: список товарів не отримано (offset={offset})")
+                    return False
+                page = result['data']
+                pages += 1
+                new = 0
+                for prod in page:
+                    pid = prod.get('id')
+                    if pid and int(pid) not in products:
+                        products[int(pid)] = prod
+                        new += 1
+                if len(page) < PRODUCTS_PAGE_SIZE:
+                    break
+                if not new:
+                    # Сторінка повторює вже отримані товари — API ігнорує offset
+                    logger.warning(f"HugeProfit кеш: сторінка offset={offset} повторює попередні — зупиняємось")
+                    break
+                if pages >= MAX_PRODUCT_PAGES:
+                    logger.warning(f"HugeProfit кеш: досягнуто межі {MAX_PRODUCT_PAGES} сторінок товарів")
+                    break
+                offset += PRODUCTS_PAGE_SIZE
+
+            now = time.time()
+            entries, stock_updates = [], {}
+            for pid, prod in products.items():
+                entries.append({
+                    'id': pid,
+                    'name': prod.get('name') or '',
+                    'norm': normalize_product_name(prod.get('name') or ''),
+                    # Короткий хеш товару (з варіаціями) — лише для виявлення змін
+                    'fingerprint': hashlib.sha1(
+                        json.dumps(prod, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+                    ).hexdigest()[:16],
+                })
+                # Якщо список уже містить варіації — окремий запит на товар не потрібен
+                if isinstance(prod.get('stock'), list):
+                    stock_updates[pid] = {'fetched_at': now, 'items': prod['stock']}
+
+            with self._lock:
+                old = {p['id']: p['fingerprint'] for p in self._products}
+                changed = {e['id'] for e in entries if old.get(e['id']) != e['fingerprint']}
+                live = {e['id'] for e in entries}
+                self._stock = {
+                    pid: entry for pid, entry in self._stock.items()
+                    if pid in live and pid not in changed
+                }
+                self._stock.update(stock_updates)
+                self._products = entries
+                self._fetched_at = now
+            self.save()
+            logger.info(
+                f"HugeProfit кеш: {len(entries)} товарів ({len(changed)} нових/змінених, "
+                f"{pages} стор.) за {time.monotonic() - started:.2f}с"
+            )
+            return True
+
+    # ==================== ДИСК ====================
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"HugeProfit кеш: не вдалося прочитати {self.path}: {e}")
+            return False
+        if data.get('format') != CATALOG_CACHE_FORMAT:
+            return False
+        with self._lock:
+            self._products = data.get('products', [])
+            self._stock = {int(pid): entry for pid, entry in data.get('stock', {}).items()}
+            self._fetched_at = data.get('fetched_at', 0.0)
+        logger.info(f"HugeProfit кеш: {len(self._products)} товарів, {len(self._stock)} з варіаціями (з диска)")
+        return True
+
+    def save(self):
+        # _save_lock — фонове оновлення і запис варіацій не пишуть у той самий .tmp одночасно
+        with self._save_lock:
+            with self._lock:
+                data = {
+                    'format': CATALOG_CACHE_FORMAT,
+                    'fetched_at': self._fetched_at,
+                    'products': self._products,
+                    'stock': {str(pid): entry for pid, entry in self._stock.items()},
+                }
+                self._dirty = False
+            try:
+                write_json(self.path, data)
+            except Exception as e:
+                logger.warning(f"HugeProfit кеш: не вдалося зберегти {self.path}: {e}")
+
+    # ==================== ФОНОВИЙ ПОТІК ====================
+
+    def start_background_refresh(self, interval: float = None):
+        """Daemon-потік: оновлює список товарів раз на interval (за замовчуванням TTL)."""
+        interval = self.ttl if interval is None else interval
+        if interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._background_loop, args=(interval,), name='hugeprofit-catalog', daemon=True
+        )
+        self._thread.start()
+
+    def stop_background_refresh(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+        if self._dirty:
+            self.save()
+
+    def _background_loop(self, interval: float):
+        while not self._stop_event.is_set():
+            if self._next_refresh_in() <= 0:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"HugeProfit кеш: помилка фонового оновлення: {e}")
+            if self._dirty:
+                self.save()
+            self._stop_event.wait(timeout=max(1.0, min(interval, SAVE_INTERVAL, self._next_refresh_in())))
+
+
+# ==================== ВАРІАЦІЇ ТОВАРУ ====================
+
+def _variation_words(text: str) -> set:
+    """Слова тексту без розмірів (розміри порівнюються окремо через expand_sizes)."""
+    words = set()
+    for word in _WORD_RE.findall((text or '').lower()):
+        if len(word) < 3 or word.isdigit() or expand_sizes(word):
+            continue
+        words.add(word)
+    return words
+
+
+def _words_match(order_word: str, variant_word: str) -> bool:
+    """Спільна основа слова або збіг кольору (синоніми / перші 4 літери, як для фото)."""
+    return stem(order_word) == stem(variant_word) or colors_match(order_word, variant_word)
+
+
+class VariationMatcher:
+    """
+    Вибір варіації (mid) товару HugeProfit за рядком замовлення без AI:
+    розмір — через expand_sizes (та сама нормалізація, що й таблиця цін каталогу),
+    колір/інші ознаки — за словами, якими варіації відрізняються між собою.
+    AI потрібен лише коли збіг неоднозначний; рішення (pid, рядок) → mid
+    зберігаються на диск (data/hugeprofit_variations.json).
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path or VARIATION_DECISIONS_FILE)
+        self._decisions = OrderedDict()   # {"pid|нормалізований рядок": mid}
+        self._lock = threading.Lock()
+        self.counts = {'single': 0, 'cache': 0, 'local': 0, 'ai': 0}
+        self.load()
+
+    @classmethod
+    def shared(cls) -> 'VariationMatcher':
+        """Один набір рішень на процес (HugeProfitCRM створюється на кожне замовлення)."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @staticmethod
+    def _key(pid: int, order_line: str) -> str:
+        return f"{pid}|{normalize_product_name(order_line)}"
+
+    # ==================== РІШЕННЯ ====================
+
+    def cached(self, pid: int, order_line: str, stock: list) -> Optional[int]:
+        """Збережене рішення, якщо така варіація ще є в stock."""
+        mid = self._decisions.get(self._key(pid, order_line))
+        if mid is not None and any(str(v.get('mid')) == str(mid) for v in stock):
+            return mid
+        return None
+
+    def remember(self, pid: int, order_line: str, mid: int):
+        with self._lock:
+            key = self._key(pid, order_line)
+            self._decisions[key] = mid
+            self._decisions.move_to_end(key)
+            while len(self._decisions) > MAX_VARIATION_DECISIONS:
+                self._decisions.popitem(last=False)
+        self.save()
+
+    def record(self, outcome: str):
+        """Врахувати, як обрано варіацію: single / cache / local / ai."""
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def stats(self) -> dict:
+        """Лічильники і частка рішень без AI (hit rate)."""
+        total = sum(self.counts.values())
+        return dict(self.counts, total=total, hit_rate=(total - self.counts['ai']) / total if total else 0.0)
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"HugeProfit варіації: не вдалося прочитати {self.path}: {e}")
+            return False
+        with self._lock:
+            self._decisions = OrderedDict(data.get('decisions', {}))
+        logger.info(f"HugeProfit варіації: {len(self._decisions)} збережених рішень (з диска)")
+        return True
+
+    def save(self):
+        with self._lock:
+            data = {'decisions': dict(self._decisions)}
+        try:
+            write_json(self.path, data)
+        except Exception as e:
+            logger.warning(f"HugeProfit варіації: не вдалося зберегти {self.path}: {e}")
+
+    # ==================== ЗІСТАВЛЕННЯ ====================
+
+    def match(self, order_line: str, stock: list) -> list:
+        """
+        Варіації, що найкраще відповідають рядку (за розміром, потім за словами).
+        Одна — рішення без AI; кілька — неоднозначно; порожньо — розмір не збігся ні з чим.
+        """
+        line_sizes = set(expand_sizes(order_line))
+        line_words = _variation_words(order_line)
+
+        texts = [' '.join(str(v.get(k) or '') for k in ('name', 'color', 'sku')) for v in stock]
+        words = [_variation_words(t) for t in texts]
+        # Слова, спільні для всіх варіацій (назва товару), нічого не розрізняють
+        common = set.intersection(*words) if words else set()
+
+        scored = []
+        for v, text, v_words in zip(stock, texts, words):
+            v_sizes = set(expand_sizes(str(v.get('size') or ''))) or set(expand_sizes(text))
+            size_score = 0
+            if line_sizes and v_sizes:
+                size_score = len(line_sizes & v_sizes)
+                if not size_score:
+                    continue  # розмір рядка інший — варіація не підходить
+            word_score = sum(
+                1 for vw in v_words - common if any(_words_match(lw, vw) for lw in line_words)
+            )
+            scored.append(((size_score, word_score), v))
+
+        if not scored:
+            return []
+        best = max(score for score, _ in scored)
+        return [v for score, v in scored if score == best]
+
 
 class HugeProfitCRM:
     def __init__(self):
@@ -32,6 +555,9 @@ class HugeProfitCRM:
             'Authorization': self.token,
             'Content-Type': 'application/json',
         }
+        # Товари/варіації CRM — спільний кеш процесу (лише якщо інтеграція увімкнена)
+        self.catalog = HugeProfitCatalogCache.shared(self._get) if self.token else None
+        self.variations = VariationMatcher.shared()
 
     def _get(self, endpoint: str, params: dict = None) -> Optional[dict]:
         url = f"{BASE_URL}/{endpoint}"
@@ -122,31 +648,22 @@ class HugeProfitCRM:
 
     @staticmethod
     def _normalize_name(name: str) -> str:
-        """
-        Нормалізує назву для порівняння:
-        - нижній регістр
-        - видаляє ВСІ лапки та дужки (", ', «, », ", ", (, ), [, ], {, })
-        - стискає зайві пробіли
-        """
-        result = name.lower()
-        for ch in ('"', "'", '«', '»', '\u201c', '\u201d', '\u2018', '\u2019',
-                   '`', '(', ')', '[', ']', '{', '}'):
-            result = result.replace(ch, '')
-        return ' '.join(result.split())
+        """Нормалізує назву для порівняння (див. normalize_product_name)."""
+        return normalize_product_name(name)
 
     def _get_mid_by_ai(self, pid: int, order_line: str) -> Optional[int]:
         """
-        Визначає правильний mid (варіацію товару) через Gemini AI.
-        1. Отримує всі варіації товару з HugeProfit
-        2. Просить AI вибрати відповідну варіацію по рядку замовлення
+        Визначає правильний mid (варіацію товару):
+        1. Бере всі варіації товару з кешу каталогу CRM (запит до HugeProfit — лише якщо застарілі)
+        2. Збережене рішення для цього (pid, рядка) або локальне зіставлення розміру/кольору
+        3. Лише якщо збіг неоднозначний — просить AI вибрати серед кандидатів
         Якщо варіація одна — повертає її одразу без запиту до AI.
         """
-        result = self._get('products', params={'product_id': pid})
-        if not result or not isinstance(result.get('data'), list) or not result['data']:
+        stock = self.catalog.get_stock(pid) if self.catalog else None
+        if stock is None:
             logger.warning(f"HugeProfit: не вдалося отримати варіації для pid={pid}")
             return None
 
-        stock = result['data'][0].get('stock', [])
         if not stock:
             logger.warning(f"HugeProfit: варіацій немає для pid={pid}")
             return None
@@ -154,14 +671,37 @@ class HugeProfitCRM:
         # Якщо варіація одна — одразу повертаємо
         if len(stock) == 1:
             mid = stock[0].get('mid')
+            self.variations.record('single')
             logger.info(f"HugeProfit: одна варіація mid={mid} для pid={pid}")
             return int(mid) if mid else None
 
+        mid = self.variations.cached(pid, order_line, stock)
+        if mid is not None:
+            self.variations.record('cache')
+            logger.info(f"HugeProfit: mid={mid} для '{order_line}' (збережене рішення)")
+            return int(mid)
+
+        candidates = self.variations.match(order_line, stock)
+        if len(candidates) == 1 and candidates[0].get('mid'):
+            mid = int(candidates[0]['mid'])
+            self.variations.record('local')
+            self.variations.remember(pid, order_line, mid)
+            logger.info(f"HugeProfit: mid={mid} для '{order_line}' (розмір/колір без AI)")
+            return mid
+
+        self.variations.record('ai')
+        stats = self.variations.stats()
+        logger.info(
+            f"HugeProfit: неоднозначна варіація для '{order_line}' ({len(candidates)} кандидатів) — AI; "
+            f"без AI {stats['hit_rate']:.0%} з {stats['total']}"
+        )
+        choices = candidates or stock
+
         # Будуємо список варіацій для AI
         variants_text = "\n".join(
             f"mid={v.get('mid')}: розмір={v.get('size', '?')}, sku={v.get('sku', '?')}, "
             f"назва={v.get('name', '')}"
-            for v in stock
+            for v in choices
         )
 
         prompt = (
@@ -173,18 +713,16 @@ class HugeProfitCRM:
         )
 
         try:
-            from google import genai
-            from dotenv import load_dotenv
-            load_dotenv()
-            api_key = os.getenv('GEMINI_API_KEY', '')
-            if not api_key:
+            from gemini_gateway import GeminiGateway
+            gateway = GeminiGateway.shared()
+            if not gateway.available:
                 logger.warning("HugeProfit AI: GEMINI_API_KEY не вказано, беремо першу варіацію")
                 mid = stock[0].get('id')
                 return int(mid) if mid else None
 
             from google.genai import types as genai_types
-            client = genai.Client(api_key=api_key)
-            response = client.models.generate_content(
+            response = gateway.generate(
+                'hugeprofit_mid',
                 model='gemini-2.0-flash',
                 contents=prompt,
                 config=genai_types.GenerateContentConfig(
@@ -200,6 +738,8 @@ class HugeProfitCRM:
             mid_str = response.text.strip().split()[0]
             mid = int(re.sub(r'\D', '', mid_str))
             logger.info(f"HugeProfit AI: обрано mid={mid} для '{order_line}'")
+            if any(str(v.get('mid')) == str(mid) for v in choices):
+                self.variations.remember(pid, order_line, mid)
             return mid
 
         except Exception as e:
@@ -208,55 +748,52 @@ class HugeProfitCRM:
             mid = stock[0].get('id')
             return int(mid) if mid else None
 
-    def _find_pid(self, product_name: str, product_id_map: dict) -> Optional[int]:
+    def _find_pid(self, product_name: str, product_id_map) -> Optional[int]:
         """
         Шукає HugeProfit pid для товару:
-        1. По точній нормалізованій назві в product_id_map (з Google Sheets)
+        1. По точній нормалізованій назві в індексі з Google Sheets
         2. По частковому співпадінню (нормалізовано)
-        3. Через GET /bapi/products (всі товари, пошук по назві)
+        3. У кеші товарів CRM (усі сторінки GET /bapi/products, пошук по назві)
+
+        product_id_map: ProductPidIndex (спільний, зі знімка каталогу) або dict {назва: pid}
         """
         norm_name = self._normalize_name(product_name)
+        pid_index = product_id_map
+        if not isinstance(pid_index, ProductPidIndex):
+            pid_index = ProductPidIndex(product_id_map or {})
+
+        match = pid_index.find(product_name)
+        if match:
+            if match.exact:
+                logger.info(f"HugeProfit: знайдено pid={match.pid} (точна назва) для '{product_name}'")
+            else:
+                logger.info(f"HugeProfit: знайдено pid={match.pid} (часткова назва '{match.name}') для '{product_name}'")
+            return match.pid
 
-        # Нормалізуємо ключі map для порівняння
-        normalized_map = {self._normalize_name(k): v for k, v in product_id_map.items()}
-
-        # 1. Точне співпадіння
-        if norm_name in normalized_map:
-            pid = normalized_map[norm_name]
-            logger.info(f"HugeProfit: знайдено pid={pid} (точна назва) для '{product_name}'")
-            return pid
-
-        # 2. Часткове співпадіння
-        for catalog_name, pid in normalized_map.items():
-            if catalog_name in norm_name or norm_name in catalog_name:
-                logger.info(f"HugeProfit: знайдено pid={pid} (часткова назва '{catalog_name}') для '{product_name}'")
+        # 3. Товари CRM (кеш усіх сторінок GET /bapi/products)
+        if self.catalog:
+            pid = self.catalog.find_pid(norm_name)
+            if pid:
+                logger.info(f"HugeProfit: знайдено pid={pid} через каталог CRM для '{product_name}'")
                 return pid
 
-        # 3. Пошук через API (всі товари)
-        result = self._get('products', params={'limit': 500, 'offset': 0})
-        if result and isinstance(result.get('data'), list):
-            for prod in result['data']:
-                api_name = self._normalize_name(prod.get('name') or '')
-                if api_name and (api_name in norm_name or norm_name in api_name):
-                    pid = prod.get('id')
-                    if pid:
-                        logger.info(f"HugeProfit: знайдено pid={pid} через API для '{product_name}'")
-                        return int(pid)
-
         logger.warning(f"HugeProfit: pid не знайдено для '{product_name}'")
         return None
 
     def _parse_products_to_items(self, products_text: str,
                                   total_price: float = None,
-                                  product_id_map: dict = None) -> dict:
+                                  product_id_map=None,
+                                  price_lookup: Callable[[str], Optional[int]] = None) -> dict:
         """
         Парсить текстовий список товарів з [ORDER] в об'єкт для API.
         Формат рядка: "Назва товару розмір колір — 950 грн"
-        product_id_map: {назва_lowercase: pid} з Google Sheets
+        product_id_map: ProductPidIndex або {назва_lowercase: pid} з Google Sheets
+        price_lookup: ціна з акцією для рядка без ціни (таблиця цін каталогу Google Sheets)
         Повертає: {"0": {"pid": ..., "count": 1, "discount": 0, "finish_price": ..., "mid": ...}, ...}
         """
-        if product_id_map is None:
-            product_id_map = {}
+        # Індекс будується один раз на замовлення (якщо передано dict, а не готовий індекс)
+        if not isinstance(product_id_map, ProductPidIndex):
+            product_id_map = ProductPidIndex(product_id_map or {})
 
         lines = [l.strip() for l in (products_text or '').split('\n') if l.strip()]
         parsed = []
@@ -269,6 +806,11 @@ class HugeProfitCRM:
             else:
                 price = 0.0
                 name = line
+                if price_lookup:
+                    try:
+                        price = float(price_lookup(line) or 0)
+                    except Exception as e:
+                        logger.warning(f"HugeProfit: ціна з каталогу недоступна для '{line}': {e}")
             parsed.append({'name': name or line, 'price': price})
 
         # Якщо ціни не розпарсились — рівномірно ділимо total_price
@@ -299,7 +841,8 @@ class HugeProfitCRM:
         return products
 
     def create_sale(self, client_id: int, order_data: dict,
-                    product_id_map: dict = None) -> Optional[int]:
+                    product_id_map=None,
+                    price_lookup: Callable[[str], Optional[int]] = None) -> Optional[int]:
         """
         Створити продаж в HugeProfit.
         Повертає sale_id або None.
@@ -316,7 +859,8 @@ class HugeProfitCRM:
         products = self._parse_products_to_items(
             order_data.get('products', ''),
             total_price,
-            product_id_map or {}
+            product_id_map,
+            price_lookup
         )
 
         account_id = self.get_first_account_id()
@@ -363,9 +907,10 @@ class HugeProfitCRM:
     # ==================== MAIN ====================
 
     def push_order_with_retry(self, username: str, order_data: dict,
-                               product_id_map: dict = None,
+                               product_id_map=None,
                                max_retries: int = 3,
-                               delays: list = None) -> bool:
+                               delays: list = None,
+                               price_lookup: Callable[[str], Optional[int]] = None) -> bool:
         """
         Передати замовлення в HugeProfit з повторними спробами.
         delays: затримки між спробами в секундах (за замовчуванням [5, 10, 15]).
@@ -378,7 +923,8 @@ class HugeProfitCRM:
         for attempt in range(1, max_retries + 1):
             try:
                 ok = self.push_order(username=username, order_data=order_data,
-                                     product_id_map=product_id_map)
+                                     product_id_map=product_id_map,
+                                     price_lookup=price_lookup)
                 if ok:
                     if attempt > 1:
                         logger.info(f"HugeProfit: успішно з {attempt}-ї спроби для {username}")
@@ -397,7 +943,8 @@ class HugeProfitCRM:
         return False
 
     def push_order(self, username: str, order_data: dict,
-                   product_id_map: dict = None) -> bool:
+                   product_id_map=None,
+                   price_lookup: Callable[[str], Optional[int]] = None) -> bool:
         """
         Передати підтверджене замовлення в HugeProfit CRM.
         Викликається з _process_order() в ai_agent.py.
@@ -406,6 +953,7 @@ class HugeProfitCRM:
             username:   Instagram username клієнта
             order_data: dict з полями full_name, phone, city,
                         nova_poshta, products, total_price
+            price_lookup: ціна рядка замовлення з каталогу (якщо AI не вказала ціну)
         Returns:
             True якщо успішно, False якщо помилка
         """
@@ -424,7 +972,7 @@ class HugeProfitCRM:
             return False
 
         # 2. Продаж
-        sale_id = self.create_sale(client_id, order_data, product_id_map)
+        sale_id = self.create_sale(client_id, order_data, product_id_map, price_lookup)
         if not sale_id:
             logger.error("HugeProfit: не вдалося створити продаж")
             return False
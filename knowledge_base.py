@@ -0,0 +1,824 @@
+"""
+Knowledge Base - знімок бази знань з Google Sheets та його in-process кеш
+Усі аркуші (Каталог, Шаблони, Логіка, Складні_питання) завантажуються
+ОДНИМ запитом values:batchGet і парсяться разом у KnowledgeBaseSnapshot —
+один розпарсений, незмінний (immutable) знімок на всіх споживачів.
+
+- TTL: знімок вважається свіжим CATALOG_CACHE_TTL секунд
+- Після TTL спершу дешево перевіряється версія файлу (Drive version/modifiedTime):
+  таблиця не змінювалась — повне завантаження й парсинг пропускаються
+- invalidate(): примусово позначити знімок застарілим
+- Фоновий потік оновлює знімок раз на CATALOG_REFRESH_INTERVAL секунд,
+  тож обробка повідомлення не чекає на мережу Google
+- Офлайн-знімок: після кожного оновлення знімок зберігається у файл
+  (data/kb_snapshot.json) і завантажується при старті — бот має каталог
+  одразу, навіть якщо Google Sheets повільний або недоступний
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Callable, Optional
+
+from atomic_write import write_json
+
+logger = logging.getLogger(__name__)
+
+# Аркуші бази знань (усі, крім Каталогу, опціональні)
+CATALOG_SHEET = "Каталог"
+TEMPLATES_SHEET = "Шаблони"
+RULES_SHEET = "Логіка"
+QUESTIONS_SHEET = "Складні_питання"
+KB_SHEETS = (CATALOG_SHEET, TEMPLATES_SHEET, RULES_SHEET, QUESTIONS_SHEET)
+
+# Скільки секунд знімок вважається свіжим (після цього — перевірка версії файлу)
+DEFAULT_TTL = float(os.getenv('CATALOG_CACHE_TTL', '60'))
+# Інтервал фонового оновлення (0 = без фонового потоку)
+DEFAULT_REFRESH_INTERVAL = float(os.getenv('CATALOG_REFRESH_INTERVAL', str(DEFAULT_TTL)))
+# Пауза перед повторною спробою після невдалого завантаження
+RETRY_AFTER_ERROR = 30.0
+# Груба оцінка кількості токенів для моніторингу розміру промпту (символів на токен)
+CHARS_PER_TOKEN = 4
+# Офлайн-знімок бази знань (порожній шлях = не зберігати)
+SNAPSHOT_FILE = os.getenv('KB_SNAPSHOT_FILE', str(Path(__file__).parent / 'data' / 'kb_snapshot.json'))
+# Формат файлу знімка (при зміні структури — старий файл ігнорується)
+SNAPSHOT_FORMAT = 1
+
+_DRIVE_FOLDER_RE = re.compile(r'drive\.google\.com/drive/folders/([a-zA-Z0-9_-]+)')
+# Розміри: діапазон '110-128', окреме число ('42/44' — два розміри на вибір), літерний розмір
+_SIZE_RANGE_RE = re.compile(r'(?<![\d\-–])(\d{2,3})\s*[-–]\s*(\d{2,3})(?!\d|\s*[-–]\s*\d)')
+# Телефони і номери ТТН — їхні групи цифр не розміри ('067 123 45 67', '2045 0012 3456 78')
+_LONG_NUMBER_RE = re.compile(r'(?:\+?38)?\(?0\d{2}\)?(?:[\s\-]?\d){7}(?!\d)|\d{4,}(?:[\s\-]?\d+)*')
+_SIZE_TOKEN_RE = re.compile(r'[0-9a-zа-яіїєґ]+')
+LETTER_SIZES = frozenset({'xxs', 'xs', 's', 'm', 'l', 'xl', 'xxl', 'xxxl', '2xl', '3xl', '4xl'})
+# Кирилиця, якою часто пишуть літерні розміри ('М', 'ХЛ')
+_CYRILLIC_SIZE = str.maketrans({'х': 'x', 'с': 's', 'м': 'm', 'л': 'l'})
+# Діапазони ширші за це не розгортаються в окремі розміри (напр. '100-500' — не розміри)
+MAX_SIZE_RANGE = 60
+
+
+def extract_drive_folder_id(url: str) -> str:
+    """Витягти Folder ID з Google Drive посилання на папку."""
+    m = _DRIVE_FOLDER_RE.search(url)
+    if m:
+        return m.group(1)
+    return None
+
+
+def is_drive_folder_url(url: str) -> bool:
+    """Перевірити чи є URL посиланням на папку Google Drive."""
+    return 'drive.google.com/drive/folders/' in url
+
+
+def product_name(product) -> str:
+    """Назва товару (колонка могла бути записана з пробілом в кінці)."""
+    return product.get('Назва', product.get('Назва ', 'N/A'))
+
+
+def product_photo_raw(product) -> str:
+    """Значення колонки з фото товару (посилання на файл або Drive папку)."""
+    return (
+        product.get('Фото URL') or product.get('Фото') or
+        product.get('Фото URL ') or product.get('Photo URL') or ''
+    ).strip()
+
+
+def _parse_int(text: str) -> Optional[int]:
+    """Число з усіх цифр рядка ('1 200 грн' → 1200) або None, якщо цифр немає."""
+    digits = ''.join(filter(str.isdigit, text))
+    return int(digits) if digits else None
+
+
+@lru_cache(maxsize=4096)
+def expand_sizes(text: str) -> tuple:
+    """
+    Нормалізовані розміри з тексту, у порядку появи, без повторів:
+    діапазони розгортаються ('110-116' → '110', '111', ..., '116'), '42/44' — два розміри,
+    літерні — латиницею в нижньому регістрі ('М' → 'm'). "110-116, S" → ('110', ..., '116', 's').
+    Єдина нормалізація розмірів для каталогу, пошуку, контексту AI і варіацій CRM.
+    """
+    text = _LONG_NUMBER_RE.sub(' ', (text or '').lower())
+    keys = {}
+    for a, b in _SIZE_RANGE_RE.findall(text):
+        lo, hi = sorted((int(a), int(b)))
+        if hi - lo <= MAX_SIZE_RANGE:
+            for n in range(lo, hi + 1):
+                keys.setdefault(str(n), None)
+        else:
+            keys.setdefault(str(lo), None)
+            keys.setdefault(str(hi), None)
+    for token in _SIZE_TOKEN_RE.findall(_SIZE_RANGE_RE.sub(' ', text)):
+        if token.isdigit():
+            if 2 <= len(token) <= 3:
+                keys.setdefault(str(int(token)), None)
+            continue
+        token = token.translate(_CYRILLIC_SIZE)
+        if token in LETTER_SIZES:
+            keys.setdefault(token, None)
+    return tuple(keys)
+
+
+@dataclass(frozen=True, slots=True)
+class PriceBlock:
+    """
+    Рядок цін товару (розміри + ціна + акція). Сирі значення з таблиці
+    (для відображення) і числа, розпарсені один раз при завантаженні.
+    """
+    sizes: str
+    price: str
+    discount: str = ''
+    price_value: Optional[int] = None   # ціна, грн (None — у клітинці немає числа)
+    discount_pct: int = 0               # акція, % (0 / порожньо = без знижки)
+    final_price: Optional[int] = None   # ціна з акцією, грн (= price_value без акції)
+    size_keys: tuple = ()               # expand_sizes(sizes)
+
+    @classmethod
+    def parse(cls, sizes: str, price: str, discount: str = '') -> 'PriceBlock':
+        try:
+            discount_pct = int(discount.replace('%', '').strip()) if discount else 0
+        except ValueError:
+            discount_pct = 0
+        price_value = _parse_int(price)
+        final_price = price_value
+        if price_value is not None and discount_pct > 0:
+            final_price = int(price_value * (1 - discount_pct / 100))
+        return cls(sizes, price, discount, price_value, discount_pct, final_price, expand_sizes(sizes))
+
+    @property
+    def has_discount(self) -> bool:
+        return self.price_value is not None and self.discount_pct > 0
+
+    def to_dict(self) -> dict:
+        return {'sizes': self.sizes, 'price': self.price, 'discount': self.discount}
+
+
+class Product(Mapping):
+    """
+    Товар каталогу (незмінний, спільний для всіх споживачів).
+    Колонки аркуша читаються як з dict: p.get('Кольори'), p['Назва'];
+    prices_by_size — tuple(PriceBlock), також доступний як p.get('prices_by_size');
+    price_table — {нормалізований розмір: PriceBlock} (перший рядок цін з цим розміром).
+    """
+    __slots__ = ('name', 'prices_by_size', 'price_table', '_fields')
+
+    def __init__(self, fields: dict, prices_by_size: tuple = ()):
+        self._fields = fields
+        self.prices_by_size = prices_by_size
+        self.name = fields.get('Назва', fields.get('Назва ', 'N/A'))
+        # Розмір є в кількох рядках — перемагає перший (оновлюємо з кінця)
+        table = {}
+        for block in reversed(prices_by_size):
+            # Нестандартні розміри ('універсальний') — за повним текстом клітинки
+            table[block.sizes.lower().strip()] = block
+            table.update(dict.fromkeys(block.size_keys, block))
+        self.price_table = MappingProxyType(table)
+
+    def price_for_size(self, size_query: str) -> Optional[PriceBlock]:
+        """Рядок цін для розміру з запиту ('158', 'М', 'на зріст 122 см') або None."""
+        for key in expand_sizes(size_query) or (size_query.lower().strip(),):
+            block = self.price_table.get(key)
+            if block is not None:
+                return block
+        return None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Product':
+        """Товар з dict (формат офлайн-знімка): колонки + prices_by_size: [{sizes, price, discount}]."""
+        fields = {k: v for k, v in data.items() if k != 'prices_by_size'}
+        blocks = tuple(
+            PriceBlock.parse(pr.get('sizes', ''), pr.get('price', ''), pr.get('discount', ''))
+            for pr in data.get('prices_by_size', ())
+        )
+        return cls(fields, blocks)
+
+    def to_dict(self) -> dict:
+        return dict(self._fields, prices_by_size=[pr.to_dict() for pr in self.prices_by_size])
+
+    def __getitem__(self, key):
+        if key == 'prices_by_size':
+            return self.prices_by_size
+        return self._fields[key]
+
+    def get(self, key, default=None):
+        if key == 'prices_by_size':
+            return self.prices_by_size
+        return self._fields.get(key, default)
+
+    def __contains__(self, key) -> bool:
+        return key == 'prices_by_size' or key in self._fields
+
+    def __iter__(self):
+        yield from self._fields
+        yield 'prices_by_size'
+
+    def __len__(self) -> int:
+        return len(self._fields) + 1
+
+    def __repr__(self) -> str:
+        return f"Product({self.name!r}, {len(self.prices_by_size)} цін)"
+
+
+@dataclass(frozen=True)
+class BehaviorRule:
+    """Правило з аркуша 'Логіка'. fields — всі колонки рядка + triggers_list (як раніше)."""
+    situation: str
+    triggers: tuple
+    response: str
+    action: str
+    fields: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+
+
+@dataclass(frozen=True)
+class KnowledgeBaseSnapshot:
+    """
+    Незмінний знімок бази знань.
+    version — росте з кожним завантаженням нового вмісту (ключ для похідних кешів).
+    source_version — версія файлу таблиці в Drive ('' якщо невідома).
+    """
+    products: tuple = ()
+    templates: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))  # {назва: текст}
+    rules: tuple = ()  # (BehaviorRule, ...)
+    complex_questions: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))  # {питання: відповідь}
+    missing_sheets: frozenset = field(default_factory=frozenset)
+    drive_folders: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))  # {назва: folder_id}
+    version: int = 0
+    source_version: str = ''
+    loaded_at: float = 0.0
+
+
+# ==================== ПАРСЕРИ АРКУШІВ ====================
+
+@dataclass(frozen=True)
+class CatalogColumns:
+    """Ролі колонок аркуша 'Каталог' — визначаються один раз по рядку заголовків."""
+    headers: tuple
+    name: int
+    size: Optional[int]       # остання колонка з 'розмір' у назві
+    price: Optional[int]      # остання колонка з 'ціна' (не 'акція')
+    discount: Optional[int]   # остання колонка з 'акція'
+
+    @classmethod
+    def resolve(cls, header_row: list) -> 'CatalogColumns':
+        headers = tuple(h.strip() for h in header_row)
+        size = price = discount = None
+        for i, h in enumerate(headers):
+            lower = h.lower()
+            if 'розмір' in lower:
+                size = i
+            if 'акція' in lower:
+                discount = i
+            elif 'ціна' in lower:
+                price = i
+        return cls(headers, headers.index('Назва'), size, price, discount)
+
+
+def parse_catalog(data: list) -> list:
+    """
+    Розпарсити аркуш "Каталог" (рядки як з get_all_values()).
+
+    Очікувані колонки (з Excel):
+    - Назва
+    - Куди носити
+    - Матеріал
+    - Опис товару
+    - Кольори
+    - Доступні розміри
+    - Ціна
+    - Акція - 15%
+    - Супутні товари
+    - Примітка
+    - Фото URL (опціонально — посилання на фото товару)
+
+    Рядок з назвою — новий товар; наступні рядки без назви додають
+    розміри/ціну/акцію до prices_by_size поточного товару.
+
+    Returns:
+        list: [Product, ...]
+    """
+    if len(data) < 2:
+        logger.warning("Каталог порожній")
+        return []
+
+    # Знаходимо рядок з заголовками (може бути не перший)
+    header_row_idx = next(
+        (i for i, row in enumerate(data) if 'Назва' in row or 'Назва ' in row), None
+    )
+    if header_row_idx is None:
+        logger.warning("Заголовки не знайдено")
+        return []
+
+    columns = CatalogColumns.resolve(data[header_row_idx])
+    headers = columns.headers
+    name_col, size_col, price_col, discount_col = columns.name, columns.size, columns.price, columns.discount
+    has_prices = size_col is not None and price_col is not None
+    # Однакові рядки цін (типово для каталогу) парсяться один раз
+    blocks_cache = {}
+
+    products = []
+    fields = None
+    blocks = None
+    for row in data[header_row_idx + 1:]:
+        if not any(row):
+            continue
+        n = len(row)
+        if name_col < n and row[name_col].strip():
+            # Новий товар
+            if fields is not None:
+                products.append(Product(fields, tuple(blocks)))
+            fields = {h: v for h, v in zip(headers, row) if v}
+            blocks = []
+        elif fields is None:
+            continue
+
+        # Розміри/ціна з рядка товару або з додаткового рядка
+        if has_prices and size_col < n and price_col < n:
+            sizes, price = row[size_col], row[price_col]
+            if sizes and price:
+                discount = row[discount_col].strip() if discount_col is not None and discount_col < n else ''
+                key = (sizes, price, discount)
+                block = blocks_cache.get(key)
+                if block is None:
+                    block = blocks_cache[key] = PriceBlock.parse(sizes, price, discount)
+                blocks.append(block)
+
+    # Додаємо останній товар
+    if fields is not None:
+        products.append(Product(fields, tuple(blocks)))
+
+    return products
+
+
+def parse_templates(data: list) -> dict:
+    """Аркуш 'Шаблони': колонка A — назва, B — текст шаблону."""
+    templates = {}
+    for row in data[1:]:
+        if len(row) >= 2 and row[0] and row[1]:
+            templates[row[0].strip()] = row[1]
+    return templates
+
+
+def parse_behavior_rules(data: list) -> list:
+    """Аркуш 'Логіка': рядок заголовків + правила (Ситуація, Тригери, Відповідь, Дія)."""
+    if len(data) < 2:
+        return []
+    headers = data[0]
+    rules = []
+    for row in data[1:]:
+        if not row or not any(row):
+            continue
+        rule = {}
+        for i, header in enumerate(headers):
+            if i < len(row):
+                rule[header] = row[i]
+        triggers_str = rule.get('Тригери', '')
+        rule['triggers_list'] = [t.strip().lower() for t in triggers_str.split(',') if t.strip()]
+        rules.append(behavior_rule_from_fields(rule))
+    return rules
+
+
+def behavior_rule_from_fields(rule: dict) -> BehaviorRule:
+    """BehaviorRule з колонок рядка 'Логіка' (+ triggers_list)."""
+    return BehaviorRule(
+        situation=rule.get('Ситуація', ''),
+        triggers=tuple(rule.get('triggers_list', ())),
+        response=rule.get('Відповідь', ''),
+        action=rule.get('Дія', ''),
+        fields=MappingProxyType(dict(rule)),
+    )
+
+
+def parse_complex_questions(data: list) -> dict:
+    """Аркуш 'Складні_питання': колонка A — питання, B — відповідь (порожня = ще без відповіді)."""
+    questions = {}
+    for row in data[1:]:
+        if len(row) >= 2 and row[0] and row[1]:
+            questions[row[0].strip().lower()] = row[1]
+    return questions
+
+
+def build_drive_folder_map(products) -> dict:
+    """{назва_товару: folder_id} для товарів, у яких фото — посилання на Drive папку."""
+    folders = {}
+    for p in products:
+        photo_raw = product_photo_raw(p)
+        if photo_raw and is_drive_folder_url(photo_raw):
+            folder_id = extract_drive_folder_id(photo_raw)
+            if folder_id:
+                folders[product_name(p)] = folder_id
+    return folders
+
+
+CATALOG_HEADER = "== ПОВНИЙ КАТАЛОГ ТОВАРІВ (шукай товар ТІЛЬКИ тут) ==\n\n"
+CATALOG_FOOTER = "== КІНЕЦЬ КАТАЛОГУ. Називай ТІЛЬКИ товари з цього списку! ==\n"
+CATALOG_EMPTY = "Каталог товарів порожній."
+
+
+def render_product_block(i: int, p, drive_folders) -> str:
+    """
+    Відрендерити один товар каталогу для system prompt (i — номер у каталозі).
+    Фото — НЕ йдемо в Drive тут. Drive викликається ЛИШЕ при відправці фото.
+    """
+    out = []
+    add = out.append
+    name = product_name(p)
+    hp_id = p.get('ID Товара', '').strip()
+    add(f"📦 {i}. {name}")
+    if hp_id:
+        add(f" [HugeProfit ID: {hp_id}]")
+    add("\n")
+
+    where_to_wear = p.get('Куди носити', p.get('Куди носити ', ''))
+    if where_to_wear:
+        add(f"   Куди носити: {where_to_wear}\n")
+
+    material = p.get('Матеріал', '')
+    if material:
+        add(f"   Матеріал: {material}\n")
+
+    description = p.get('Опис товару', '')
+    if description:
+        add(f"   Опис: {description}\n")
+
+    colors = p.get('Кольори', p.get('Кольри', ''))
+    if colors:
+        add(f"   Кольори: {colors}\n")
+
+    sizes = p.get('Доступні розміри', '')
+    if sizes:
+        add(f"   Розміри: {sizes}\n")
+
+    related = p.get('Супутні товари', '')
+    if related:
+        add(f"   Супутні товари: {related}\n")
+
+    note = p.get('Примітка', '')
+    if note:
+        add(f"   Примітка: {note}\n")
+
+    photo_raw = product_photo_raw(p)
+    if photo_raw:
+        if name in drive_folders and is_drive_folder_url(photo_raw):
+            # folder_id вже в drive_folders — lazy-resolve при [PHOTO_REQUEST]
+            add(
+                f"   Фото файли: є Drive папка.\n"
+                f"     Щоб показати фото постав маркер:\n"
+                f"     [PHOTO_REQUEST:{name}/категорія/колір]\n"
+                f"     де «категорія» = Дівчинка / Хлопчик / Підліток / Дорослі / root\n"
+                f"     (обирай залежно від стать/вік клієнта; «root» якщо невідомо)\n"
+                f"     «колір» — точно з поля «Кольори» цього товару.\n"
+                f"     Для альбому: [ALBUM_REQUEST:{name}/категорія/колір1 колір2 колір3]\n"
+            )
+        else:
+            add(f"   Фото: {photo_raw}\n")
+
+    # Ціни по розмірам
+    prices = p.get('prices_by_size', ())
+    if prices:
+        add("   Ціни:\n")
+        for pr in prices:
+            if pr.has_discount:
+                # Знижка з колонки "Акція" (0 або порожньо = без знижки)
+                add(f"     {pr.sizes}: {pr.price} (акція -{pr.discount_pct}%: {pr.final_price} грн)\n")
+            else:
+                add(f"     {pr.sizes}: {pr.price}\n")
+
+    add("\n")
+    return ''.join(out)
+
+
+def render_products_context(products, drive_folders) -> str:
+    """Відрендерити ПОВНИЙ каталог товарів для system prompt."""
+    if not products:
+        return CATALOG_EMPTY
+    blocks = [render_product_block(i, p, drive_folders) for i, p in enumerate(products, 1)]
+    return CATALOG_HEADER + ''.join(blocks) + CATALOG_FOOTER
+
+
+@dataclass(frozen=True)
+class RenderedContext:
+    """
+    Відрендерений каталог для промпту + його розмір (для моніторингу росту промпту).
+    blocks — окремі блоки товарів (для вибірки релевантних товарів без повторного рендеру).
+    """
+    text: str
+    version: int
+    size_bytes: int
+    approx_tokens: int
+    blocks: tuple = ()
+
+    @classmethod
+    def render(cls, snapshot: KnowledgeBaseSnapshot) -> 'RenderedContext':
+        blocks = tuple(
+            render_product_block(i, p, snapshot.drive_folders)
+            for i, p in enumerate(snapshot.products, 1)
+        )
+        text = CATALOG_HEADER + ''.join(blocks) + CATALOG_FOOTER if blocks else CATALOG_EMPTY
+        return cls(
+            text=text,
+            version=snapshot.version,
+            size_bytes=len(text.encode('utf-8')),
+            approx_tokens=estimate_tokens(text),
+            blocks=blocks,
+        )
+
+    def render_slice(self, products, selected: list) -> str:
+        """
+        Каталог лише з обраними товарами (повні деталі) + короткий список назв решти.
+        selected — індекси товарів (0-based) у порядку релевантності.
+        """
+        if not self.blocks:
+            return CATALOG_EMPTY
+        chosen = set(selected)
+        out = ["== КАТАЛОГ: ТОВАРИ, РЕЛЕВАНТНІ ДО РОЗМОВИ (повні деталі) ==\n\n"]
+        out.extend(self.blocks[idx] for idx in selected)
+        rest = [
+            f"{i}. {product_name(p)}"
+            for i, p in enumerate(products, 1) if i - 1 not in chosen
+        ]
+        if rest:
+            out.append(
+                "== ІНШІ ТОВАРИ КАТАЛОГУ (лише назви) ==\n"
+                "Ціни, розміри, кольори та фото цих товарів зараз НЕ показані — не вигадуй їх. "
+                "Якщо клієнт цікавиться одним з них — уточни, який саме товар його цікавить.\n"
+            )
+            out.append('; '.join(rest) + "\n\n")
+        out.append(CATALOG_FOOTER)
+        return ''.join(out)
+
+
+def estimate_tokens(text: str) -> int:
+    """Груба оцінка кількості токенів (без запиту до API)."""
+    return len(text) // CHARS_PER_TOKEN
+
+
+def build_snapshot(sheets: dict) -> KnowledgeBaseSnapshot:
+    """
+    Зібрати знімок з сирих значень аркушів {назва_аркуша: [[...], ...]}.
+    Аркуша немає в sheets — він вважається відсутнім (AI працює без нього).
+    """
+    missing = frozenset(title for title in KB_SHEETS if title not in sheets)
+    products = parse_catalog(sheets.get(CATALOG_SHEET, []))
+    return KnowledgeBaseSnapshot(
+        products=tuple(products),
+        drive_folders=MappingProxyType(build_drive_folder_map(products)),
+        templates=MappingProxyType(parse_templates(sheets.get(TEMPLATES_SHEET, []))),
+        rules=tuple(parse_behavior_rules(sheets.get(RULES_SHEET, []))),
+        complex_questions=MappingProxyType(parse_complex_questions(sheets.get(QUESTIONS_SHEET, []))),
+        missing_sheets=missing,
+    )
+
+
+# ==================== ОФЛАЙН-ЗНІМОК ====================
+
+def snapshot_to_dict(snapshot: KnowledgeBaseSnapshot) -> dict:
+    """Знімок → JSON-сумісний dict (для файлу офлайн-знімка)."""
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'source_version': snapshot.source_version,
+        'loaded_at': snapshot.loaded_at,
+        'products': [p.to_dict() for p in snapshot.products],
+        'templates': dict(snapshot.templates),
+        'rules': [dict(rule.fields) for rule in snapshot.rules],
+        'complex_questions': dict(snapshot.complex_questions),
+        'missing_sheets': sorted(snapshot.missing_sheets),
+        'drive_folders': dict(snapshot.drive_folders),
+    }
+
+
+def snapshot_from_dict(data: dict) -> KnowledgeBaseSnapshot:
+    """dict з файлу → знімок (version=0 — номер присвоює кеш). ValueError якщо формат інший."""
+    if data.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"формат знімка {data.get('format')} != {SNAPSHOT_FORMAT}")
+    return KnowledgeBaseSnapshot(
+        products=tuple(Product.from_dict(p) for p in data['products']),
+        templates=MappingProxyType(data.get('templates', {})),
+        rules=tuple(behavior_rule_from_fields(r) for r in data.get('rules', [])),
+        complex_questions=MappingProxyType(data.get('complex_questions', {})),
+        missing_sheets=frozenset(data.get('missing_sheets', [])),
+        drive_folders=MappingProxyType(data.get('drive_folders', {})),
+        source_version=data.get('source_version', ''),
+        loaded_at=data.get('loaded_at', 0.0),
+    )
+
+
+def save_snapshot_file(snapshot: KnowledgeBaseSnapshot, path: str):
+    """Атомарно записати знімок у файл (tmp + rename)."""
+    write_json(path, snapshot_to_dict(snapshot), compact=True)
+
+
+def load_snapshot_file(path: str) -> Optional[KnowledgeBaseSnapshot]:
+    """Знімок з файлу або None (файлу немає / пошкоджений / старий формат)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return snapshot_from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Офлайн-знімок бази знань {path} не завантажено: {e}")
+        return None
+
+
+# ==================== КЕШ ====================
+
+class KnowledgeBaseCache:
+    """
+    Потокобезпечний кеш бази знань з TTL, invalidate() і фоновим оновленням.
+
+    loader — функція що завантажує та парсить усі аркуші (KnowledgeBaseSnapshot).
+    Має кидати виняток при помилці: тоді залишається попередній знімок.
+    version_probe — дешева функція що повертає версію джерела (або None якщо невідома).
+    Та сама (або старша — відстала репліка Drive) версія, що й у поточного знімка, —
+    loader не викликається.
+    """
+
+    def __init__(self, loader: Callable[[], KnowledgeBaseSnapshot], ttl: float = None,
+                 version_probe: Callable[[], Optional[str]] = None, snapshot_file: str = None):
+        self._loader = loader
+        self._version_probe = version_probe
+        # Файл офлайн-знімка: записується після кожного оновлення, читається load_offline()
+        self.snapshot_file = snapshot_file
+        self.ttl = DEFAULT_TTL if ttl is None else ttl
+        self._snapshot = KnowledgeBaseSnapshot()
+        self._expires_at = 0.0
+        # _lock — захист знімка; _load_lock — лише одне завантаження одночасно
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def snapshot(self) -> KnowledgeBaseSnapshot:
+        """Поточний знімок без перевірки TTL (може бути порожнім)."""
+        return self._snapshot
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self._expires_at
+
+    def get(self) -> KnowledgeBaseSnapshot:
+        """
+        Отримати знімок бази знань.
+        Свіжий — повертаємо одразу. Застарілий і працює фоновий потік —
+        повертаємо старий знімок і будимо потік. Інакше — синхронне оновлення.
+        """
+        if self.is_fresh():
+            return self._snapshot
+        if self._snapshot.version > 0 and self.is_background_running():
+            self._wake_event.set()
+            return self._snapshot
+        return self.refresh()
+
+    def refresh(self) -> KnowledgeBaseSnapshot:
+        """Завантажити базу знань заново (single-flight: паралельні виклики чекають один)."""
+        started = time.monotonic()
+        seen_version = self._snapshot.version
+        with self._load_lock:
+            # Поки чекали на lock — хтось інший вже оновив
+            if self._snapshot.version != seen_version and self.is_fresh():
+                return self._snapshot
+
+            source_version = self._probe_version()
+            if self._is_current_version(source_version):
+                # Цю версію вже розпарсено (поточна, або стара з відсталої репліки Drive —
+                # версії файлу лише зростають) — лише продовжуємо TTL
+                with self._lock:
+                    self._expires_at = time.monotonic() + self.ttl
+                logger.debug(f"Кеш бази знань: без змін (версія файлу {source_version})")
+                return self._snapshot
+
+            try:
+                loaded = self._loader()
+            except Exception as e:
+                logger.error(f"Кеш бази знань: помилка оновлення: {e}")
+                with self._lock:
+                    self._expires_at = time.monotonic() + min(self.ttl, RETRY_AFTER_ERROR)
+                return self._snapshot
+
+            snapshot = replace(
+                loaded,
+                version=self._snapshot.version + 1,
+                source_version=source_version or '',
+                loaded_at=time.time(),
+            )
+            with self._lock:
+                self._snapshot = snapshot
+                self._expires_at = time.monotonic() + self.ttl
+            logger.info(
+                f"Кеш бази знань оновлено: {len(snapshot.products)} товарів, "
+                f"{len(snapshot.templates)} шаблонів, {len(snapshot.rules)} правил, "
+                f"{len(snapshot.complex_questions)} питань — версія {snapshot.version}, "
+                f"{time.monotonic() - started:.2f}с"
+            )
+            self._save_offline(snapshot)
+            return snapshot
+
+    def _is_current_version(self, source_version: Optional[str]) -> bool:
+        """Версія файлу не новіша за версію поточного знімка (число до ':' лише зростає)."""
+        current = self._snapshot.source_version
+        if not source_version or not current:
+            return False
+        if source_version == current:
+            return True
+        probed, known = source_version.split(':', 1)[0], current.split(':', 1)[0]
+        return probed.isdigit() and known.isdigit() and int(probed) < int(known)
+
+    # ==================== ОФЛАЙН-ЗНІМОК ====================
+
+    def load_offline(self) -> bool:
+        """
+        Завантажити знімок з файлу (при старті, до підключення до Google).
+        Знімок одразу доступний через get(); TTL — як у щойно завантаженого,
+        далі звичайне оновлення (та сама версія файлу в Drive — без повторного парсингу).
+        """
+        if not self.snapshot_file:
+            return False
+        started = time.monotonic()
+        offline = load_snapshot_file(self.snapshot_file)
+        if offline is None:
+            return False
+        with self._load_lock:
+            if self._snapshot.version > 0:
+                return False  # вже є свіжіший знімок з мережі
+            snapshot = replace(offline, version=1)
+            with self._lock:
+                self._snapshot = snapshot
+                self._expires_at = time.monotonic() + self.ttl
+        age = time.time() - snapshot.loaded_at if snapshot.loaded_at else 0
+        logger.info(
+            f"Офлайн-знімок бази знань: {len(snapshot.products)} товарів, {len(snapshot.rules)} правил "
+            f"(завантажено з Google {age / 60:.0f} хв тому) за {(time.monotonic() - started) * 1000:.0f} мс"
+        )
+        return True
+
+    def _save_offline(self, snapshot: KnowledgeBaseSnapshot):
+        if not self.snapshot_file:
+            return
+        try:
+            save_snapshot_file(snapshot, self.snapshot_file)
+        except Exception as e:
+            logger.warning(f"Офлайн-знімок бази знань не збережено: {e}")
+
+    def _probe_version(self) -> Optional[str]:
+        """Версія джерела або None (немає probe / помилка — тоді завжди повне завантаження)."""
+        if not self._version_probe:
+            return None
+        try:
+            return self._version_probe()
+        except Exception as e:
+            logger.warning(f"Кеш бази знань: не вдалося перевірити версію файлу: {e}")
+            return None
+
+    def invalidate(self):
+        """
+        Позначити знімок застарілим і забути версію файлу —
+        наступний get() (або фоновий потік) завантажить таблицю повністю.
+        """
+        with self._lock:
+            self._expires_at = 0.0
+            self._snapshot = replace(self._snapshot, source_version='')
+        self._wake_event.set()
+        logger.info("Кеш бази знань інвалідовано")
+
+    # ==================== ФОНОВЕ ОНОВЛЕННЯ ====================
+
+    def is_background_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start_background_refresh(self, interval: float = None):
+        """Запустити daemon-потік що оновлює знімок кожні interval секунд (0 = не запускати)."""
+        interval = DEFAULT_REFRESH_INTERVAL if interval is None else interval
+        if interval <= 0 or self.is_background_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._background_loop, args=(interval,),
+            name='knowledge-base-refresh', daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Кеш бази знань: фонове оновлення кожні {interval:.0f}с")
+
+    def stop_background_refresh(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _background_loop(self, interval: float):
+        while not self._stop_event.is_set():
+            if self.is_fresh():
+                # Спимо до наступного оновлення або до invalidate() / застарілого get()
+                woken = self._wake_event.wait(timeout=interval)
+                self._wake_event.clear()
+                if self._stop_event.is_set():
+                    break
+                if woken and self.is_fresh():
+                    continue
+            self.refresh()
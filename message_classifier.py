@@ -0,0 +1,203 @@
+"""
+Message Classifier - локальна (без мережі) оцінка складності повідомлення клієнта
+перед викликом Gemini.
+
+- 'template' — подяка / "ок" / емодзі / привітання / прощання: готова відповідь з prompts.yml,
+  без виклику AI
+- 'small'    — коротке повідомлення без товару/замовлення: мала модель (GEMINI_SMALL_MODEL)
+  з системним промптом без каталогу
+- 'full'     — товар, ціна, розмір, замовлення, фото/голосові, відповідь на питання бота: повна модель
+
+Правила консервативні: будь-яка ознака змісту (цифри, "?", слова про товар/замовлення,
+назва товару з каталогу, колір, довжина, відповідь на питання бота) → 'full'.
+Шаблон / мала модель — лише поза активним діалогом про товар чи замовлення
+(останні ACTIVE_DIALOGUE_MESSAGES повідомлень історії без таких ознак).
+
+Env:
+    MESSAGE_CLASSIFIER  — off | shadow (лише лог рішень) | on  (за замовчуванням shadow)
+    GEMINI_SMALL_MODEL  — модель для 'small' (не задано — такі повідомлення йдуть на повну модель)
+"""
+import os
+import re
+import logging
+from typing import NamedTuple
+
+from drive_photos import COLOR_SYNONYMS
+from search_index import CatalogIndex, stem
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_CLASSIFIER_MODE = os.getenv('MESSAGE_CLASSIFIER', 'shadow').strip().lower()
+GEMINI_SMALL_MODEL = os.getenv('GEMINI_SMALL_MODEL', '').strip()
+# Довші повідомлення завжди йдуть на повну модель
+SMALL_MAX_WORDS = 8
+# Скільки останніх повідомлень історії перевіряти на активний діалог про товар/замовлення
+ACTIVE_DIALOGUE_MESSAGES = 6
+# Збіги каталогу, що вважаються згадкою товару (категорія і нечіткі триграми — надто шумні)
+PRODUCT_MATCH_KINDS = CatalogIndex.NAME_KINDS + ('artikul', 'tokens')
+# Часткова назва ("харп" → "Харпер") — лише для запитів не коротших за стільки символів
+MIN_PARTIAL_NAME = 4
+
+_WORD_RE = re.compile(r"[0-9a-zа-яіїєґё'ʼ]+")
+_DIGIT_RE = re.compile(r'\d')
+
+# Повідомлення лише з цих слів (+ емодзі/пунктуація) — шаблонна відповідь
+_THANKS = {'дякую', 'дякуємо', 'дуже', 'щиро', 'спасибі', 'спасибо', 'пасиб', 'мерсі', 'сенкс', 'thanks',
+           'thank', 'you', 'thx', 'вам', 'велике', 'величезне', 'і', 'й', 'та'}
+_ACK = {'ок', 'окей', 'ok', 'okay', 'добре', 'добренько', 'зрозуміло', 'зрозуміла', 'зрозумів', 'ясно',
+        'угу', 'ага', 'супер', 'клас', 'чудово', 'прекрасно', 'відмінно', 'гаразд', 'домовились',
+        'все', 'понятно', 'хорошо', 'ладно'}
+_BYE = {'до', 'побачення', 'бувай', 'бувайте', 'гарного', 'хорошого', 'дня', 'вечора',
+        'всього', 'найкращого', 'на', 'зв\'язку', 'звʼязку', 'навзаєм'}
+_GREETING = {'привіт', 'привітик', 'вітаю', 'добрий', 'доброго', 'день', 'дня', 'ранку', 'вечір',
+             'вечора', 'здрастуйте', 'здравствуйте', 'hello', 'hi', 'хай'}
+
+# Основи слів про товар / замовлення / доставку — завжди повна модель
+_FULL_WORDS = (
+    'ціна', 'ціну', 'ціни', 'скільки', 'коштує', 'вартість', 'знижк', 'акці', 'розмір', 'зріст',
+    'колір', 'кольор', 'наявн', 'модел', 'костюм', 'куртк', 'штани', 'сукн', 'футболк',
+    'кофт', 'светр', 'комбінезон', 'взутт', 'шапк', 'замов', 'оформ', 'беру', 'візьму', 'хочу',
+    'доставк', 'відправ', 'пошт', 'відділен', 'оплат', 'передоплат', 'накладен', 'ттн', 'повернен',
+    'обмін', 'фото', 'покаж', 'скин', 'менеджер', 'оператор', 'телефон', 'номер', 'адрес', 'місто',
+    'підтверд', 'прізвищ', 'отрима', 'кошик',
+)
+_FULL_STEMS = {stem(w) for w in _FULL_WORDS}
+
+# Кольори (таблиця синонімів фото + базові) — згадка кольору означає вибір товару
+_COLOR_WORDS = set(COLOR_SYNONYMS) | {c for values in COLOR_SYNONYMS.values() for c in values} | {
+    'чорний', 'білий', 'сірий', 'рожевий', 'жовтий', 'бежевий', 'коричневий', 'фіолетовий',
+    'помаранчевий', 'бірюзовий', 'графітовий', 'молочний', 'пудровий', 'мʼятний', "м'ятний",
+    'бузковий', 'лавандовий', 'малиновий', 'персиковий', 'кремовий', 'оливковий', 'бордовий',
+}
+_COLOR_STEMS = {stem(c) for c in _COLOR_WORDS}
+
+# Згода / відмова — це відповідь на пропозицію бота, а не ввічливість
+_ANSWER_WORDS = {'так', 'да', 'ні', 'нє', 'не', 'давайте', 'давай', 'можна', 'звісно', 'звичайно',
+                 'згодна', 'згоден', 'підходить', 'підійде', 'беремо', 'пропоную'}
+
+
+class MessageRoute(NamedTuple):
+    kind: str               # 'template' | 'small' | 'full'
+    reason: str
+    template: str = None    # ключ prompts.yml для 'template'
+
+
+FULL = MessageRoute('full', 'default')
+
+
+def _last_assistant_message(history: list) -> str:
+    for msg in reversed(history or []):
+        if msg.get('role') == 'assistant':
+            return msg.get('content') or ''
+    return ''
+
+
+def _is_color(word: str) -> bool:
+    word_stem = stem(word)
+    return len(word_stem) >= 3 and any(
+        word_stem.startswith(c) or (len(word_stem) >= 4 and c.startswith(word_stem)) for c in _COLOR_STEMS
+    )
+
+
+def _mentions_product(text: str, catalog: CatalogIndex = None) -> str:
+    """Причина 'full', якщо текст стосується товару/замовлення ('' — ні)."""
+    lowered = (text or '').lower()
+    if _DIGIT_RE.search(lowered):
+        return 'digits'
+    words = _WORD_RE.findall(lowered)
+    if any(stem(w) in _FULL_STEMS or any(w.startswith(f) for f in _FULL_WORDS) for w in words):
+        return 'keywords'
+    if any(_is_color(w) for w in words):
+        return 'color'
+    if catalog is not None:
+        for match in catalog.search(lowered, limit=3):
+            if match.kind in PRODUCT_MATCH_KINDS and (
+                    match.kind != 'query_in_name' or len(lowered.strip()) >= MIN_PARTIAL_NAME):
+                return 'product'
+    return ''
+
+
+def _active_dialogue(history: list, catalog: CatalogIndex = None) -> bool:
+    """Останні повідомлення розмови — про товар, ціну, розмір чи замовлення."""
+    recent = (history or [])[-ACTIVE_DIALOGUE_MESSAGES:]
+    return any(_mentions_product(msg.get('content') or '', catalog) for msg in recent)
+
+
+def classify(text: str, message_type: str = 'text', history: list = None,
+             catalog: CatalogIndex = None) -> MessageRoute:
+    """
+    Рішення за текстом повідомлення (для burst — об'єднаним текстом), типом і історією розмови
+    (history — як Database.get_conversation_history: [{role, content}, ...]).
+    catalog — CatalogIndex поточного знімка: назви товарів ("А Харпер є") → 'full'.
+    """
+    if message_type != 'text':
+        return MessageRoute('full', 'media')
+    text = (text or '').strip()
+    if not text:
+        return MessageRoute('full', 'empty')
+    if '?' in text:
+        return MessageRoute('full', 'question')
+    reason = _mentions_product(text, catalog)
+    if reason:
+        return MessageRoute('full', reason)
+
+    words = _WORD_RE.findall(text.lower())
+    if len(words) > SMALL_MAX_WORDS:
+        return MessageRoute('full', 'long')
+
+    vocab = set(words)
+    last_bot = _last_assistant_message(history)
+    if last_bot and ('?' in last_bot or vocab & _ANSWER_WORDS):
+        # "Ок" / "👍" / "так" у відповідь на "Бажаєте замовити?" — це відповідь, а не ввічливість
+        return MessageRoute('full', 'answer')
+    if _active_dialogue(history, catalog):
+        # "Ок" після "Підтвердіть, будь ласка." / ціни / розміру — частина продажу
+        return MessageRoute('full', 'active-dialogue')
+
+    if not vocab:
+        return MessageRoute('template', 'emoji', 'ack_reply')
+    if vocab <= _THANKS | _ACK | _BYE and vocab & _BYE - {'на', 'до', 'дня'}:
+        return MessageRoute('template', 'goodbye', 'goodbye')
+    if vocab <= _THANKS and vocab & {'дякую', 'дякуємо', 'спасибі', 'спасибо', 'пасиб', 'мерсі',
+                                       'сенкс', 'thanks', 'thank', 'thx'}:
+        return MessageRoute('template', 'thanks', 'ack_reply')
+    if vocab <= _THANKS | _ACK:
+        return MessageRoute('template', 'ack', 'ack_reply')
+    if vocab <= _GREETING:
+        if last_bot:
+            # Привітання посеред розмови — клієнт повертається до попередньої теми
+            return MessageRoute('full', 'greeting-mid')
+        return MessageRoute('template', 'greeting', 'greeting')
+    return MessageRoute('small', 'short')
+
+
+class MessageClassifier:
+    """Режим (off / shadow / on) + мала модель; рішення логуються."""
+
+    def __init__(self, mode: str = None, small_model: str = None):
+        self.mode = MESSAGE_CLASSIFIER_MODE if mode is None else mode
+        self.small_model = GEMINI_SMALL_MODEL if small_model is None else small_model
+        self.counts = {'template': 0, 'small': 0, 'full': 0}
+
+    def route(self, text: str, message_type: str = 'text', history: list = None,
+              templates: dict = None, catalog: CatalogIndex = None) -> MessageRoute:
+        """
+        Рішення з урахуванням режиму: у shadow/off завжди 'full' (shadow — з логом рішення);
+        'template' без шаблону в prompts.yml і 'small' без GEMINI_SMALL_MODEL — теж 'full'.
+        """
+        if self.mode == 'off':
+            return FULL
+        decision = classify(text, message_type, history, catalog)
+        if decision.kind == 'template' and templates is not None and not templates.get(decision.template):
+            decision = MessageRoute('full', f"no-template:{decision.template}")
+        if decision.kind == 'template' and templates and templates.get(decision.template) == \
+                _last_assistant_message(history).strip():
+            decision = MessageRoute('full', 'repeat')  # шаблон щойно відправлено — хай відповідає AI
+        self.counts[decision.kind] += 1
+        if self.mode == 'shadow':
+            if decision.kind != 'full':
+                logger.info(f"Класифікатор (shadow): '{text[:40]}' → {decision.kind} ({decision.reason})")
+            return FULL
+        if decision.kind == 'small' and not self.small_model:
+            return MessageRoute('full', 'no-small-model')
+        return decision
@@ -0,0 +1,144 @@
+"""
+Навантажувальний тест підсистеми каталогу на локальній заміні Google (без мережі й credentials).
+
+Для кожного розміру синтетичного каталогу (scripts/google_fixtures.py) проганяє справжній
+GoogleSheetsManager поверх scripts/fake_google.py і міряє:
+- завантаження + парсинг бази знань (values:batchGet → знімок)
+- рендер каталогу для AI і вибірку релевантних товарів
+- пошук товару, тригери, FAQ
+- синхронізацію Drive маніфесту, resolve_photo_request, дисковий кеш фото (холодний/теплий)
++ кількість викликів Google API за прогін.
+
+Використання:
+    python scripts/bench_catalog.py
+    python scripts/bench_catalog.py --sizes 10 1000 10000 --latency 0.05 --queries 200
+    python scripts/bench_catalog.py --fixture fixtures/live   # записана жива таблиця
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Маніфест, кеш фото, офлайн-знімок і черга питань — у тимчасову директорію, не в data/
+_WORK_DIR = Path(tempfile.mkdtemp(prefix='bench-catalog-'))
+os.environ.setdefault('DRIVE_MANIFEST_FILE', str(_WORK_DIR / 'drive_manifest.json'))
+os.environ.setdefault('PHOTO_CACHE_DIR', str(_WORK_DIR / 'photo_cache'))
+os.environ.setdefault('KB_SNAPSHOT_FILE', str(_WORK_DIR / 'kb_snapshot.json'))
+os.environ.setdefault('QUESTIONS_PENDING_FILE', str(_WORK_DIR / 'pending_questions.json'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from drive_photos import DriveManifest, PhotoCache  # noqa: E402
+from fake_google import Fixture, attach_fake  # noqa: E402
+from google_fixtures import generate_fixture  # noqa: E402
+from google_sheets import GoogleSheetsManager  # noqa: E402
+from knowledge_base import product_name  # noqa: E402
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def _per_call_us(fn, items: list) -> float:
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - started) / max(len(items), 1) * 1e6
+
+
+def make_queries(snapshot, count: int, seed: int = 7) -> list:
+    """Повідомлення клієнтів: назва товару (часом без лапок / з помилкою) + розмір/колір."""
+    rnd = random.Random(seed)
+    products = list(snapshot.products)
+    queries = []
+    for _ in range(count):
+        p = rnd.choice(products)
+        name = product_name(p).replace('"', '')
+        if rnd.random() < 0.3 and len(name) > 6:
+            pos = rnd.randrange(1, len(name) - 1)
+            name = name[:pos] + name[pos + 1:]
+        tail = rnd.choice(('є на 128?', 'ціна на М', 'який колір є?', 'скільки коштує', 'доставка завтра?'))
+        queries.append(f"Добрий день, {name.lower()} {tail}")
+    return queries
+
+
+def run(fixture: Fixture, queries_count: int, label: str) -> dict:
+    gs = GoogleSheetsManager()
+    # Окремий маніфест / кеш фото / офлайн-знімок на кожен прогін (ID папок у фікстурах повторюються)
+    run_dir = Path(tempfile.mkdtemp(prefix=f'{label}-', dir=_WORK_DIR))
+    gs.drive_manifest = DriveManifest(gs._new_drive_service, path=run_dir / 'drive_manifest.json')
+    gs.photo_cache = PhotoCache(directory=run_dir / 'photo_cache')
+    gs.kb_cache.snapshot_file = str(run_dir / 'kb_snapshot.json')
+    attach_fake(gs, fixture)
+    row = {'label': label}
+
+    snapshot, row['load_ms'] = _timed(gs.kb_cache.refresh)
+    row['products'] = len(snapshot.products)
+    _, row['render_ms'] = _timed(gs.get_products_context_for_ai)
+
+    queries = make_queries(snapshot, queries_count)
+    _, row['index_ms'] = _timed(gs.get_catalog_index)
+    row['find_us'] = _per_call_us(gs.find_product_by_name, queries)
+    row['slice_us'] = _per_call_us(gs.get_products_context_slice, queries)
+    row['triggers_us'] = _per_call_us(gs.check_triggers, queries)
+    row['faq_us'] = _per_call_us(gs.find_answer_for_question, queries)
+
+    _, row['manifest_ms'] = _timed(gs.drive_manifest.sync, snapshot.drive_folders)
+    gs._index_manifest_urls()
+    rnd = random.Random(3)
+    photo_requests = [
+        (product_name(p), rnd.choice(('Дівчинка', 'Хлопчик', 'root')),
+         rnd.choice(p.get('Кольори', '').split(', ')).lower())
+        for p in snapshot.products if product_name(p) in snapshot.drive_folders
+    ][:queries_count]
+    row['resolve_us'] = _per_call_us(lambda r: gs.resolve_photo_request(*r), photo_requests)
+
+    urls = [u for u in (gs.resolve_photo_request(*r) for r in photo_requests[:50]) if u]
+    _, row['photo_cold_ms'] = _timed(lambda: [gs.get_drive_photo_path(u) for u in urls])
+    _, row['photo_warm_ms'] = _timed(lambda: [gs.get_drive_photo_path(u) for u in urls])
+    row['photos'] = len(urls)
+
+    gs.drive_manifest.stop_background_sync()
+    row['api_calls'] = dict(fixture.calls)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Навантажувальний тест каталогу на локальній заміні Google")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--fixture', help="директорія фікстури замість синтетичного каталогу")
+    parser.add_argument('--latency', type=float, default=0.0, help="імітована затримка виклику API, с")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    if args.fixture:
+        cases = [(Path(args.fixture).name, lambda: Fixture.load(args.fixture, latency=args.latency))]
+    else:
+        cases = [(str(n), lambda n=n: Fixture(*generate_fixture(n), latency=args.latency)) for n in args.sizes]
+
+    print(f"{'каталог':>8} {'товарів':>8} {'load':>8} {'render':>8} {'index':>8} {'find':>8} "
+          f"{'slice':>8} {'trig':>7} {'faq':>7} {'manifest':>9} {'resolve':>8} {'фото хол/тепл':>15}")
+    print(f"{'':>8} {'':>8} {'мс':>8} {'мс':>8} {'мс':>8} {'мкс':>8} {'мкс':>8} {'мкс':>7} {'мкс':>7} "
+          f"{'мс':>9} {'мкс':>8} {'мс':>15}")
+    for label, make in cases:
+        row = run(make(), args.queries, label)
+        photos = f"{row['photo_cold_ms']:.0f}/{row['photo_warm_ms']:.1f} ({row['photos']})"
+        print(f"{row['label']:>8} {row['products']:>8} {row['load_ms']:>8.1f} {row['render_ms']:>8.1f} "
+              f"{row['index_ms']:>8.1f} {row['find_us']:>8.0f} {row['slice_us']:>8.0f} "
+              f"{row['triggers_us']:>7.1f} {row['faq_us']:>7.1f} {row['manifest_ms']:>9.1f} "
+              f"{row['resolve_us']:>8.1f} {photos:>15}")
+        if args.verbose:
+            print(f"         виклики API: {row['api_calls']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Бенчмарк парсера аркуша 'Каталог': попередній парсер vs parse_catalog
+(ролі колонок визначаються один раз, рядки-продовження групуються за один прохід,
+ціни/акції розпарсені в PriceBlock один раз — а не при кожному рендері;
+новий парсер одразу будує й таблицю цін товару розмір → PriceBlock).
+
+Перевіряє, що результати збігаються (назви, колонки, розміри/ціни/акції),
+і міряє час парсингу та рендеру каталогу на синтетичному аркуші.
+
+Використання:
+    python scripts/bench_catalog_parser.py
+    python scripts/bench_catalog_parser.py --rows 5000 20000 --repeat 20
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from google_fixtures import generate_fixture  # noqa: E402
+from knowledge_base import CATALOG_SHEET, parse_catalog  # noqa: E402
+
+
+def _log(message: str):
+    pass
+
+
+def legacy_parse_catalog(data: list) -> list:
+    """Попередній парсер (до CatalogColumns/Product) — еталон для порівняння."""
+    if len(data) < 2:
+        _log("Каталог порожній")
+        return []
+
+    # Знаходимо рядок з заголовками (може бути не перший)
+    headers = None
+    header_row_idx = 0
+    for i, row in enumerate(data):
+        if 'Назва' in row or 'Назва ' in row:
+            headers = [h.strip() for h in row]
+            header_row_idx = i
+            break
+
+    if not headers:
+        _log("Заголовки не знайдено")
+        return []
+
+    products = []
+    current_product = None
+
+    for row in data[header_row_idx + 1:]:
+        if not row or not any(row):
+            continue
+
+        # Якщо є назва - це новий товар
+        name_idx = headers.index('Назва') if 'Назва' in headers else headers.index('Назва ')
+        if row[name_idx] and row[name_idx].strip():
+            # Зберігаємо попередній товар
+            if current_product:
+                products.append(current_product)
+
+            current_product = {}
+            for i, header in enumerate(headers):
+                if i < len(row) and row[i]:
+                    current_product[header] = row[i]
+
+            # Ініціалізуємо список цін по розмірам
+            current_product['prices_by_size'] = []
+            size_col = None
+            price_col = None
+            discount_col = None
+            for i, h in enumerate(headers):
+                if 'розмір' in h.lower():
+                    size_col = i
+                if 'ціна' in h.lower() and 'акція' not in h.lower():
+                    price_col = i
+                if 'акція' in h.lower():
+                    discount_col = i
+
+            if size_col is not None and price_col is not None:
+                if row[size_col] and row[price_col]:
+                    discount_val = ''
+                    if discount_col is not None and discount_col < len(row):
+                        discount_val = row[discount_col].strip()
+                    current_product['prices_by_size'].append({
+                        'sizes': row[size_col],
+                        'price': row[price_col],
+                        'discount': discount_val
+                    })
+
+        elif current_product:
+            # Додатковий рядок з розмірами/цінами для поточного товару
+            size_col = None
+            price_col = None
+            discount_col = None
+            for i, h in enumerate(headers):
+                if 'розмір' in h.lower():
+                    size_col = i
+                if 'ціна' in h.lower() and 'акція' not in h.lower():
+                    price_col = i
+                if 'акція' in h.lower():
+                    discount_col = i
+
+            if size_col is not None and price_col is not None:
+                if len(row) > size_col and len(row) > price_col:
+                    if row[size_col] and row[price_col]:
+                        discount_val = ''
+                        if discount_col is not None and discount_col < len(row):
+                            discount_val = row[discount_col].strip()
+                        current_product['prices_by_size'].append({
+                            'sizes': row[size_col],
+                            'price': row[price_col],
+                            'discount': discount_val
+                        })
+
+    # Додаємо останній товар
+    if current_product:
+        products.append(current_product)
+
+    return products
+
+
+
+def make_sheet(rows: int) -> list:
+    """Аркуш 'Каталог' на ~rows рядків (заголовок + товари з рядками-продовженнями)."""
+    sheet = generate_fixture(max(rows // 2, 1))[0]['sheets'][CATALOG_SHEET]
+    while len(sheet) <= rows:
+        sheet = generate_fixture(len(sheet))[0]['sheets'][CATALOG_SHEET]
+    sheet = sheet[:rows + 1]
+    # Як fill_gaps(): рядки однакової довжини
+    width = max(len(r) for r in sheet)
+    return [r + [''] * (width - len(r)) for r in sheet]
+
+
+def check_equal(legacy: list, parsed: list):
+    if len(legacy) != len(parsed):
+        raise SystemExit(f"Різна кількість товарів: {len(legacy)} vs {len(parsed)}")
+    for old, new in zip(legacy, parsed):
+        if old != new.to_dict():
+            raise SystemExit(f"Розбіжність для товару {new.name!r}")
+
+
+def _best_ms(fn, arg, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def render_prices_legacy(products: list) -> str:
+    """Рядки цін як у render_product_block до PriceBlock (ціна/акція парсяться при кожному рендері)."""
+    out = []
+    for p in products:
+        for pr in p['prices_by_size']:
+            price_str = pr.get('price', '')
+            discount_str = pr.get('discount', '').replace('%', '').strip()
+            try:
+                price_num = int(''.join(filter(str.isdigit, price_str)))
+                discount_pct = 0
+                if discount_str:
+                    try:
+                        discount_pct = int(discount_str)
+                    except ValueError:
+                        pass
+                if discount_pct > 0:
+                    discounted = int(price_num * (1 - discount_pct / 100))
+                    out.append(f"{pr.get('sizes')}: {price_str} (акція -{discount_pct}%: {discounted} грн)")
+                else:
+                    out.append(f"{pr.get('sizes')}: {price_str}")
+            except Exception:
+                out.append(f"{pr.get('sizes')}: {price_str}")
+    return '\n'.join(out)
+
+
+def render_prices(products: list) -> str:
+    """Рядки цін з PriceBlock (числа вже розпарсені)."""
+    out = []
+    for p in products:
+        for pr in p.prices_by_size:
+            if pr.price_value is not None and pr.discount_pct > 0:
+                discounted = int(pr.price_value * (1 - pr.discount_pct / 100))
+                out.append(f"{pr.sizes}: {pr.price} (акція -{pr.discount_pct}%: {discounted} грн)")
+            else:
+                out.append(f"{pr.sizes}: {pr.price}")
+    return '\n'.join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк парсера аркуша 'Каталог'")
+    parser.add_argument('--rows', type=int, nargs='+', default=[500, 5000, 20000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'рядків':>7} {'товарів':>8} {'старий, мс':>11} {'новий, мс':>10} {'прискорення':>12} "
+          f"{'рендер цін старий/новий, мс':>28}")
+    for rows in args.rows:
+        sheet = make_sheet(rows)
+        legacy = legacy_parse_catalog(sheet)
+        parsed = parse_catalog(sheet)
+        check_equal(legacy, parsed)
+
+        old_ms = _best_ms(legacy_parse_catalog, sheet, args.repeat)
+        new_ms = _best_ms(parse_catalog, sheet, args.repeat)
+        if render_prices_legacy(legacy) != render_prices(parsed):
+            raise SystemExit("Розбіжність рендеру цін")
+        render_old = _best_ms(render_prices_legacy, legacy, args.repeat)
+        render_new = _best_ms(render_prices, parsed, args.repeat)
+        print(f"{rows:>7} {len(parsed):>8} {old_ms:>11.2f} {new_ms:>10.2f} {old_ms / new_ms:>11.1f}x "
+              f"{render_old:>14.2f} / {render_new:.2f}")
+
+
+if __name__ == '__main__':
+    main()
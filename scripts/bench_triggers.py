@@ -0,0 +1,105 @@
+"""
+Мікро-бенчмарк перевірки тригерів правил поведінки (аркуш 'Логіка').
+
+Порівнює:
+- naive — як раніше: `trigger in message` для кожного тригера кожного правила
+- automaton — TriggerMatcher (Ахо–Корасік), один прохід по повідомленню
+  (find_all — завжди автомат; first — автомат лише понад SCAN_THRESHOLD тригерів)
+
+Використання:
+    python scripts/bench_triggers.py
+    python scripts/bench_triggers.py --sizes 10 100 1000 5000 --messages 2000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from search_index import TriggerMatcher  # noqa: E402
+
+# Слова повідомлень клієнтів і слова, з яких складаються тригери (перетин — лише частина)
+_MESSAGE_WORDS = (
+    'костюм', 'куртка', 'штани', 'розмір', 'ціна', 'доставка', 'оплата', 'наявність', 'колір',
+    'чорний', 'білий', 'сірий', 'дитячий', 'спортивний', 'теплий', 'худі', 'футболка', 'замовити',
+    'скільки', 'коли', 'де', 'добрий', 'день', 'на', 'зріст', 'років', 'хлопчика', 'дівчинки',
+)
+_TRIGGER_WORDS = (
+    'повернення', 'обмін', 'знижка', 'передплата', 'накладений', 'платіж', 'брак', 'скарга',
+    'менеджер', 'оператор', 'гурт', 'опт', 'промокод', 'сертифікат', 'таблиця', 'розмірів',
+    'доставка', 'оплата', 'наявність', 'укрпошта', 'самовивіз', 'терміново', 'подарунок',
+)
+
+
+def make_rules(trigger_count: int, per_rule: int = 5, seed: int = 42) -> list:
+    """Синтетичні правила: кортежі тригерів з 1–3 слів, як в аркуші 'Логіка'."""
+    rnd = random.Random(seed)
+    triggers = []
+    while len(triggers) < trigger_count:
+        words = rnd.sample(_TRIGGER_WORDS, rnd.randint(1, 3))
+        suffix = f" {len(triggers)}" if len(triggers) >= len(_TRIGGER_WORDS) else ''
+        triggers.append(' '.join(words) + suffix)
+    return [tuple(triggers[i:i + per_rule]) for i in range(0, len(triggers), per_rule)]
+
+
+def make_messages(count: int, seed: int = 7) -> list:
+    """Повідомлення клієнтів: 3–25 слів, зрідка з тригерним словом."""
+    rnd = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        words = [rnd.choice(_MESSAGE_WORDS) for _ in range(rnd.randint(3, 25))]
+        messages.append(' '.join(words))
+    return messages
+
+
+def naive_first(rules: list, message: str):
+    for rule_index, triggers in enumerate(rules):
+        for trigger in triggers:
+            if trigger in message:
+                return rule_index
+    return None
+
+
+def bench(sizes: list, message_count: int):
+    messages = make_messages(message_count)
+    print(f"{'тригерів':>9} {'правил':>7} {'побудова, мс':>13} {'naive, мкс':>11} "
+          f"{'автомат, мкс':>13} {'first(), мкс':>13} {'прискорення':>12}")
+    for size in sizes:
+        rules = make_rules(size)
+
+        started = time.perf_counter()
+        matcher = TriggerMatcher(rules)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        expected = [naive_first(rules, m) for m in messages]
+        naive_us = (time.perf_counter() - started) / len(messages) * 1e6
+
+        started = time.perf_counter()
+        got = [matcher.first(m) for m in messages]
+        first_us = (time.perf_counter() - started) / len(messages) * 1e6
+
+        started = time.perf_counter()
+        for m in messages:
+            matcher.find_all(m)
+        auto_us = (time.perf_counter() - started) / len(messages) * 1e6
+
+        got = [m.rule_index if m else None for m in got]
+        if got != expected:
+            raise SystemExit(f"Розбіжність результатів для {size} тригерів")
+        print(f"{size:>9} {len(rules):>7} {build_ms:>13.1f} {naive_us:>11.1f} "
+              f"{auto_us:>13.1f} {first_us:>13.1f} {naive_us / first_us:>11.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк тригерів: naive vs Ахо–Корасік")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 100, 500, 1000, 5000])
+    parser.add_argument('--messages', type=int, default=1000)
+    args = parser.parse_args()
+    bench(args.sizes, args.messages)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Офлайн-оцінка режиму CATALOG_CONTEXT_MODE=relevant на записаних розмовах.
+
+Для кожного повідомлення клієнта, на яке бот відповів, порівнює:
+- розмір промпту: повний каталог vs вибірка top-K (байти / приблизні токени)
+- покриття: товари, які бот реально назвав у відповіді (з повним каталогом),
+  чи потрапили вони у вибірку top-K
+
+Використання:
+    python scripts/eval_catalog_slice.py --from-db --top-k 8
+    python scripts/eval_catalog_slice.py --catalog kb.json --conversations convs.jsonl
+
+    kb.json — {"Каталог": [[...рядки аркуша...]], ...} (як values:batchGet)
+    convs.jsonl — по рядку {"username": ..., "role": "user"|"assistant", "content": ...}
+                  у хронологічному порядку
+"""
+import argparse
+import json
+import sys
+from dataclasses import replace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from knowledge_base import RenderedContext, build_snapshot, estimate_tokens  # noqa: E402
+from search_index import CatalogRetriever, normalize  # noqa: E402
+
+
+def load_snapshot(catalog_path: str = None):
+    """Знімок бази знань з JSON-файлу або з живої Google таблиці."""
+    if catalog_path:
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            return replace(build_snapshot(json.load(f)), version=1)
+    from google_sheets import GoogleSheetsManager
+    gs = GoogleSheetsManager()
+    if not gs.connect():
+        raise SystemExit("Не вдалося підключитися до Google Sheets (вкажи --catalog)")
+    return gs.kb_cache.get()
+
+
+def load_conversations(path: str = None, limit_users: int = 200) -> dict:
+    """{username: [{role, content}, ...]} з JSONL-файлу або з PostgreSQL."""
+    if path:
+        conversations = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    msg = json.loads(line)
+                    conversations.setdefault(msg['username'], []).append(msg)
+        return conversations
+    from database import Database
+    return Database().get_recorded_conversations(limit_users=limit_users)
+
+
+def evaluate(snapshot, conversations: dict, top_k: int, history_turns: int) -> dict:
+    rendered = RenderedContext.render(snapshot)
+    retriever = CatalogRetriever(snapshot.products)
+    full_tokens = rendered.approx_tokens
+
+    stats = {
+        'turns': 0, 'turns_with_products': 0, 'targets': 0, 'targets_hit': 0,
+        'all_hit': 0, 'full_tokens': 0, 'slice_tokens': 0,
+    }
+    for messages in conversations.values():
+        for i, msg in enumerate(messages[:-1]):
+            reply = messages[i + 1]
+            if msg['role'] != 'user' or reply['role'] != 'assistant':
+                continue
+            history = [m['content'] for m in messages[max(0, i - history_turns):i]]
+            selected = retriever.top_k(msg['content'], history, k=top_k)
+            slice_text = rendered.render_slice(snapshot.products, selected)
+
+            stats['turns'] += 1
+            stats['full_tokens'] += full_tokens
+            stats['slice_tokens'] += estimate_tokens(slice_text)
+
+            # Товари, які бот назвав у відповіді з повним каталогом
+            reply_norm = normalize(reply['content'])
+            targets = {
+                idx for idx, name in enumerate(retriever.norm_names)
+                if name and name in reply_norm
+            }
+            if not targets:
+                continue
+            hit = targets & set(selected)
+            stats['turns_with_products'] += 1
+            stats['targets'] += len(targets)
+            stats['targets_hit'] += len(hit)
+            stats['all_hit'] += int(hit == targets)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Оцінка вибірки релевантних товарів vs повний каталог")
+    parser.add_argument('--catalog', help="JSON з аркушами бази знань (інакше — жива таблиця)")
+    parser.add_argument('--conversations', help="JSONL з розмовами")
+    parser.add_argument('--from-db', action='store_true', help="Брати розмови з PostgreSQL")
+    parser.add_argument('--limit-users', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=8)
+    parser.add_argument('--history-turns', type=int, default=6)
+    args = parser.parse_args()
+
+    if not args.conversations and not args.from_db:
+        parser.error("вкажи --conversations або --from-db")
+
+    snapshot = load_snapshot(args.catalog)
+    conversations = load_conversations(args.conversations, args.limit_users)
+    stats = evaluate(snapshot, conversations, args.top_k, args.history_turns)
+
+    print("=" * 60)
+    print(f"  ВИБІРКА КАТАЛОГУ: top-{args.top_k}, історія {args.history_turns} повідомлень")
+    print("=" * 60)
+    print(f"Товарів у каталозі:         {len(snapshot.products)}")
+    print(f"Розмов:                     {len(conversations)}")
+    print(f"Повідомлень з відповіддю:   {stats['turns']}")
+    if not stats['turns']:
+        return
+    avg_full = stats['full_tokens'] / stats['turns']
+    avg_slice = stats['slice_tokens'] / stats['turns']
+    print(f"Каталог, токенів (~):       повний {avg_full:.0f} → вибірка {avg_slice:.0f} "
+          f"(-{100 * (1 - avg_slice / avg_full) if avg_full else 0:.1f}%)")
+    if stats['turns_with_products']:
+        recall = stats['targets_hit'] / stats['targets']
+        all_hit = stats['all_hit'] / stats['turns_with_products']
+        print(f"Відповідей з товарами:      {stats['turns_with_products']}")
+        print(f"Покриття товарів (recall):  {100 * recall:.1f}%")
+        print(f"Усі товари відповіді у вибірці: {100 * all_hit:.1f}%")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Офлайн-звіт класифікатора складності повідомлень (message_classifier.py) на записаних розмовах.
+
+Для кожного повідомлення клієнта, на яке бот відповів, визначає маршрут
+(template / small / full) так, як його визначив би бот (з історією до цього моменту), і рахує:
+- частку викликів Gemini, яких можна уникнути (шаблон) або перевести на малу модель
+- приблизну кількість вхідних токенів: системний промпт + каталог + історія розмови
+  (шаблон — 0, мала модель — системний промпт + історія без каталогу)
+
+Використання:
+    python scripts/eval_message_classifier.py --from-db
+    python scripts/eval_message_classifier.py --catalog kb.json --conversations convs.jsonl --samples 20
+
+    Формати kb.json / convs.jsonl — як у scripts/eval_catalog_slice.py
+"""
+import argparse
+import sys
+from collections import Counter
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from eval_catalog_slice import load_conversations, load_snapshot  # noqa: E402
+from knowledge_base import RenderedContext, estimate_tokens  # noqa: E402
+from message_classifier import classify  # noqa: E402
+from search_index import CatalogIndex  # noqa: E402
+
+PROMPTS_FILE = Path(__file__).resolve().parent.parent / 'prompts.yml'
+# Скільки повідомлень історії бот додає до запиту (AIAgent.generate_response)
+HISTORY_LIMIT = 30
+
+
+def evaluate(conversations: dict, system_tokens: int, catalog_tokens: int, templates: dict,
+             catalog: CatalogIndex = None) -> dict:
+    stats = {
+        'turns': 0, 'kinds': Counter(), 'reasons': Counter(), 'samples': {'template': Counter(), 'small': Counter()},
+        'tokens': Counter(),   # full — усе на повній моделі; template/small/full_left — за маршрутами
+    }
+    for messages in conversations.values():
+        for i, msg in enumerate(messages[:-1]):
+            reply = messages[i + 1]
+            if msg['role'] != 'user' or reply['role'] != 'assistant':
+                continue
+            history = messages[max(0, i + 1 - HISTORY_LIMIT):i + 1]
+            route = classify(msg['content'], 'text', history, catalog)
+            if route.kind == 'template' and not templates.get(route.template):
+                route = route._replace(kind='full', reason=f"no-template:{route.template}")
+
+            history_tokens = sum(estimate_tokens(m['content'] or '') for m in history)
+            full = system_tokens + catalog_tokens + history_tokens
+            stats['turns'] += 1
+            stats['kinds'][route.kind] += 1
+            stats['reasons'][f"{route.kind}:{route.reason}"] += 1
+            stats['tokens']['full'] += full
+            if route.kind == 'template':
+                stats['tokens']['template'] += full
+            elif route.kind == 'small':
+                stats['tokens']['small_moved'] += full
+                stats['tokens']['small'] += system_tokens + history_tokens
+            else:
+                stats['tokens']['full_left'] += full
+            if route.kind != 'full':
+                stats['samples'][route.kind][msg['content'].strip()[:60]] += 1
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Звіт класифікатора складності повідомлень")
+    parser.add_argument('--catalog', help="JSON з аркушами бази знань (інакше — жива таблиця)")
+    parser.add_argument('--conversations', help="JSONL з розмовами")
+    parser.add_argument('--from-db', action='store_true', help="Брати розмови з PostgreSQL")
+    parser.add_argument('--limit-users', type=int, default=200)
+    parser.add_argument('--samples', type=int, default=10, help="скільки найчастіших текстів показати")
+    args = parser.parse_args()
+
+    if not args.conversations and not args.from_db:
+        parser.error("вкажи --conversations або --from-db")
+
+    with open(PROMPTS_FILE, 'r', encoding='utf-8') as f:
+        prompts = yaml.safe_load(f)
+    snapshot = load_snapshot(args.catalog)
+    system_tokens = estimate_tokens(prompts.get('system_prompt', ''))
+    catalog_tokens = RenderedContext.render(snapshot).approx_tokens
+    conversations = load_conversations(args.conversations, args.limit_users)
+    stats = evaluate(conversations, system_tokens, catalog_tokens, prompts, CatalogIndex(snapshot.products))
+
+    turns = stats['turns']
+    print("=" * 60)
+    print("  КЛАСИФІКАТОР ПОВІДОМЛЕНЬ: шаблон / мала модель / повна модель")
+    print("=" * 60)
+    print(f"Розмов:                     {len(conversations)}")
+    print(f"Повідомлень з відповіддю:   {turns}")
+    if not turns:
+        return
+    print(f"Промпт, токенів (~):        системний {system_tokens} + каталог {catalog_tokens} + історія")
+    for kind in ('template', 'small', 'full'):
+        print(f"  {kind:<10} {stats['kinds'][kind]:>6}  ({100 * stats['kinds'][kind] / turns:.1f}%)")
+    print("Причини:")
+    for reason, count in stats['reasons'].most_common():
+        print(f"  {reason:<28} {count:>6}")
+
+    tokens = stats['tokens']
+    full = tokens['full'] or 1
+    print(f"Токенів на повній моделі (~): {tokens['full']}")
+    print(f"  шаблон (без AI):          -{tokens['template']} (-{100 * tokens['template'] / full:.1f}%)")
+    print(f"  мала модель:              -{tokens['small_moved']} (-{100 * tokens['small_moved'] / full:.1f}%), "
+          f"натомість {tokens['small']} на малій моделі")
+    print(f"  залишок на повній моделі: {tokens['full_left']} ({100 * tokens['full_left'] / full:.1f}%)")
+    for kind in ('template', 'small'):
+        if stats['samples'][kind]:
+            print(f"Найчастіші ({kind}):")
+            for text, count in stats['samples'][kind].most_common(args.samples):
+                print(f"  {count:>4} × {text}")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Локальна заміна Google Sheets / Drive для бенчмарків і регресійних перевірок
+(без credentials і мережі). Реалізує лише ту частину API, яку використовує
+GoogleSheetsManager:
+
+- Sheets (gspread): spreadsheet.id, worksheets(), worksheet(title), values_batch_get(ranges),
+  worksheet.col_values(n), worksheet.append_rows(rows), worksheet.get_all_values()
+- Drive v3: files().list(q="'<id>' in parents ...", pageSize, pageToken),
+  files().get(fileId, fields), files().get_media(fileId) (працює зі справжнім
+  MediaIoBaseDownload — з Range-запитами по шматках), changes().getStartPageToken/list
+
+Дані — з фікстури (див. scripts/google_fixtures.py):
+    <dir>/sheets.json  {"id", "version", "modifiedTime", "sheets": {назва: [[...], ...]}}
+    <dir>/drive.json   {"folders": {folder_id: [file, ...]}, "files": {file_id: {"size": N}}}
+Вміст файлів генерується детерміновано з file id (у фікстурі лише розмір).
+
+Використання (див. scripts/bench_catalog.py):
+    from fake_google import attach_fake
+    gs = GoogleSheetsManager()
+    attach_fake(gs, 'fixtures/synthetic-1000', latency=0.05)
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from pathlib import Path
+
+import httplib2
+from gspread.utils import a1_range_to_grid_range
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+_PARENT_RE = re.compile(r"'([^']+)' in parents")
+
+
+class Fixture:
+    """Дані фікстури в пам'яті + лічильники викликів API (для бенчмарків)."""
+
+    def __init__(self, sheets: dict, drive: dict = None, latency: float = 0.0):
+        self.spreadsheet_id = sheets.get('id', 'fake-spreadsheet')
+        self.version = int(sheets.get('version', 1))
+        self.modified_time = sheets.get('modifiedTime', '2024-01-01T00:00:00.000Z')
+        self.sheets = {title: [list(r) for r in rows] for title, rows in sheets['sheets'].items()}
+        drive = drive or {}
+        self.folders = drive.get('folders', {})
+        self.files = drive.get('files', {})
+        self.latency = latency
+        self.calls = {}
+        self.changes = []          # [(token, file_id, parents)]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, directory, latency: float = 0.0) -> 'Fixture':
+        directory = Path(directory)
+        sheets = json.loads((directory / 'sheets.json').read_text(encoding='utf-8'))
+        drive_path = directory / 'drive.json'
+        drive = json.loads(drive_path.read_text(encoding='utf-8')) if drive_path.exists() else {}
+        return cls(sheets, drive, latency)
+
+    def hit(self, name: str):
+        """Зарахувати виклик API і зімітувати мережеву затримку."""
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def touch(self):
+        """Позначити таблицю зміненою (нова версія файлу в Drive)."""
+        self.version += 1
+        self.modified_time = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+
+    def add_file(self, folder_id: str, name: str, size: int = 50_000) -> str:
+        """Додати файл у папку (з записом у changes feed)."""
+        file_id = hashlib.sha1(f"{folder_id}/{name}/{time.time()}".encode()).hexdigest()[:28]
+        self.folders.setdefault(folder_id, []).append({
+            'id': file_id, 'name': name, 'mimeType': 'image/jpeg',
+            'md5Checksum': hashlib.md5(file_id.encode()).hexdigest(),
+            'modifiedTime': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+        })
+        self.files[file_id] = {'size': size}
+        self.changes.append((len(self.changes) + 1, file_id, [folder_id]))
+        return file_id
+
+    def content(self, file_id: str) -> bytes:
+        """Детермінований вміст файлу (JPEG-заголовок + псевдовипадкові байти)."""
+        size = int(self.files.get(file_id, {}).get('size', 50_000))
+        seed = hashlib.sha256(file_id.encode()).digest()
+        body = (seed * (size // len(seed) + 1))[:max(size - 2, 0)]
+        return b'\xff\xd8' + body
+
+
+# ==================== SHEETS ====================
+
+class FakeWorksheet:
+    def __init__(self, fixture: Fixture, title: str):
+        self._fixture = fixture
+        self.title = title
+
+    def get_all_values(self) -> list:
+        self._fixture.hit('sheets.values.get')
+        return [list(r) for r in self._fixture.sheets[self.title]]
+
+    def col_values(self, col: int) -> list:
+        self._fixture.hit('sheets.values.get')
+        return [r[col - 1] for r in self._fixture.sheets[self.title] if len(r) >= col and r[col - 1]]
+
+    def append_row(self, row: list, **kwargs):
+        self.append_rows([row])
+
+    def append_rows(self, rows: list, **kwargs):
+        self._fixture.hit('sheets.values.append')
+        self._fixture.sheets[self.title].extend(list(r) for r in rows)
+        self._fixture.touch()
+
+
+class FakeSpreadsheet:
+    def __init__(self, fixture: Fixture):
+        self._fixture = fixture
+        self.id = fixture.spreadsheet_id
+
+    def worksheets(self) -> list:
+        self._fixture.hit('sheets.spreadsheets.get')
+        return [FakeWorksheet(self._fixture, t) for t in self._fixture.sheets]
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        import gspread
+        self._fixture.hit('sheets.spreadsheets.get')
+        if title not in self._fixture.sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return FakeWorksheet(self._fixture, title)
+
+    def values_batch_get(self, ranges: list, params: dict = None) -> dict:
+        """Як values:batchGet: порожні клітинки в кінці рядків і порожні рядки в кінці обрізані."""
+        self._fixture.hit('sheets.values.batchGet')
+        value_ranges = []
+        for rng in ranges:
+            title = rng.split('!')[0].strip("'").replace("''", "'")
+            rows = self._fixture.sheets[title]
+            if '!' in rng:
+                grid = a1_range_to_grid_range(rng.split('!', 1)[1])
+                rows = rows[grid.get('startRowIndex', 0):grid.get('endRowIndex')]
+            trimmed = [self._rstrip(r) for r in rows]
+            while trimmed and not trimmed[-1]:
+                trimmed.pop()
+            value_ranges.append({'range': rng, 'majorDimension': 'ROWS', 'values': trimmed})
+        return {'spreadsheetId': self.id, 'valueRanges': value_ranges}
+
+    @staticmethod
+    def _rstrip(row: list) -> list:
+        row = list(row)
+        while row and row[-1] in ('', None):
+            row.pop()
+        return row
+
+
+# ==================== DRIVE ====================
+
+class _Call:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self, **kwargs):
+        return self._fn()
+
+
+class _MediaHttp:
+    """httplib2.Http-сумісний об'єкт для MediaIoBaseDownload (Range-запити)."""
+
+    def __init__(self, fixture: Fixture, file_id: str):
+        self._fixture = fixture
+        self._file_id = file_id
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        self._fixture.hit('drive.files.get_media')
+        data = self._fixture.content(self._file_id)
+        start, end = 0, len(data) - 1
+        m = re.match(r'bytes=(\d+)-(\d+)', (headers or {}).get('range', ''))
+        if m:
+            start, end = int(m.group(1)), min(int(m.group(2)), len(data) - 1)
+        chunk = data[start:end + 1]
+        resp = httplib2.Response({
+            'status': 206,
+            'content-range': f"bytes {start}-{start + len(chunk) - 1}/{len(data)}",
+        })
+        return resp, chunk
+
+
+class _MediaRequest:
+    def __init__(self, fixture: Fixture, file_id: str):
+        self.uri = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
+        self.headers = {}
+        self.http = _MediaHttp(fixture, file_id)
+
+
+class _Files:
+    def __init__(self, fixture: Fixture):
+        self._fixture = fixture
+
+    def list(self, q: str = '', fields: str = None, orderBy: str = None, pageSize: int = 100,
+             pageToken: str = None, **kwargs) -> _Call:
+        def run():
+            self._fixture.hit('drive.files.list')
+            m = _PARENT_RE.search(q)
+            items = list(self._fixture.folders.get(m.group(1), [])) if m else []
+            if orderBy == 'name':
+                items.sort(key=lambda f: f['name'])
+            start = int(pageToken or 0)
+            result = {'files': items[start:start + pageSize]}
+            if start + pageSize < len(items):
+                result['nextPageToken'] = str(start + pageSize)
+            return result
+        return _Call(run)
+
+    def get(self, fileId: str, fields: str = None, **kwargs) -> _Call:
+        def run():
+            self._fixture.hit('drive.files.get')
+            if fileId == self._fixture.spreadsheet_id:
+                return {'version': str(self._fixture.version), 'modifiedTime': self._fixture.modified_time}
+            for files in self._fixture.folders.values():
+                for f in files:
+                    if f['id'] == fileId:
+                        return {k: v for k, v in f.items() if k in ('md5Checksum', 'modifiedTime', 'name')}
+            return {'md5Checksum': hashlib.md5(fileId.encode()).hexdigest()}
+        return _Call(run)
+
+    def get_media(self, fileId: str, **kwargs) -> _MediaRequest:
+        return _MediaRequest(self._fixture, fileId)
+
+
+class _Changes:
+    def __init__(self, fixture: Fixture):
+        self._fixture = fixture
+
+    def getStartPageToken(self, **kwargs) -> _Call:
+        return _Call(lambda: {'startPageToken': str(len(self._fixture.changes) + 1)})
+
+    def list(self, pageToken: str, pageSize: int = 100, **kwargs) -> _Call:
+        def run():
+            self._fixture.hit('drive.changes.list')
+            start = int(pageToken)
+            changes = [
+                {'fileId': file_id, 'removed': False, 'file': {'parents': parents}}
+                for token, file_id, parents in self._fixture.changes if token >= start
+            ]
+            return {'changes': changes, 'newStartPageToken': str(len(self._fixture.changes) + 1)}
+        return _Call(run)
+
+
+class FakeDriveService:
+    def __init__(self, fixture: Fixture):
+        self._fixture = fixture
+
+    def files(self) -> _Files:
+        return _Files(self._fixture)
+
+    def changes(self) -> _Changes:
+        return _Changes(self._fixture)
+
+
+def attach_fake(manager, fixture, latency: float = 0.0) -> Fixture:
+    """
+    Підключити GoogleSheetsManager до локальної фікстури замість Google
+    (замість connect()). fixture — Fixture або шлях до директорії фікстури.
+    """
+    if not isinstance(fixture, Fixture):
+        fixture = Fixture.load(fixture, latency=latency)
+    manager.spreadsheet = FakeSpreadsheet(fixture)
+    manager.drive_service = FakeDriveService(fixture)
+    manager._new_drive_service = lambda: FakeDriveService(fixture)
+    manager.drive_manifest._service_factory = manager._new_drive_service
+    return fixture
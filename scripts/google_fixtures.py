@@ -0,0 +1,288 @@
+"""
+Фікстури для локальної заміни Google Sheets / Drive (scripts/fake_google.py).
+
+generate — синтетичний каталог на N товарів (10–10 000) у форматі аркуша 'Каталог':
+    товар = рядок з назвою + 0–3 рядки-продовження (порожня назва, інші розміри/ціна/акція);
+    у кожного товару з Drive папкою — підпапки категорій з фото кольорів і 'Розмірна сітка'.
+    Плюс аркуші 'Шаблони', 'Логіка' (тригери) і 'Складні_питання' (FAQ).
+record — записати живу таблицю і Drive папки товарів у фікстуру (потрібні credentials).
+
+Використання:
+    python scripts/google_fixtures.py generate --products 1000 --out fixtures/synthetic-1000
+    python scripts/google_fixtures.py record --out fixtures/live
+
+Формат:
+    sheets.json  {"id", "version", "modifiedTime", "sheets": {назва: [[...], ...]}}
+    drive.json   {"folders": {folder_id: [{id, name, mimeType, md5Checksum, modifiedTime}]},
+                  "files": {file_id: {"size": байт}}}
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from knowledge_base import (  # noqa: E402
+    CATALOG_SHEET, QUESTIONS_SHEET, RULES_SHEET, TEMPLATES_SHEET,
+)
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+SPREADSHEET_ID = 'fake-spreadsheet'
+
+CATALOG_HEADERS = [
+    'Назва', 'ID Товара', 'Категорія', 'Куди носити', 'Матеріал', 'Опис товару', 'Кольори',
+    'Доступні розміри', 'Ціна', 'Акція - 15%', 'Супутні товари', 'Примітка', 'Фото',
+]
+
+_KINDS = (
+    ('Костюм', 'Костюми'), ('Худі', 'Худі'), ('Світшот', 'Світшоти'), ('Куртка', 'Верхній одяг'),
+    ('Жилет', 'Верхній одяг'), ('Штани', 'Штани'), ('Лосини', 'Штани'), ('Футболка', 'Футболки'),
+    ('Сукня', 'Сукні'), ('Комбінезон', 'Верхній одяг'), ('Піжама', 'Домашній одяг'),
+    ('Халат', 'Домашній одяг'),
+)
+_NAMES = (
+    'Харпер', 'Мілан', 'Аврора', 'Бостон', 'Вега', 'Дакота', 'Еліс', 'Зефір', 'Ірис', 'Капрі',
+    'Лайм', 'Марсель', 'Нова', 'Оскар', 'Полар', 'Ріо', 'Соло', 'Тіффані', 'Ультра', 'Фрея',
+    'Хвиля', 'Шарм', 'Юта', 'Ямайка', 'Базік', 'Вайб', 'Глорі', 'Денвер', 'Ельза', 'Жасмин',
+)
+_COLORS = (
+    'Чорний', 'Білий', 'Сірий', 'Меланж', 'Бежевий', 'Шоколадний', 'Пудра', 'Хакі', 'Олива',
+    'Бордо', 'Марсала', 'Електрик', 'Блакитний', 'Графіт', 'Лаванда', 'Мʼята', 'Капучино', 'Молочний',
+)
+_MATERIALS = ('Трикотаж тринитка', 'Футер двонитка', 'Кулир', 'Плащівка', 'Мікрофліс', 'Віскоза', 'Льон')
+_WHERE = ('Школа, прогулянки', 'Спорт, активний відпочинок', 'Дім', 'Прохолодна погода', 'На свято')
+_PHOTO_CATEGORIES = ('Дівчинка', 'Хлопчик', 'Підліток', 'Дорослі')
+# Розмірні блоки: дитячі (зріст) і дорослі (літерні) + ціна за блок
+_CHILD_SIZES = ('86-92', '98-104', '110-116', '122-128', '134-140', '146-152', '158-164', '170')
+_ADULT_SIZES = ('XS', 'S', 'M', 'L', 'XL', 'XXL', '3XL')
+
+_TEMPLATES = (
+    ('Привітання', 'Вітаю! Чим можу допомогти? 😊'),
+    ('Оплата', 'Оплата: накладений платіж або передплата на карту.'),
+    ('Доставка', 'Відправляємо Новою Поштою щодня до 17:00.'),
+    ('Обмін', 'Обмін і повернення — 14 днів, якщо товар не був у використанні.'),
+    ('Розмір', 'Напишіть, будь ласка, зріст і вік дитини — підберу розмір.'),
+)
+_RULE_WORDS = (
+    'повернення', 'обмін', 'знижка', 'передплата', 'накладений', 'брак', 'скарга', 'менеджер',
+    'оператор', 'опт', 'гурт', 'промокод', 'сертифікат', 'укрпошта', 'самовивіз', 'терміново',
+    'подарунок', 'відгук', 'фото', 'таблиця розмірів', 'доставка за кордон', 'розстрочка',
+)
+_FAQ_TOPICS = (
+    'чи можна оплатити карткою', 'скільки йде доставка', 'чи є самовивіз', 'чи можна обміняти розмір',
+    'чи маломірить', 'чи линяє тканина', 'як прати', 'чи є гуртові ціни', 'чи є подарункова упаковка',
+    'коли буде поповнення', 'чи можна примірити на пошті', 'чи відправляєте за кордон',
+)
+
+
+def _stable_id(*parts) -> str:
+    """Детермінований ID у стилі Google (літери/цифри/-/_)."""
+    digest = hashlib.sha1('/'.join(map(str, parts)).encode()).hexdigest()
+    return f"1{digest[:32]}"
+
+
+def _file_entry(file_id: str, name: str, mime: str = 'image/jpeg') -> dict:
+    entry = {'id': file_id, 'name': name, 'mimeType': mime, 'modifiedTime': '2024-01-01T00:00:00.000Z'}
+    if mime != FOLDER_MIME:
+        entry['md5Checksum'] = hashlib.md5(file_id.encode()).hexdigest()
+    return entry
+
+
+def _product_name(i: int) -> tuple:
+    kind, category = _KINDS[i % len(_KINDS)]
+    base = _NAMES[(i // len(_KINDS)) % len(_NAMES)]
+    series = i // (len(_KINDS) * len(_NAMES))
+    name = f'{kind} "{base}"' if series == 0 else f'{kind} "{base} {series + 1}"'
+    return name, category
+
+
+def _size_blocks(rnd: random.Random) -> list:
+    """1–4 розмірні блоки: [(розміри, ціна, акція)], ціна росте з розміром."""
+    if rnd.random() < 0.7:
+        sizes = list(_CHILD_SIZES)
+    else:
+        sizes = list(_ADULT_SIZES)
+    start = rnd.randint(0, len(sizes) - 2)
+    sizes = sizes[start:start + rnd.randint(2, len(sizes) - start)]
+    block_count = min(len(sizes), rnd.randint(1, 4))
+    cuts = sorted(rnd.sample(range(1, len(sizes)), block_count - 1)) if block_count > 1 else []
+    blocks = []
+    price = rnd.randrange(450, 1800, 50)
+    discount = rnd.choice(('15', '15', '', '0', '10', '20%'))
+    for lo, hi in zip([0] + cuts, cuts + [len(sizes)]):
+        blocks.append((', '.join(sizes[lo:hi]), f"{price} грн", discount))
+        price += rnd.randrange(50, 250, 50)
+    return blocks
+
+
+def generate_fixture(product_count: int, seed: int = 42, photo_share: float = 0.8) -> tuple:
+    """
+    Синтетичні дані для fake_google.Fixture.
+
+    Args:
+        product_count: кількість товарів у каталозі
+        seed: зерно генератора (той самий seed → той самий каталог)
+        photo_share: частка товарів з Drive папкою фото
+
+    Returns:
+        tuple: (sheets, drive) — словники у форматі sheets.json / drive.json
+    """
+    rnd = random.Random(seed)
+    catalog = [CATALOG_HEADERS]
+    folders, files = {}, {}
+    names = []
+
+    for i in range(product_count):
+        name, category = _product_name(i)
+        names.append(name)
+        colors = rnd.sample(_COLORS, rnd.randint(1, 5))
+        blocks = _size_blocks(rnd)
+
+        photo = ''
+        if rnd.random() < photo_share:
+            folder_id = _stable_id('folder', seed, i)
+            photo = f"https://drive.google.com/drive/folders/{folder_id}?usp=sharing"
+            folders[folder_id] = []
+            for cat in rnd.sample(_PHOTO_CATEGORIES, rnd.randint(1, 3)):
+                sub_id = _stable_id('sub', seed, i, cat)
+                folders[folder_id].append(_file_entry(sub_id, cat, FOLDER_MIME))
+                folders[sub_id] = []
+                for color in colors:
+                    file_id = _stable_id('file', seed, i, cat, color)
+                    folders[sub_id].append(_file_entry(file_id, f"{color}.jpg"))
+                    files[file_id] = {'size': rnd.randrange(40_000, 250_000)}
+            chart_id = _stable_id('chart', seed, i)
+            folders[folder_id].append(_file_entry(chart_id, 'Розмірна сітка', FOLDER_MIME))
+            chart_file = _stable_id('chart-file', seed, i)
+            folders[chart_id] = [_file_entry(chart_file, f"{category}.jpg")]
+            files[chart_file] = {'size': rnd.randrange(40_000, 120_000)}
+        elif rnd.random() < 0.5:
+            photo = f"https://drive.google.com/file/d/{_stable_id('direct', seed, i)}/view"
+
+        related = ', '.join(rnd.sample(names[:-1], min(i, rnd.randint(0, 2))))
+        first_sizes, first_price, discount = blocks[0]
+        catalog.append([
+            name, str(100000 + i), category, rnd.choice(_WHERE), rnd.choice(_MATERIALS),
+            f"{name} — {rnd.choice(_MATERIALS).lower()}, {rnd.choice(('вільний', 'класичний', 'оверсайз'))} крій",
+            ', '.join(colors), first_sizes, first_price, discount,
+            related, rnd.choice(('', '', 'Маломірить на пів розміру', 'Новинка')),
+            photo,
+        ])
+        # Рядки-продовження: лише розміри / ціна / акція
+        for sizes, price, block_discount in blocks[1:]:
+            row = [''] * len(CATALOG_HEADERS)
+            row[CATALOG_HEADERS.index('Доступні розміри')] = sizes
+            row[CATALOG_HEADERS.index('Ціна')] = price
+            row[CATALOG_HEADERS.index('Акція - 15%')] = block_discount
+            catalog.append(row)
+        if rnd.random() < 0.05:
+            catalog.append([''] * len(CATALOG_HEADERS))
+
+    rules = [['Ситуація', 'Тригери', 'Відповідь', 'Дія']]
+    for r in range(max(5, product_count // 50)):
+        words = rnd.sample(_RULE_WORDS, rnd.randint(1, 3))
+        suffix = f" {r}" if r >= len(_RULE_WORDS) else ''
+        rules.append([f"Ситуація {r + 1}", ', '.join(w + suffix for w in words),
+                      f"Відповідь на правило {r + 1}", rnd.choice(('', 'ескалація', 'фото'))])
+
+    questions = [['Питання', 'Відповідь', 'Користувач']]
+    for q in range(max(10, product_count // 5)):
+        topic = _FAQ_TOPICS[q % len(_FAQ_TOPICS)]
+        product = names[q % len(names)] if names else ''
+        answered = rnd.random() < 0.8
+        questions.append([f"{topic} {product.lower()}?", f"Відповідь {q + 1}" if answered else '', f"user{q}"])
+
+    sheets = {
+        'id': SPREADSHEET_ID,
+        'version': 1,
+        'modifiedTime': '2024-01-01T00:00:00.000Z',
+        'sheets': {
+            CATALOG_SHEET: catalog,
+            TEMPLATES_SHEET: [['Назва', 'Текст']] + [list(t) for t in _TEMPLATES],
+            RULES_SHEET: rules,
+            QUESTIONS_SHEET: questions,
+        },
+    }
+    return sheets, {'folders': folders, 'files': files}
+
+
+def write_fixture(out_dir, sheets: dict, drive: dict):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / 'sheets.json').write_text(json.dumps(sheets, ensure_ascii=False), encoding='utf-8')
+    (out_dir / 'drive.json').write_text(json.dumps(drive, ensure_ascii=False), encoding='utf-8')
+
+
+def record_fixture(out_dir):
+    """Записати живу таблицю + дерево Drive папок товарів (без вмісту файлів — лише розміри)."""
+    from google_sheets import GoogleSheetsManager
+
+    gs = GoogleSheetsManager()
+    if not gs.connect():
+        raise SystemExit("Не вдалося підключитися до Google Sheets")
+    sheets = gs._batch_get_sheets()
+    meta = gs.drive_service.files().get(
+        fileId=gs.spreadsheet.id, fields="version, modifiedTime", supportsAllDrives=True
+    ).execute()
+
+    folders, files = {}, {}
+    pending = list(gs.kb_cache.get().drive_folders.values())
+    while pending:
+        folder_id = pending.pop()
+        if folder_id in folders:
+            continue
+        folders[folder_id] = []
+        page_token = None
+        while True:
+            result = gs.drive_service.files().list(
+                q=f"'{folder_id}' in parents and trashed=false",
+                fields="nextPageToken, files(id, name, mimeType, md5Checksum, modifiedTime, size)",
+                pageSize=1000, pageToken=page_token,
+                supportsAllDrives=True, includeItemsFromAllDrives=True,
+            ).execute()
+            for f in result.get('files', []):
+                size = f.pop('size', None)
+                folders[folder_id].append(f)
+                if f['mimeType'] == FOLDER_MIME:
+                    pending.append(f['id'])
+                else:
+                    files[f['id']] = {'size': int(size or 0)}
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+
+    write_fixture(out_dir, {
+        'id': gs.spreadsheet.id,
+        'version': int(meta.get('version', 1)),
+        'modifiedTime': meta.get('modifiedTime', ''),
+        'sheets': sheets,
+    }, {'folders': folders, 'files': files})
+    print(f"Записано: {sum(len(v) for v in sheets.values())} рядків, {len(folders)} папок, "
+          f"{len(files)} файлів → {out_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Фікстури для локальної заміни Google Sheets / Drive")
+    sub = parser.add_subparsers(dest='command', required=True)
+    gen = sub.add_parser('generate', help="синтетичний каталог")
+    gen.add_argument('--products', type=int, default=1000)
+    gen.add_argument('--seed', type=int, default=42)
+    gen.add_argument('--out', required=True)
+    rec = sub.add_parser('record', help="записати живу таблицю")
+    rec.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        sheets, drive = generate_fixture(args.products, seed=args.seed)
+        write_fixture(args.out, sheets, drive)
+        print(f"Згенеровано: {args.products} товарів ({len(sheets['sheets'][CATALOG_SHEET]) - 1} рядків каталогу), "
+              f"{len(drive['folders'])} папок, {len(drive['files'])} файлів → {args.out}")
+    else:
+        record_fixture(args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Регресійні перевірки GeminiGateway без мережі (фейковий клієнт замість genai.Client).
+
+Використання:
+    python -m pytest scripts/test_gemini_gateway.py -q
+    python scripts/test_gemini_gateway.py
+"""
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.genai import errors as genai_errors  # noqa: E402
+
+from gemini_gateway import GeminiGateway, GeminiUnavailable  # noqa: E402
+
+
+def _quota_error() -> genai_errors.APIError:
+    return genai_errors.ClientError(429, {'error': {
+        'code': 429, 'status': 'RESOURCE_EXHAUSTED', 'message': 'quota exceeded',
+        'details': [{'retryDelay': '30s'}],
+    }})
+
+
+class _FakeModels:
+    def __init__(self, limited_models: tuple = ()):
+        self.calls = 0
+        self.limited_models = limited_models   # моделі, на які цей ключ відповідає 429
+
+    def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        if model in self.limited_models:
+            raise _quota_error()
+        return SimpleNamespace(text=f'ok:{model}', candidates=[], usage_metadata=None)
+
+
+def _gateway(keys: int = 1, limited: dict = None, fallback_models: list = None, **kwargs) -> tuple:
+    gateway = GeminiGateway(api_keys=[f'test-key-{i}' for i in range(keys)],
+                            fallback_models=fallback_models or [], **kwargs)
+    models = []
+    for i, slot in enumerate(gateway._slots):
+        models.append(_FakeModels((limited or {}).get(i, ())))
+        slot.client = SimpleNamespace(models=models[-1])
+    return (gateway, gateway._slots[0], models[0]) if keys == 1 else (gateway, gateway._slots, models)
+
+
+def _half_open(gateway: GeminiGateway):
+    breaker = gateway.breaker
+    breaker.failures = breaker.threshold
+    breaker.opened_at = time.monotonic() - breaker.cooldown - 1
+    assert breaker.state == 'half-open'
+
+
+def _assert_probe_released(gateway: GeminiGateway, models: _FakeModels):
+    assert gateway.breaker._probe is False
+    # API здоровий — наступний виклик проходить пробою і закриває breaker
+    assert gateway.generate('test', 'model', contents='привіт').text == 'ok:model'
+    assert models.calls == 1
+    assert gateway.breaker.state == 'closed'
+
+
+def test_probe_released_when_client_limit_rejects():
+    gateway, slot, models = _gateway(rpm=2)
+    _half_open(gateway)
+    slot.requests.reserve(slot.requests.capacity)   # RPM вичерпано — очікування поза бюджетом
+    try:
+        gateway.generate('test', 'model', contents='привіт', budget=0.5)
+        raise AssertionError("очікувався GeminiUnavailable")
+    except GeminiUnavailable:
+        pass
+    assert models.calls == 0
+    slot.requests.refund(slot.requests.capacity)
+    _assert_probe_released(gateway, models)
+
+
+def test_probe_released_when_all_routes_paused():
+    gateway, slot, models = _gateway()
+    _half_open(gateway)
+    slot.cooldown['model'] = time.monotonic() + 60
+    try:
+        gateway.generate('test', 'model', contents='привіт', budget=0.5)
+        raise AssertionError("очікувався GeminiUnavailable")
+    except GeminiUnavailable:
+        pass
+    slot.cooldown.clear()
+    _assert_probe_released(gateway, models)
+
+
+def test_probe_released_when_build_fails():
+    gateway, slot, models = _gateway()
+    _half_open(gateway)
+
+    def build(route):
+        raise ValueError("cached content недоступний")
+
+    try:
+        gateway.generate('test', 'model', build=build)
+        raise AssertionError("очікувався ValueError")
+    except ValueError:
+        pass
+    _assert_probe_released(gateway, models)
+
+
+def test_rate_limited_keys_move_to_next_key():
+    # Квота вичерпана на стількох ключах підряд, скільки збоїв відкриває breaker
+    threshold = GeminiGateway(api_keys=[]).breaker.threshold
+    gateway, slots, models = _gateway(keys=threshold + 1, limited={i: ('model',) for i in range(threshold)},
+                                      max_attempts=threshold + 1)
+    assert gateway.generate('test', 'model', contents='привіт', budget=1).text == 'ok:model'
+    assert [m.calls for m in models] == [1] * (threshold + 1)
+    assert gateway.breaker.state == 'closed'
+
+
+def test_rate_limited_model_moves_to_fallback_model():
+    threshold = GeminiGateway(api_keys=[]).breaker.threshold
+    gateway, slots, models = _gateway(keys=threshold, limited={i: ('model',) for i in range(threshold)},
+                                      fallback_models=['cheap'], max_attempts=threshold + 1)
+    assert gateway.generate('test', 'model', contents='привіт', budget=1).text == 'ok:cheap'
+    assert gateway.breaker.state == 'closed'
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✓ {name}")
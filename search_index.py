@@ -0,0 +1,539 @@
+"""
+Search Index - локальний пошук по базі знань (без мережі)
+- Нормалізація тексту та легкий стемінг для української
+- CatalogRetriever: оцінка релевантності товарів до розмови
+  (назви, категорії, кольори, розміри, товари вже згадані в розмові)
+- TriggerMatcher: автомат Ахо–Корасік по тригерах правил поведінки
+- FAQIndex: BM25 по збережених складних питаннях з порогом впевненості
+- CatalogIndex: пошук товару за назвою/категорією/розміром з ранжованими кандидатами
+Будується один раз на знімок бази знань.
+"""
+import math
+import os
+import re
+from collections import defaultdict, deque
+from typing import NamedTuple
+
+from knowledge_base import expand_sizes, product_name
+
+# Лапки/дужки/апострофи, які прибираємо перед порівнянням
+_QUOTES_RE = re.compile('["\'«»“”‘’`()\\[\\]{}]')
+_SPACES_RE = re.compile(r'\s+')
+_TOKEN_RE = re.compile(r"[0-9a-zа-яіїєґё]+")
+
+# Закінчення для легкого стемінгу (від довших до коротших)
+_ENDINGS = sorted((
+    'ами', 'ями', 'ові', 'еві', 'ого', 'ому', 'ими', 'іми', 'ій', 'ий', 'их', 'іх',
+    'ою', 'ею', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ів', 'ей', 'ая', 'яя', 'ої', 'ую', 'юю',
+    'а', 'я', 'о', 'е', 'у', 'ю', 'и', 'і', 'ї', 'ь',
+), key=len, reverse=True)
+_MIN_STEM = 3
+
+# Слова без змісту для пошуку товару
+_STOP_WORDS = {
+    'і', 'й', 'та', 'а', 'але', 'в', 'у', 'на', 'з', 'із', 'зі', 'до', 'по', 'для', 'про', 'що',
+    'як', 'це', 'чи', 'не', 'так', 'є', 'я', 'ви', 'ми', 'мені', 'вас', 'нас', 'вам', 'ще',
+    'можна', 'треба', 'буде', 'добрий', 'день', 'дякую', 'будь', 'ласка', 'привіт', 'вітаю',
+    'грн', 'шт', 'the', 'and',
+}
+
+
+def normalize(text: str) -> str:
+    """Нижній регістр, без лапок/дужок, стиснуті пробіли."""
+    text = _QUOTES_RE.sub(' ', (text or '').lower().replace('ё', 'е'))
+    return _SPACES_RE.sub(' ', text).strip()
+
+
+def stem(token: str) -> str:
+    """Легкий стемінг: прибрати типове закінчення (костюми → костюм, чорного → чорн)."""
+    if token.isdigit() or len(token) <= _MIN_STEM:
+        return token
+    for ending in _ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= _MIN_STEM:
+            return token[:-len(ending)]
+    return token
+
+
+def tokenize(text: str, stop_words: bool = True) -> list:
+    """Нормалізовані та простемлені токени тексту."""
+    tokens = _TOKEN_RE.findall(normalize(text))
+    if stop_words:
+        tokens = [t for t in tokens if t not in _STOP_WORDS]
+    return [stem(t) for t in tokens]
+
+
+def parse_sizes(text: str) -> frozenset:
+    """
+    Розміри з тексту як множина ключів knowledge_base.expand_sizes (та сама нормалізація,
+    що й таблиця цін товару). "110-112, M" → {'110', '111', '112', 'm'}
+    """
+    return frozenset(expand_sizes(text or ''))
+
+
+def product_size_text(product) -> str:
+    """Усі розміри товару одним рядком: 'Доступні розміри', 'Розміри' і рядки таблиці цін."""
+    return ' '.join(
+        [product.get('Доступні розміри', '') or '', product.get('Розміри', '') or ''] +
+        [pr.sizes for pr in product.get('prices_by_size', ())]
+    ).lower()
+
+
+class CatalogRetriever:
+    """
+    Оцінка релевантності товарів до поточного повідомлення + недавньої історії.
+    Вага поля × IDF токена: рідкісні слова (назва моделі) важать більше за часті (костюм).
+    """
+
+    # Вага збігу токена в полі товару
+    FIELD_WEIGHTS = (
+        (('Назва', 'Назва '), 3.0),
+        (('Категорія',), 1.5),
+        (('Кольори', 'Кольри'), 1.0),
+        (('Куди носити', 'Куди носити ', 'Матеріал', 'Опис товару'), 0.3),
+    )
+    FULL_NAME_BONUS = 6.0     # повна назва товару є в тексті
+    SIZE_WEIGHT = 0.5         # розмір з тексту є у товару
+    MENTIONED_BONUS = 4.0     # товар уже згадувався в розмові
+    HISTORY_DECAY = 0.6       # вага кожного попереднього повідомлення
+
+    def __init__(self, products):
+        self.products = products
+        self.names = [product_name(p) for p in products]
+        self.norm_names = [normalize(n) for n in self.names]
+        self._postings = defaultdict(dict)  # {токен: {idx: вага}}
+        self._sizes = []                    # [frozenset розмірів товару]
+
+        for idx, p in enumerate(products):
+            for fields, weight in self.FIELD_WEIGHTS:
+                for field in fields:
+                    for token in set(tokenize(p.get(field, ''))):
+                        postings = self._postings[token]
+                        postings[idx] = max(postings.get(idx, 0.0), weight)
+            self._sizes.append(parse_sizes(product_size_text(p)))
+
+        n = max(len(products), 1)
+        self._idf = {t: math.log(1 + n / len(post)) for t, post in self._postings.items()}
+
+    def _score_text(self, text: str, weight: float, scores: dict, mentioned_bonus: float = 0.0):
+        norm_text = normalize(text)
+        for token in set(tokenize(text)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = self._idf[token]
+            for idx, field_weight in postings.items():
+                scores[idx] += weight * field_weight * idf
+
+        for idx, norm_name in enumerate(self.norm_names):
+            if norm_name and norm_name in norm_text:
+                scores[idx] += weight * (self.FULL_NAME_BONUS + mentioned_bonus)
+
+        sizes = parse_sizes(text)
+        if sizes:
+            for idx, p_sizes in enumerate(self._sizes):
+                if sizes & p_sizes:
+                    scores[idx] += weight * self.SIZE_WEIGHT
+
+    def score(self, message: str, history: list = None) -> dict:
+        """
+        Оцінити товари.
+
+        Args:
+            message: поточне повідомлення клієнта
+            history: попередні повідомлення (тексти, від старих до нових)
+
+        Returns:
+            dict: {індекс_товару: оцінка} (лише > 0)
+        """
+        scores = defaultdict(float)
+        self._score_text(message or '', 1.0, scores)
+        weight = 1.0
+        for text in reversed(history or []):
+            weight *= self.HISTORY_DECAY
+            self._score_text(text or '', weight, scores, mentioned_bonus=self.MENTIONED_BONUS)
+        return {idx: s for idx, s in scores.items() if s > 0}
+
+    def top_k(self, message: str, history: list = None, k: int = 8) -> list:
+        """Індекси K найрелевантніших товарів (за спаданням оцінки)."""
+        scores = self.score(message, history)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [idx for idx, _ in ranked[:k]]
+
+
+class TriggerMatch(NamedTuple):
+    """Збіг тригера: індекс правила, тригер і його позиція в повідомленні."""
+    rule_index: int
+    trigger_index: int
+    trigger: str
+    start: int
+    end: int
+
+
+class TriggerMatcher:
+    """
+    Автомат Ахо–Корасік по тригерах правил поведінки.
+    Усі тригери всіх правил шукаються за один прохід по повідомленню
+    (замість перевірки `trigger in message` для кожного тригера кожного правила).
+    Семантика як у підрядкового пошуку: тригер може бути частиною слова.
+    """
+
+    # До стількох тригерів послідовний `in` (C-код) швидший за прохід автомата на Python
+    # (див. scripts/bench_triggers.py) — first() перевіряє їх напряму
+    SCAN_THRESHOLD = 200
+
+    def __init__(self, rules):
+        # rules: послідовність кортежів тригерів (у нижньому регістрі), по одному на правило
+        self._flat = [
+            (trigger, rule_index, trigger_index)
+            for rule_index, triggers in enumerate(rules)
+            for trigger_index, trigger in enumerate(triggers) if trigger
+        ]
+        self._goto = [{}]      # {символ: стан}
+        self._fail = [0]
+        self._output = [()]    # ((rule_index, trigger_index, довжина), ...)
+
+        for trigger, rule_index, trigger_index in self._flat:
+            self._add(trigger, (rule_index, trigger_index, len(trigger)))
+        self.trigger_count = len(self._flat)
+        self._build_links()
+
+    def _add(self, word: str, out: tuple):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = nxt
+        self._output[state] += (out,)
+
+    def _build_links(self):
+        # BFS: fail-посилання + успадковані виходи (коротші тригери-суфікси)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] += self._output[self._fail[nxt]]
+
+    def find_all(self, text: str) -> list:
+        """Усі збіги тригерів у тексті (у порядку позиції кінця збігу)."""
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = []
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                end = pos + 1
+                for rule_index, trigger_index, length in output[state]:
+                    matches.append((rule_index, trigger_index, end - length, end))
+        return [
+            TriggerMatch(r, t, text[start:end], start, end)
+            for r, t, start, end in matches
+        ]
+
+    def first(self, text: str):
+        """
+        Збіг з найвищим пріоритетом (перше правило, у ньому — перший тригер),
+        як при послідовній перевірці правил. None якщо збігів немає.
+        """
+        if self.trigger_count <= self.SCAN_THRESHOLD:
+            for trigger, rule_index, trigger_index in self._flat:
+                if trigger in text:
+                    start = text.find(trigger)
+                    return TriggerMatch(rule_index, trigger_index, trigger, start, start + len(trigger))
+            return None
+        matches = self.find_all(text)
+        if not matches:
+            return None
+        return min(matches, key=lambda m: (m.rule_index, m.trigger_index, m.start))
+
+
+class FAQMatch(NamedTuple):
+    """Знайдена готова відповідь: збережене питання, відповідь і впевненість (0..1)."""
+    question: str
+    answer: str
+    confidence: float
+
+
+class FAQIndex:
+    """
+    BM25 по нормалізованих простемлених токенах збережених питань (аркуш 'Складні_питання').
+    Впевненість = оцінка BM25 / оцінка питання самого з собою: яку частку «ваги»
+    збереженого питання покриває повідомлення клієнта. Нижче порогу — відповіді немає.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    # Мінімальна впевненість, з якою повертаємо готову відповідь
+    DEFAULT_THRESHOLD = float(os.getenv('FAQ_MATCH_THRESHOLD', '0.6'))
+
+    def __init__(self, questions: dict, threshold: float = None):
+        self.threshold = self.DEFAULT_THRESHOLD if threshold is None else threshold
+        self.questions = list(questions.keys())
+        self.answers = list(questions.values())
+        self._norm_questions = [normalize(q) for q in self.questions]
+        self._postings = defaultdict(list)   # {токен: [(idx, tf), ...]}
+        self._lengths = []
+
+        for idx, question in enumerate(self.questions):
+            tokens = tokenize(question)
+            self._lengths.append(len(tokens))
+            counts = defaultdict(int)
+            for token in tokens:
+                counts[token] += 1
+            for token, tf in counts.items():
+                self._postings[token].append((idx, tf))
+
+        n = max(len(self.questions), 1)
+        self._avg_length = (sum(self._lengths) / n) or 1.0
+        self._idf = {
+            t: math.log(1 + (n - len(post) + 0.5) / (len(post) + 0.5))
+            for t, post in self._postings.items()
+        }
+        # Оцінка питання самого з собою — знаменник впевненості
+        self._self_scores = [0.0] * len(self.questions)
+        for token, postings in self._postings.items():
+            for idx, tf in postings:
+                self._self_scores[idx] += self._term_score(token, idx, tf)
+
+    def _term_score(self, token: str, idx: int, tf: int) -> float:
+        norm = 1 - self.B + self.B * self._lengths[idx] / self._avg_length
+        return self._idf[token] * tf * (self.K1 + 1) / (tf + self.K1 * norm)
+
+    def search(self, text: str, limit: int = 3) -> list:
+        """Найкращі збіги (FAQMatch) за спаданням впевненості, без урахування порогу."""
+        scores = defaultdict(float)
+        for token in set(tokenize(text)):
+            for idx, tf in self._postings.get(token, ()):
+                scores[idx] += self._term_score(token, idx, tf)
+
+        # Збережене питання повністю міститься в повідомленні — максимальна впевненість
+        norm_text = normalize(text)
+        results = []
+        for idx, score in scores.items():
+            if self._norm_questions[idx] and self._norm_questions[idx] in norm_text:
+                confidence = 1.0
+            else:
+                confidence = min(score / self._self_scores[idx], 1.0) if self._self_scores[idx] else 0.0
+            results.append(FAQMatch(self.questions[idx], self.answers[idx], confidence))
+        results.sort(key=lambda m: -m.confidence)
+        return results[:limit]
+
+    def best(self, text: str):
+        """Найкращий збіг з впевненістю не нижче порогу або None."""
+        matches = self.search(text, limit=1)
+        if matches and matches[0].confidence >= self.threshold:
+            return matches[0]
+        return None
+
+
+class ProductMatch(NamedTuple):
+    """Кандидат пошуку товару: індекс у знімку, товар, оцінка і тип збігу."""
+    index: int
+    product: object
+    score: float
+    kind: str
+
+
+class CatalogIndex:
+    """
+    Індекс каталогу для пошуку товарів (будується один раз на знімок):
+    нормалізовані назви, токени назв (з IDF), категорії, розміри, триграми назв.
+    Повертає ранжовані кандидати замість першого збігу підрядка.
+    """
+
+    # Типи збігів назви (за спаданням сили) та їх базова оцінка
+    KIND_SCORES = {
+        'exact': 100.0,           # назва = запит
+        'name_in_query': 60.0,    # повна назва є в запиті (повідомленні)
+        'query_in_name': 40.0,    # запит — частина назви
+        'artikul': 35.0,          # запит — частина артикула
+        'category': 15.0,         # запит — частина категорії
+    }
+    NAME_KINDS = ('exact', 'name_in_query', 'query_in_name')
+    TOKEN_WEIGHT = 4.0       # × IDF за кожен спільний токен назви
+    NGRAM_SIZE = 3
+    NGRAM_MIN_WORD = 4           # коротші слова не шукаємо нечітко
+    NGRAM_MIN_SIMILARITY = 0.35  # схожість Жаккара триграм слова запиту і слова назви
+    NGRAM_WEIGHT = 2.0
+
+    def __init__(self, products):
+        self.products = products
+        self.names = [product_name(p) for p in products]
+        self.norm_names = [normalize(n) for n in self.names]
+        self._artikuls = [normalize(p.get('Артикул', '')) for p in products]
+        self._name_tokens = defaultdict(set)    # {токен назви: {idx}}
+        self._words = []                        # [(слово назви, idx)] — для нечіткого збігу
+        self._ngrams = defaultdict(set)         # {триграма: {номер слова в _words}}
+        self._ngram_counts = []                 # кількість триграм кожного слова
+        # Триграми повних назв / артикулів (з пробілами) — кандидати для "запит — частина назви"
+        self._name_substrings = defaultdict(set)     # {триграма: {idx}}
+        self._artikul_substrings = defaultdict(set)  # {триграма: {idx}}
+        self._categories = defaultdict(list)    # {категорія: [idx]}
+        self._sizes = defaultdict(set)          # {'110' / 'm': {idx}} — ключі expand_sizes
+        self._size_texts = []
+
+        for idx, p in enumerate(products):
+            for token in set(tokenize(self.names[idx])):
+                self._name_tokens[token].add(idx)
+            for word in set(_TOKEN_RE.findall(self.norm_names[idx])):
+                if len(word) >= self.NGRAM_MIN_WORD:
+                    grams = self._grams(word)
+                    for gram in grams:
+                        self._ngrams[gram].add(len(self._words))
+                    self._words.append((word, idx))
+                    self._ngram_counts.append(len(grams))
+            for gram in self._substring_grams(self.norm_names[idx]):
+                self._name_substrings[gram].add(idx)
+            for gram in self._substring_grams(self._artikuls[idx]):
+                self._artikul_substrings[gram].add(idx)
+
+            category = normalize(p.get('Категорія', ''))
+            if category:
+                self._categories[category].append(idx)
+
+            size_text = product_size_text(p)
+            self._size_texts.append(size_text)
+            for size in parse_sizes(size_text):
+                self._sizes[size].add(idx)
+
+        n = max(len(products), 1)
+        self._idf = {t: math.log(1 + n / len(ids)) for t, ids in self._name_tokens.items()}
+        self._name_matcher = TriggerMatcher([(name,) for name in self.norm_names])
+        self._max_name_length = max(
+            [len(x) for x in self.norm_names + self._artikuls] or [0]
+        )
+
+    def _grams(self, text: str) -> set:
+        text = f" {text} "
+        size = self.NGRAM_SIZE
+        return {text[i:i + size] for i in range(len(text) - size + 1)} if text.strip() else set()
+
+    def _substring_grams(self, text: str) -> set:
+        size = self.NGRAM_SIZE
+        return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+    def _substring_candidates(self, index: dict, query: str) -> set:
+        """Товари, що містять усі триграми запиту (надмножина тих, де запит — підрядок)."""
+        grams = sorted((index.get(g, frozenset()) for g in self._substring_grams(query)), key=len)
+        if not grams or not grams[0]:
+            return set()
+        candidates = set(grams[0])
+        for ids in grams[1:]:
+            candidates &= ids
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, query: str, limit: int = 5) -> list:
+        """
+        Ранжовані кандидати (ProductMatch) для запиту або повідомлення клієнта.
+        Сильніші збіги (точна назва, назва в запиті) завжди вище за часткові
+        (спільні слова назви, схожість триграм).
+        """
+        norm_query = normalize(query)
+        if not norm_query:
+            return []
+        scores = defaultdict(float)
+        kinds = {}
+
+        def hit(idx, kind, score):
+            if score > scores[idx]:
+                scores[idx] = score
+                kinds[idx] = kind
+
+        # Повні назви в запиті — один прохід автомата по запиту
+        for match in self._name_matcher.find_all(norm_query):
+            idx = match.rule_index
+            if len(self.norm_names[idx]) == len(norm_query):
+                hit(idx, 'exact', self.KIND_SCORES['exact'])
+            else:
+                # Довша назва в запиті — точніший збіг ("костюм харпер" vs "костюм")
+                hit(idx, 'name_in_query', self.KIND_SCORES['name_in_query'] + len(match.trigger) / 10)
+
+        # Запит — частина назви/артикула (лише якщо запит не довший за найдовшу назву):
+        # кандидати — з індексу триграм, підрядок перевіряється лише для них.
+        # Запити коротші за триграму не ідентифікують товар — пропускаємо
+        if self.NGRAM_SIZE <= len(norm_query) <= self._max_name_length:
+            for idx in sorted(self._substring_candidates(self._name_substrings, norm_query)):
+                name = self.norm_names[idx]
+                if idx not in kinds and norm_query in name:
+                    hit(idx, 'query_in_name', self.KIND_SCORES['query_in_name'] + len(norm_query) / len(name))
+            for idx in sorted(self._substring_candidates(self._artikul_substrings, norm_query)):
+                if idx not in kinds and norm_query in self._artikuls[idx]:
+                    hit(idx, 'artikul', self.KIND_SCORES['artikul'])
+
+        for category, ids in self._categories.items():
+            if norm_query in category:
+                for idx in ids:
+                    hit(idx, 'category', self.KIND_SCORES['category'])
+
+        # Спільні слова назви (рідкісні слова — модель товару — важать більше)
+        token_scores = defaultdict(float)
+        for token in set(tokenize(norm_query)):
+            for idx in self._name_tokens.get(token, ()):
+                token_scores[idx] += self.TOKEN_WEIGHT * self._idf[token]
+        for idx, score in token_scores.items():
+            if idx in kinds:
+                scores[idx] += score / 10
+            else:
+                hit(idx, 'tokens', score)
+
+        # Часткові збіги / одруківки: схожість триграм слів запиту і слів назви
+        for word in set(_TOKEN_RE.findall(norm_query)):
+            if len(word) < self.NGRAM_MIN_WORD or stem(word) in self._idf:
+                continue
+            query_grams = self._grams(word)
+            overlap = defaultdict(int)
+            for gram in query_grams:
+                for word_id in self._ngrams.get(gram, ()):
+                    overlap[word_id] += 1
+            for word_id, common in overlap.items():
+                idx = self._words[word_id][1]
+                if idx in kinds:
+                    continue
+                similarity = common / (len(query_grams) + self._ngram_counts[word_id] - common)
+                if similarity >= self.NGRAM_MIN_SIMILARITY:
+                    hit(idx, 'ngram', self.NGRAM_WEIGHT * similarity)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [ProductMatch(idx, self.products[idx], score, kinds[idx]) for idx, score in ranked]
+
+    def best(self, query: str, kinds: tuple = None):
+        """Найкращий кандидат (опційно — лише заданих типів збігу) або None."""
+        for match in self.search(query, limit=len(self.products)):
+            if kinds is None or match.kind in kinds:
+                return match
+        return None
+
+    def by_category(self, category: str) -> list:
+        """Товари, категорія яких містить запит (точна категорія — першою), у порядку каталогу."""
+        norm_category = normalize(category)
+        exact = self._categories.get(norm_category, [])
+        partial = sorted(
+            idx for name, ids in self._categories.items()
+            if norm_category in name and name != norm_category for idx in ids
+        )
+        return [self.products[idx] for idx in exact + partial]
+
+    def by_size(self, size: str) -> list:
+        """Товари з розміром (число, літера або діапазон; діапазони товарів розгорнуті при побудові)."""
+        sizes = parse_sizes(size)
+        if not sizes:
+            query = (size or '').lower().strip()
+            ids = {idx for idx, text in enumerate(self._size_texts) if query and query in text}
+        else:
+            ids = set()
+            for key in sizes:
+                ids |= self._sizes.get(key, set())
+        return [self.products[idx] for idx in sorted(ids)]
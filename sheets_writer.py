@@ -0,0 +1,196 @@
+"""
+Sheets Writer - відкладений (write-behind) запис нових питань у 'Складні_питання'
+Обробка чату лише ставить питання в чергу і не чекає на Google Sheets:
+
+- Дедуплікація по локальній множині нормалізованих питань
+  (колонка A читається з таблиці один раз, далі — лише локально)
+- Питання накопичуються і записуються одним append_rows:
+  раз на QUESTIONS_FLUSH_INTERVAL секунд або при QUESTIONS_FLUSH_BATCH питаннях
+- Черга зберігається на диск (data/pending_questions.json) — рестарт не губить питання
+"""
+import os
+import json
+import re
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Callable
+
+from atomic_write import write_json
+
+logger = logging.getLogger(__name__)
+
+PENDING_FILE = Path(os.getenv(
+    'QUESTIONS_PENDING_FILE', str(Path(__file__).parent / 'data' / 'pending_questions.json')
+))
+FLUSH_INTERVAL = float(os.getenv('QUESTIONS_FLUSH_INTERVAL', '30'))
+FLUSH_BATCH = int(os.getenv('QUESTIONS_FLUSH_BATCH', '20'))
+# Пауза перед повторною спробою прочитати колонку A після помилки
+SEED_RETRY = 60.0
+
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_question(question: str) -> str:
+    """Ключ дедуплікації: нижній регістр, стиснуті пробіли."""
+    return _SPACES_RE.sub(' ', (question or '').strip().lower())
+
+
+class QuestionWriteQueue:
+    """
+    Черга нових питань з фоновим записом у таблицю.
+
+    load_existing — функція що повертає вже збережені питання (колонка A), викликається один раз.
+    append_rows   — функція що дописує рядки [[питання, '', username], ...] однією операцією.
+    Обидві кидають виняток при помилці (тоді — повтор пізніше).
+    """
+
+    def __init__(self, load_existing: Callable[[], list], append_rows: Callable[[list], None],
+                 pending_file: Path = None, flush_interval: float = None, batch_size: int = None):
+        self._load_existing = load_existing
+        self._append_rows = append_rows
+        self.pending_file = Path(pending_file or PENDING_FILE)
+        self.flush_interval = FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.batch_size = batch_size or FLUSH_BATCH
+        self._seen: set = set()          # нормалізовані питання (таблиця + черга)
+        self._seeded = False
+        self._seed_after = 0.0
+        self._pending: list = []         # [{'question', 'username', 'queued_at'}]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+        self._load_pending()
+
+    # ==================== ЧЕРГА ====================
+
+    def enqueue(self, question: str, username: str = "") -> bool:
+        """
+        Поставити питання в чергу на запис (миттєво, без мережі).
+
+        Returns:
+            bool: True — додано в чергу, False — дублікат або порожнє
+        """
+        question = (question or '').strip()
+        key = normalize_question(question)
+        if not key:
+            return False
+        with self._lock:
+            if key in self._seen:
+                logger.info(f"Питання вже є в Складні_питання: '{question[:60]}'")
+                return False
+            self._seen.add(key)
+            self._pending.append({'question': question, 'username': username, 'queued_at': time.time()})
+            pending = len(self._pending)
+            self._save_pending()
+        logger.info(f"Питання в черзі на запис у Складні_питання: '{question[:60]}' (від {username}, у черзі {pending})")
+        if pending >= self.batch_size:
+            self._wake_event.set()
+        return True
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    # ==================== ЗАПИС ====================
+
+    def flush(self) -> int:
+        """Записати накопичені питання одним append_rows. Повертає кількість записаних."""
+        with self._flush_lock:
+            if not self._seed():
+                return 0
+            with self._lock:
+                batch = list(self._pending)
+            if not batch:
+                return 0
+            rows = [[item['question'], "", item['username']] for item in batch]
+            try:
+                self._append_rows(rows)
+            except Exception as e:
+                logger.warning(f"Помилка збереження питань ({len(rows)} у черзі): {e}")
+                return 0
+            with self._lock:
+                self._pending = self._pending[len(batch):]
+                self._save_pending()
+            logger.info(f"Збережено {len(rows)} нових питань в Складні_питання")
+            return len(rows)
+
+    def _seed(self) -> bool:
+        """Один раз прочитати колонку A; дублікати, що вже в таблиці, прибрати з черги."""
+        if self._seeded:
+            return True
+        if time.monotonic() < self._seed_after:
+            return False
+        try:
+            existing = self._load_existing()
+        except Exception as e:
+            logger.warning(f"Не вдалося прочитати Складні_питання для дедуплікації: {e}")
+            self._seed_after = time.monotonic() + SEED_RETRY
+            return False
+        existing_keys = {normalize_question(q) for q in existing if q}
+        with self._lock:
+            before = len(self._pending)
+            self._pending = [
+                item for item in self._pending
+                if normalize_question(item['question']) not in existing_keys
+            ]
+            self._seen |= existing_keys
+            if len(self._pending) != before:
+                self._save_pending()
+        self._seeded = True
+        logger.info(f"Складні_питання: {len(existing_keys)} питань для дедуплікації")
+        return True
+
+    # ==================== ДИСК ====================
+
+    def _load_pending(self):
+        try:
+            with open(self.pending_file, 'r', encoding='utf-8') as f:
+                self._pending = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Черга питань {self.pending_file} не завантажена: {e}")
+            return
+        self._seen |= {normalize_question(item['question']) for item in self._pending}
+        if self._pending:
+            logger.info(f"Черга питань: {len(self._pending)} незбережених з минулого запуску")
+
+    def _save_pending(self):
+        """Записати чергу на диск (викликається під self._lock)."""
+        try:
+            write_json(self.pending_file, self._pending)
+        except Exception as e:
+            logger.warning(f"Черга питань не збережена на диск: {e}")
+
+    # ==================== ФОНОВИЙ ПОТІК ====================
+
+    def start(self):
+        """Запустити daemon-потік запису."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='questions-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Зупинити потік, спробувавши записати залишок черги."""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(timeout=self.flush_interval)
+            self._wake_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Черга питань: помилка запису: {e}")
+        try:
+            self.flush()
+        except Exception:
+            pass